@@ -0,0 +1,82 @@
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from lc_io import load_many, load_text
+
+
+def write_files(directory, n_rows, seed=0):
+    """
+    Write one file of n_rows in each on-disk format of the pipeline:
+    raw (whitespace, flux in column 2), processed (STEP1 CSV, header "0,1")
+    and concatenated (STEP2 CSV, header "TIME,FLUX", %.10f).
+    """
+    rng = np.random.default_rng(seed)
+    t = 1325.0 + np.arange(n_rows) * 120 / 86400
+    f = 1 + 1e-4 * rng.normal(size=n_rows)
+    f[rng.random(n_rows) < 0.001] = np.nan
+
+    raw = os.path.join(directory, f"raw_{n_rows}.txt")
+    np.savetxt(raw, np.column_stack([t, np.ones_like(t), f * 1e4, np.ones_like(t)]))
+
+    processed = os.path.join(directory, f"processed_{n_rows}.txt")
+    pd.DataFrame(np.column_stack([t, f])).to_csv(processed, index=False)
+
+    concatenated = os.path.join(directory, f"concatenated_{n_rows}.txt")
+    np.savetxt(concatenated, np.column_stack([t, np.nan_to_num(f, nan=1.0)]), fmt="%.10f",
+               delimiter=",", header="TIME,FLUX", comments="")
+    return raw, processed, concatenated
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare lc_io.load_text with the readers STEP1-STEP3 used before.")
+    parser.add_argument("--sizes", type=str, default="10000,100000,2000000", help="Comma-separated row counts. Default is 10000,100000,2000000.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per measurement (best is reported). Default is 3.")
+    parser.add_argument("--n_files", type=int, default=16, help="Files read by the load_many comparison. Default is 16.")
+    args = parser.parse_args()
+
+    print(f"{'rows':>9s} {'format':>13s} {'old reader':>24s} {'old s':>8s} {'load_text s':>12s} {'speedup':>8s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in (int(s) for s in args.sizes.split(',')):
+            raw, processed, concatenated = write_files(tmp, n_rows)
+            cases = [
+                ('raw', "pd.read_csv(sep='\\s+')",
+                 lambda: pd.read_csv(raw, header=None, usecols=[0, 2], sep='\\s+'),
+                 lambda: load_text(raw, flux_col=2)),
+                ('processed', 'np.genfromtxt',
+                 lambda: np.genfromtxt(processed, delimiter=',', skip_header=1),
+                 lambda: load_text(processed, delimiter=',', header=True)),
+                ('concatenated', 'np.loadtxt',
+                 lambda: np.loadtxt(concatenated, delimiter=',', skiprows=1),
+                 lambda: load_text(concatenated, delimiter=',', header=True)),
+            ]
+            for name, old_name, old, new in cases:
+                t_old = best_of(old, args.repeat)
+                t_new = best_of(new, args.repeat)
+                print(f"{n_rows:9d} {name:>13s} {old_name:>24s} {t_old:8.3f} {t_new:12.3f} {t_old / t_new:7.1f}x")
+
+            paths = [concatenated] * args.n_files
+            t_serial = best_of(lambda: load_many(paths, n_threads=1, delimiter=',', header=True), args.repeat)
+            t_threads = best_of(lambda: load_many(paths, n_threads=4, delimiter=',', header=True), args.repeat)
+            print(f"{n_rows:9d} {'load_many':>13s} {f'{args.n_files} files, 1 thread':>24s} {t_serial:8.3f} "
+                  f"{t_threads:12.3f} {t_serial / t_threads:7.1f}x  (4 threads)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import STEP2_group_and_concatenate_and_fix_gaps as step2
+from catalog import Catalog
+from STEP1_process_lightcurves import batch_process_lightcurves, process_lightcurve
+from STEP2_group_and_concatenate_and_fix_gaps import concatenate_and_fix_gaps, find_groups
+from STEP3_save_psd import batch_psd, psd
+from run_pipeline import run_pipeline
+from synthetic import make_dataset, write_star
+
+# End-to-end benchmark on synthetic TESS/K2 data.
+#
+# Stage cases time process_lightcurve, concatenate_and_fix_gaps and psd on one
+# star of the given cadence and number of sectors. Batch cases time the STEP1,
+# STEP2 and STEP3 batch drivers and the fused run_pipeline on datasets of
+# n_stars stars. Results go to a JSON file; --compare flags regressions
+# between two such files.
+
+STAGE_PARAMS = {'time_col': 0, 'flux_col': 2, 'gap_threshold': 1.5 / 24, 'sigma_clip': 4, 'filter_window': 10}
+
+
+def timed(fn, repeat=1):
+    """Best wall time of fn() over repeat runs, with its output silenced."""
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def count_points(paths):
+    return sum(sum(1 for _ in open(p)) for p in paths)
+
+
+def run_stage_case(workdir, cadence, n_sectors, repeat=1, seed=0):
+    """Time the three per-star stages on one star. Returns a list of result dicts."""
+    raw_dir, processed_dir, concatenated_dir = (os.path.join(workdir, d) for d in ('raw', 'processed', 'concatenated'))
+    for d in (raw_dir, processed_dir, concatenated_dir):
+        os.makedirs(d, exist_ok=True)
+
+    # Consecutive sectors, plus one far away so that STEP2 has a gap to close
+    numbers = list(range(1, n_sectors)) + [40] if n_sectors > 1 else [1]
+    raw_paths = write_star(raw_dir, 0, cadence, 'TESS', numbers, seed=seed)
+    case = f"{cadence}x{n_sectors}"
+    n_points = count_points(raw_paths)
+    results = []
+
+    processed = []
+
+    def stage1():
+        processed[:] = [process_lightcurve(fp, processed_dir, **STAGE_PARAMS) for fp in raw_paths]
+
+    results.append({'benchmark': 'stage/process_lightcurve', 'case': case, 'n_points': n_points,
+                    'seconds': timed(stage1, repeat)})
+
+    concatenated = os.path.join(concatenated_dir, 'star.txt')
+
+    def stage2():
+        step2.save_concatenated(concatenated, concatenate_and_fix_gaps(sorted(processed)))
+
+    results.append({'benchmark': 'stage/concatenate_and_fix_gaps', 'case': case, 'n_points': n_points,
+                    'seconds': timed(stage2, repeat)})
+
+    results.append({'benchmark': 'stage/psd', 'case': case, 'n_points': n_points,
+                    'seconds': timed(lambda: psd('star.txt', concatenated_dir, cadence, ''), repeat)})
+    return results
+
+
+def run_batch_case(workdir, n_stars, n_jobs=4, executor='process', repeat=1, seed=0):
+    """Time the batch drivers on a dataset of n_stars stars. Returns a list of result dicts."""
+    dirs = {d: os.path.join(workdir, d) for d in ('raw', 'processed', 'concatenated', 'psd', 'fused')}
+    for d in dirs.values():
+        os.makedirs(d, exist_ok=True)
+
+    stars = make_dataset(dirs['raw'], n_stars, seed=seed)
+    n_points = count_points([p for star in stars.values() for p in star[3]])
+    case = f"{n_stars} stars"
+    results = []
+
+    def add(name, fn):
+        results.append({'benchmark': name, 'case': case, 'n_stars': n_stars, 'n_points': n_points,
+                        'seconds': timed(fn, repeat)})
+
+    add('batch/STEP1', lambda: batch_process_lightcurves(dirs['raw'], dirs['processed'], n_jobs=n_jobs,
+                                                         executor=executor, **STAGE_PARAMS))
+    add('batch/STEP2', lambda: step2.main(directory=dirs['processed'], new_directory=dirs['concatenated'],
+                                          n_jobs=n_jobs, executor=executor))
+
+    with Catalog(os.path.join(workdir, 'catalog.sqlite')) as catalog:
+        catalog.update(dirs['concatenated'])
+        jobs = catalog.psd_jobs(dirs['concatenated'])
+    add('batch/STEP3', lambda: batch_psd(jobs, dirs['concatenated'], dirs['psd'], n_jobs=n_jobs, executor=executor))
+
+    add('batch/run_pipeline', lambda: run_pipeline(dirs['raw'], dirs['fused'], n_jobs=n_jobs, executor=executor,
+                                                   overwrite=True))
+    n_groups = len(find_groups(dirs['raw']))
+    for r in results:
+        r['n_groups'] = n_groups
+    return results
+
+
+def environment():
+    """Machine and library versions recorded with the results."""
+    import astropy
+    import pandas
+
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pandas.__version__,
+        'astropy': astropy.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(old_path, new_path, threshold=0.2, min_seconds=0.05):
+    """
+    Print old vs new timings of two result files and flag regressions: cases
+    more than threshold (relative) and min_seconds (absolute) slower.
+
+    Returns:
+        list: (benchmark, case, old seconds, new seconds) of the regressions.
+    """
+    with open(old_path) as fh:
+        old = json.load(fh)
+    with open(new_path) as fh:
+        new = json.load(fh)
+    old_results = {(r['benchmark'], r['case']): r['seconds'] for r in old['results']}
+
+    regressions = []
+    print(f"{'benchmark':>32s} {'case':>10s} {'old s':>9s} {'new s':>9s} {'ratio':>7s}")
+    for r in new['results']:
+        key = (r['benchmark'], r['case'])
+        if key not in old_results:
+            print(f"{key[0]:>32s} {key[1]:>10s} {'-':>9s} {r['seconds']:9.3f}       -  (new)")
+            continue
+        t_old, t_new = old_results[key], r['seconds']
+        ratio = t_new / t_old if t_old > 0 else float('inf')
+        flag = ''
+        if ratio > 1 + threshold and t_new - t_old > min_seconds:
+            regressions.append((key[0], key[1], t_old, t_new))
+            flag = '  REGRESSION'
+        elif ratio < 1 / (1 + threshold) and t_old - t_new > min_seconds:
+            flag = '  faster'
+        print(f"{key[0]:>32s} {key[1]:>10s} {t_old:9.3f} {t_new:9.3f} {ratio:6.2f}x{flag}")
+
+    if old.get('environment') != new.get('environment'):
+        print("Note: the two runs were made in different environments:")
+        for k in sorted(set(old.get('environment', {})) | set(new.get('environment', {}))):
+            a, b = old.get('environment', {}).get(k), new.get('environment', {}).get(k)
+            if a != b and k != 'date':
+                print(f"  {k}: {a} -> {b}")
+    print(f"{len(regressions)} regression(s) above {threshold:.0%}")
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Time the pipeline stages and batch drivers on synthetic TESS/K2 lightcurves.")
+    parser.add_argument("--stage_cases", type=str, default="1800x1,1800x4,120x1,120x4,20x1",
+                        help="Comma-separated cadence x n_sectors cases for the per-star stages. Default is 1800x1,1800x4,120x1,120x4,20x1.")
+    parser.add_argument("--n_stars", type=str, default="8,32", help="Comma-separated dataset sizes for the batch drivers. Default is 8,32.")
+    parser.add_argument("--n_jobs", type=int, default=4, help="Workers of the batch drivers. Default is 4.")
+    parser.add_argument("--executor", choices=["thread", "process", "serial"], default="process", help="Executor of the batch drivers. Default is 'process'.")
+    parser.add_argument("--repeat", type=int, default=1, help="Repetitions per measurement (best is reported). Default is 1.")
+    parser.add_argument("--output", type=str, default="bench_pipeline.json", help="JSON result file. Default is bench_pipeline.json.")
+    parser.add_argument("--workdir", type=str, default=None, help="Keep the synthetic data in this directory. Default is a temporary directory.")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), default=None, help="Compare two result files instead of running.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown flagged as a regression by --compare. Default is 0.2.")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, threshold=args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench_pipeline_')
+    results = []
+    try:
+        for i, case in enumerate(c for c in args.stage_cases.split(',') if c):
+            cadence, n_sectors = (int(x) for x in case.split('x'))
+            case_dir = os.path.join(workdir, f"stage_{case}")
+            rows = run_stage_case(case_dir, cadence, n_sectors, repeat=args.repeat, seed=i)
+            for r in rows:
+                print(f"{r['benchmark']:>32s} {r['case']:>10s} {r['n_points']:9d} points {r['seconds']:9.3f} s")
+            results.extend(rows)
+
+        for n_stars in (int(n) for n in args.n_stars.split(',') if n):
+            case_dir = os.path.join(workdir, f"batch_{n_stars}")
+            rows = run_batch_case(case_dir, n_stars, n_jobs=args.n_jobs, executor=args.executor, repeat=args.repeat)
+            for r in rows:
+                print(f"{r['benchmark']:>32s} {r['case']:>10s} {r['n_points']:9d} points {r['seconds']:9.3f} s")
+            results.extend(rows)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'environment': environment(),
+        'settings': {'n_jobs': args.n_jobs, 'executor': args.executor, 'repeat': args.repeat},
+        'results': results,
+    }
+    with open(args.output, 'w') as fh:
+        json.dump(report, fh, indent=1)
+    print(f"Results saved in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
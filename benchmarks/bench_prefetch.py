@@ -0,0 +1,77 @@
+import contextlib
+import glob
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import STEP1_process_lightcurves as step1
+from STEP1_process_lightcurves import process_lightcurves_pipelined
+from synthetic import make_dataset
+
+# STEP1 with and without prefetch/write-behind on one worker.
+#
+# Local disks hide most of the I/O wait, so --read_latency and
+# --write_latency add a fixed delay to every raw file load and processed
+# file write, like a network or parallel filesystem. With prefetch the
+# delays overlap the cleaning and the run approaches max(I/O, compute)
+# instead of their sum.
+
+
+def with_latency(fn, seconds):
+    def delayed(*args, **kwargs):
+        time.sleep(seconds)
+        return fn(*args, **kwargs)
+    return delayed
+
+
+def run_case(raw_dir, out_dir, prefetch, write_behind, io_threads):
+    paths = sorted(glob.glob(os.path.join(raw_dir, '*.txt')))
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = list(process_lightcurves_pipelined(paths, out_dir, prefetch=prefetch, write_behind=write_behind,
+                                                     io_threads=io_threads))
+    elapsed = time.perf_counter() - start
+    errors = [error for _, _, error in results if error]
+    return elapsed, len(paths), errors
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare STEP1 on one worker with and without prefetch/write-behind I/O.")
+    parser.add_argument("--n_stars", type=int, default=24, help="Stars in the synthetic dataset. Default is 24.")
+    parser.add_argument("--read_latency", type=float, default=0.05, help="Seconds added to every raw file load. Default is 0.05.")
+    parser.add_argument("--write_latency", type=float, default=0.05, help="Seconds added to every processed file write. Default is 0.05.")
+    parser.add_argument("--prefetch", type=int, default=4, help="Prefetch depth of the pipelined run. Default is 4.")
+    parser.add_argument("--write_behind", type=int, default=4, help="Write-behind depth of the pipelined run. Default is 4.")
+    parser.add_argument("--io_threads", type=int, default=2, help="Reader threads of the pipelined run. Default is 2.")
+    args = parser.parse_args()
+
+    step1.load_raw_lightcurve = with_latency(step1.load_raw_lightcurve, args.read_latency)
+    step1.save_processed = with_latency(step1.save_processed, args.write_latency)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, 'raw')
+        os.makedirs(raw_dir)
+        make_dataset(raw_dir, args.n_stars)
+
+        print(f"latency: {args.read_latency} s per read, {args.write_latency} s per write")
+        print(f"{'mode':>28s} {'files':>6s} {'seconds':>8s} {'files/s':>8s}")
+        baseline = None
+        for name, prefetch, write_behind in (('inline', 0, 0),
+                                             (f'prefetch {args.prefetch}, write {args.write_behind}',
+                                              args.prefetch, args.write_behind)):
+            out_dir = os.path.join(tmp, f'out_{prefetch}')
+            os.makedirs(out_dir)
+            elapsed, n_files, errors = run_case(raw_dir, out_dir, prefetch, write_behind, args.io_threads)
+            baseline = baseline or elapsed
+            print(f"{name:>28s} {n_files:6d} {elapsed:8.2f} {n_files / elapsed:8.1f}  {baseline / elapsed:.1f}x"
+                  + (f"  {len(errors)} errors" if errors else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from lightcurve import LightCurve
+from STEP3_save_psd import CHUNK_ELEMENTS, choose_engine, max_frequency, psd_from_lightcurve
+from synthetic import synthetic_lightcurve
+
+
+def run_case(cadence, n_sectors, rgb='', exact_limit=2e9, seed=0):
+    """
+    Time every PSD engine on one synthetic lightcurve and compare the
+    normalized PSDs against the exact engine.
+
+    Returns a list of result dicts (one per engine run).
+    """
+    t, f = synthetic_lightcurve(cadence, n_sectors, seed=seed)
+    results = []
+    powers = {}
+
+    engines = ['fast', 'exact', 'chunked']
+    for engine in engines:
+        if engine != 'fast' and len(powers) and len(t) * len(powers['fast'][0]) > exact_limit:
+            print(f"  {engine:8s} skipped (N * n_freq above {exact_limit:.0e})")
+            continue
+        start = time.perf_counter()
+        freq, power = psd_from_lightcurve(LightCurve(t, f), cadence, rgb, engine=engine)
+        elapsed = time.perf_counter() - start
+        powers[engine] = (freq, power)
+        results.append({
+            'cadence': cadence,
+            'n_sectors': n_sectors,
+            'n_points': len(t),
+            'n_freq': len(freq),
+            'engine': engine,
+            'seconds': elapsed,
+        })
+
+    reference = powers.get('exact')
+    for r in results:
+        if reference is None:
+            r['max_rel_dev'] = r['max_dev_over_peak'] = None
+            continue
+        power = powers[r['engine']][1]
+        ref = reference[1]
+        r['max_rel_dev'] = float(np.max(np.abs(power - ref) / ref))
+        r['max_dev_over_peak'] = float(np.max(np.abs(power - ref)) / ref.max())
+
+    auto = choose_engine(len(t), results[0]['n_freq'])
+    for r in results:
+        r['auto_choice'] = auto
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the STEP3 Lomb-Scargle engines on synthetic oscillation signals.")
+    parser.add_argument("--cases", type=str, default="1800x1,1800x4,120x1",
+                        help="Comma-separated cadence x n_sectors cases. Default is 1800x1,1800x4,120x1.")
+    parser.add_argument("--rgb", type=str, default="RGB_CMD", help="RGB flag passed to the PSD (sets max frequency). Default is RGB_CMD.")
+    parser.add_argument("--exact_limit", type=float, default=2e9, help="Skip the exact engines above this N * n_freq. Default is 2e9.")
+    args = parser.parse_args()
+
+    print(f"chunked engine block size: {CHUNK_ELEMENTS} elements")
+    header = f"{'case':>10s} {'N':>8s} {'n_freq':>9s} {'engine':>8s} {'seconds':>9s} {'max rel dev':>12s} {'dev/peak':>10s}"
+    rows = []
+    for case in args.cases.split(','):
+        cadence, n_sectors = (int(x) for x in case.split('x'))
+        print(f"case {case}: max frequency {max_frequency(cadence, args.rgb)} uHz")
+        rows.extend(run_case(cadence, n_sectors, rgb=args.rgb, exact_limit=args.exact_limit))
+
+    print(header)
+    for r in rows:
+        rel = '-' if r['max_rel_dev'] is None else f"{r['max_rel_dev']:.2e}"
+        peak = '-' if r['max_dev_over_peak'] is None else f"{r['max_dev_over_peak']:.2e}"
+        case = f"{r['cadence']}x{r['n_sectors']}"
+        print(f"{case:>10s} {r['n_points']:8d} {r['n_freq']:9d} {r['engine']:>8s} {r['seconds']:9.3f} {rel:>12s} {peak:>10s}"
+              f"{'  <- auto' if r['engine'] == r['auto_choice'] else ''}")
+
+
+if __name__ == "__main__":
+    main()
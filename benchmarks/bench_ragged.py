@@ -0,0 +1,77 @@
+import contextlib
+import filecmp
+import glob
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from STEP1_process_lightcurves import process_lightcurve, process_lightcurves_ragged, processed_path
+from synthetic import make_dataset
+
+# STEP1 on many short lightcurves: the per-file path (process_lightcurve for
+# every file) versus ragged batches (process_lightcurves_ragged, one
+# load_many + vectorized cleaning + split per batch), both on one worker.
+# The dataset has only 1800 s cadence TESS sectors and K2 campaigns, the
+# files for which per-file overhead matters most. The outputs are checked
+# to be identical.
+
+
+def run_per_file(paths, out_dir, output_format, filter_window):
+    for fp in paths:
+        process_lightcurve(fp, out_dir, output_format=output_format, filter_window=filter_window)
+
+
+def run_ragged(paths, out_dir, output_format, filter_window, batch_size):
+    for i in range(0, len(paths), batch_size):
+        for fp, _, error in process_lightcurves_ragged(paths[i:i + batch_size], out_dir, output_format=output_format,
+                                                       filter_window=filter_window):
+            if error is not None:
+                raise RuntimeError(f"{fp}: {error}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare STEP1 per file with ragged batches on short lightcurves.")
+    parser.add_argument("--n_stars", type=int, default=100, help="Stars in the synthetic dataset. Default is 100.")
+    parser.add_argument("--batch_sizes", type=str, default="16,64,256", help="Comma-separated files per ragged batch. Default is 16,64,256.")
+    parser.add_argument("--filter_window", type=float, default=10, help="Normalization half-width in days. Default is 10.")
+    parser.add_argument("--output_format", choices=["csv", "binary"], default="binary", help="Output format. Default is binary (CSV writing dominates otherwise).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, 'raw')
+        make_dataset(raw_dir, args.n_stars, cadences=(1800,), cadence_weights=(1.0,), k2_fraction=0.5)
+        paths = sorted(glob.glob(os.path.join(raw_dir, '*.txt')))
+
+        cases = [('per file', None)] + [(f'ragged {n}', int(n)) for n in args.batch_sizes.split(',')]
+        print(f"{len(paths)} files, filter_window {args.filter_window}, {args.output_format} output")
+        print(f"{'mode':>12s} {'seconds':>8s} {'files/s':>8s}")
+        baseline = None
+        for name, batch_size in cases:
+            out_dir = os.path.join(tmp, name.replace(' ', '_'))
+            os.makedirs(out_dir)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if batch_size is None:
+                    run_per_file(paths, out_dir, args.output_format, args.filter_window)
+                else:
+                    run_ragged(paths, out_dir, args.output_format, args.filter_window, batch_size)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            line = f"{name:>12s} {elapsed:8.2f} {len(paths) / elapsed:8.1f}  {baseline / elapsed:.1f}x"
+            if batch_size is not None:
+                reference = os.path.join(tmp, 'per_file')
+                n_differ = sum(not filecmp.cmp(processed_path(fp, reference, args.output_format),
+                                               processed_path(fp, out_dir, args.output_format), shallow=False)
+                               for fp in paths)
+                line += "  outputs identical" if n_differ == 0 else f"  {n_differ} outputs differ"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
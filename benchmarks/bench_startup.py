@@ -0,0 +1,73 @@
+import os
+import re
+import subprocess
+import sys
+import time
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+sys.path.insert(0, SCRIPTS)
+
+from lightcurveprocessor import COMMANDS
+
+# Startup cost of the lightcurveprocessor commands.
+#
+# Runs `lightcurveprocessor.py <command> --help` (which imports the command's
+# module and builds its parser, i.e. everything a real run does before it
+# starts working) in fresh interpreters, and reports the best wall time and
+# which heavy dependencies were imported on the way (from python -X
+# importtime). With --max_seconds, or if a command imports a dependency it
+# should only load on use (pandas and astropy for every command), the exit
+# status is 1, so the script can guard startup time in a job script or CI.
+HEAVY = ('numpy', 'pandas', 'astropy', 'scipy', 'matplotlib')
+DEFERRED = ('pandas', 'astropy')
+
+
+def run_command(argv, repeat):
+    """Best wall time of running argv and the top-level packages it imported."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime'] + argv, capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(argv)} failed:\n{proc.stderr[-2000:]}")
+    imported = set()
+    for line in proc.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+\d+ \|\s*([\w.]+)$', line)
+        if match:
+            imported.add(match.group(1).split('.')[0])
+    return min(times), imported
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure the startup time of the lightcurveprocessor commands.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per command (best is reported). Default is 5.")
+    parser.add_argument("--max_seconds", type=float, default=None, help="Fail if a command takes longer than this to start. Default is no limit.")
+    args = parser.parse_args()
+
+    cli = os.path.join(SCRIPTS, 'lightcurveprocessor.py')
+    baseline, _ = run_command(['-c', 'pass'], args.repeat)
+    cases = [('(interpreter)', ['-c', 'pass']), ('(all heavy deps)', ['-c', 'import numpy, pandas, astropy.timeseries']),
+             ('(no command)', [cli, '--help'])]
+    cases += [(name, [cli, name, '--help']) for name in COMMANDS]
+
+    problems = []
+    print(f"{'command':>18s} {'seconds':>8s} {'minus python':>13s}  heavy imports")
+    for name, argv in cases:
+        seconds, imported = run_command(argv, args.repeat)
+        heavy = [m for m in HEAVY if m in imported]
+        print(f"{name:>18s} {seconds:8.3f} {seconds - baseline:13.3f}  {', '.join(heavy) or '-'}")
+        if name in COMMANDS or name == '(no command)':
+            problems.extend(f"{name} imports {m} at startup" for m in DEFERRED if m in imported)
+            if args.max_seconds is not None and seconds > args.max_seconds:
+                problems.append(f"{name} takes {seconds:.3f} s > {args.max_seconds} s to start")
+
+    for p in problems:
+        print(f"PROBLEM {p}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
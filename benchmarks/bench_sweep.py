@@ -0,0 +1,73 @@
+import contextlib
+import filecmp
+import glob
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from STEP1_process_lightcurves import parameter_grid, process_lightcurve, sweep_lightcurve, sweep_path
+from synthetic import make_dataset
+
+# STEP1 parameter sweep: one process_lightcurve run per parameter set versus
+# sweep_lightcurve, which loads each raw file once, gap-fills once per
+# gap_threshold and normalizes once per filter_window and set of clipped
+# rows. Both run serially; the outputs are checked to be identical.
+
+
+def parse_values(text):
+    return [float(v) for v in text.split(',')]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare a STEP1 parameter sweep with separate runs per parameter set.")
+    parser.add_argument("--n_stars", type=int, default=12, help="Stars in the synthetic dataset. Default is 12.")
+    parser.add_argument("--gap_thresholds", type=parse_values, default=[1.5 / 24, 0.25], help="Comma-separated gap thresholds. Default is 0.0625,0.25.")
+    parser.add_argument("--sigma_clips", type=parse_values, default=[3, 4, 5], help="Comma-separated sigma thresholds. Default is 3,4,5.")
+    parser.add_argument("--filter_windows", type=parse_values, default=[2, 10], help="Comma-separated normalization half-widths. Default is 2,10.")
+    parser.add_argument("--output_format", choices=["csv", "binary"], default="binary", help="Output format. Default is binary.")
+    args = parser.parse_args()
+
+    grid = parameter_grid(args.gap_thresholds, args.sigma_clips, args.filter_windows)
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, 'raw')
+        make_dataset(raw_dir, args.n_stars)
+        paths = sorted(glob.glob(os.path.join(raw_dir, '*.txt')))
+
+        start = time.perf_counter()
+        separate = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for params in grid:
+                out_dir = os.path.join(tmp, 'separate', str(len(separate)))
+                os.makedirs(out_dir)
+                for fp in paths:
+                    separate[fp, tuple(params.values())] = process_lightcurve(
+                        fp, out_dir, output_format=args.output_format, **params)
+        separate_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for fp in paths:
+                sweep_lightcurve(fp, os.path.join(tmp, 'sweep'), grid, output_format=args.output_format)
+        sweep_time = time.perf_counter() - start
+
+        n_differ = sum(not filecmp.cmp(separate[fp, tuple(params.values())],
+                                       sweep_path(fp, os.path.join(tmp, 'sweep'), params, args.output_format),
+                                       shallow=False)
+                       for fp in paths for params in grid)
+
+        n_outputs = len(paths) * len(grid)
+        print(f"{len(paths)} files x {len(grid)} parameter sets = {n_outputs} outputs")
+        print(f"{'mode':>10s} {'seconds':>8s} {'outputs/s':>10s}")
+        print(f"{'separate':>10s} {separate_time:8.2f} {n_outputs / separate_time:10.1f}")
+        print(f"{'sweep':>10s} {sweep_time:8.2f} {n_outputs / sweep_time:10.1f}  {separate_time / sweep_time:.1f}x")
+        print("outputs identical" if n_differ == 0 else f"{n_differ} outputs differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import contextlib
+import glob
+import io
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+sys.path.insert(0, SCRIPTS)
+
+from run_pipeline import psd_name, run_pipeline
+from STEP2_group_and_concatenate_and_fix_gaps import concatenated_name, find_groups, parse_sector_campaign_nums
+from synthetic import make_dataset
+
+# Local simulation of a sharded multi-node run.
+#
+# Starts n_nodes run_pipeline.py processes on one synthetic dataset, either
+# with --shard i/N or claiming groups through a shared --queue_dir.
+# Optionally one node is killed (SIGKILL, whole process group) mid-run and
+# restarted, like a node failure followed by a resubmitted job. Then checks
+# that every group was processed exactly once across all nodes (from the
+# per-group metrics records) and that every PSD is identical to a
+# single-process reference run.
+
+
+def launch(node, raw_dir, psd_dir, metrics_dir, log_dir, mode, n_nodes, queue_dir, n_jobs):
+    cmd = [sys.executable, os.path.join(SCRIPTS, 'run_pipeline.py'), raw_dir, psd_dir,
+           '--executor', 'process', '--n_jobs', str(n_jobs), '--metrics_dir', metrics_dir]
+    cmd += ['--shard', f"{node}/{n_nodes}"] if mode == 'shard' else ['--queue_dir', queue_dir]
+    log = open(os.path.join(log_dir, f"node{node}_{time.time():.0f}.log"), 'w')
+    return subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def expected_psd_names(raw_dir):
+    """Group key -> the two possible PSD names (shifted or not)."""
+    names = {}
+    for key, file_list in find_groups(raw_dir).items():
+        sc_nums = parse_sector_campaign_nums(file_list, key[2])
+        names[key] = [psd_name(concatenated_name(*key, sc_nums, s)) for s in (True, False)]
+    return names
+
+
+def completed_groups(metrics_dir):
+    """Count of successfully finished pipeline_group items per group name, over all runs."""
+    counts = {}
+    for path in glob.glob(os.path.join(metrics_dir, '*.jsonl')):
+        with open(path) as fh:
+            for line in fh:
+                rec = json.loads(line)
+                if rec['stage'] == 'pipeline_group' and 'error' not in rec:
+                    counts[rec['item']] = counts.get(rec['item'], 0) + 1
+    return counts
+
+
+def run_case(workdir, mode, n_nodes=3, n_stars=24, n_jobs=2, kill_after=None, seed=0):
+    """
+    Run one simulated multi-node case. Returns a list of problems (empty if
+    every group was processed exactly once with the reference result).
+    """
+    raw_dir = os.path.join(workdir, 'raw')
+    ref_dir = os.path.join(workdir, 'reference')
+    case_dir = os.path.join(workdir, f"{mode}{'_kill' if kill_after else ''}")
+    psd_dir, metrics_dir, log_dir, queue_dir = (os.path.join(case_dir, d) for d in ('psd', 'metrics', 'logs', 'queue'))
+    for d in (psd_dir, metrics_dir, log_dir):
+        os.makedirs(d, exist_ok=True)
+
+    if not os.path.isdir(raw_dir):
+        os.makedirs(raw_dir)
+        make_dataset(raw_dir, n_stars, seed=seed)
+    if not os.path.isdir(ref_dir):
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_pipeline(raw_dir, ref_dir, executor='serial')
+
+    start = time.perf_counter()
+    nodes = [launch(i, raw_dir, psd_dir, metrics_dir, log_dir, mode, n_nodes, queue_dir, n_jobs) for i in range(n_nodes)]
+    if kill_after is not None:
+        time.sleep(kill_after)
+        if nodes[0].poll() is None:
+            os.killpg(nodes[0].pid, signal.SIGKILL)
+            print(f"  killed node 0 after {kill_after} s")
+        nodes[0].wait()
+        nodes[0] = launch(0, raw_dir, psd_dir, metrics_dir, log_dir, mode, n_nodes, queue_dir, n_jobs)
+    codes = [node.wait() for node in nodes]
+    elapsed = time.perf_counter() - start
+
+    problems = [f"node {i} exited with {code}" for i, code in enumerate(codes) if code != 0]
+    counts = completed_groups(metrics_dir)
+    for key, names in expected_psd_names(raw_dir).items():
+        n_runs = counts.pop("_".join(key), 0)
+        if n_runs != 1:
+            problems.append(f"group {key} processed {n_runs} times")
+        present = [n for n in names if os.path.exists(os.path.join(psd_dir, n))]
+        if len(present) != 1:
+            problems.append(f"group {key} has {len(present)} PSD files")
+        elif open(os.path.join(psd_dir, present[0]), 'rb').read() != open(os.path.join(ref_dir, present[0]), 'rb').read():
+            problems.append(f"group {key} PSD differs from the reference")
+    problems.extend(f"unexpected group {item}" for item in counts)
+    leftovers = [n for n in os.listdir(psd_dir) if n.startswith('.')]
+    print(f"  {mode}{' + kill/restart' if kill_after else ''}: {len(codes)} nodes, {elapsed:.1f} s, "
+          f"{len(problems)} problems, {len(leftovers)} temporary files of killed writers left")
+    return problems
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate a sharded multi-node pipeline run with local processes and check that every group is processed exactly once.")
+    parser.add_argument("--n_nodes", type=int, default=3, help="Simulated nodes. Default is 3.")
+    parser.add_argument("--n_stars", type=int, default=24, help="Stars in the synthetic dataset. Default is 24.")
+    parser.add_argument("--n_jobs", type=int, default=2, help="Workers per node. Default is 2.")
+    parser.add_argument("--modes", type=str, default="shard,queue", help="Comma-separated modes to run: shard, queue. Default is both.")
+    parser.add_argument("--kill_after", type=float, default=3.0, help="Also run each mode killing node 0 after this many seconds and restarting it. 0 disables. Default is 3.")
+    parser.add_argument("--workdir", type=str, default=None, help="Keep the data in this directory. Default is a temporary directory.")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='shard_harness_')
+    problems = []
+    try:
+        for mode in (m for m in args.modes.split(',') if m):
+            for kill_after in ([None, args.kill_after] if args.kill_after else [None]):
+                case_problems = run_case(workdir, mode, args.n_nodes, args.n_stars, args.n_jobs, kill_after)
+                problems.extend(f"{mode}: {p}" for p in case_problems)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    for p in problems:
+        print(f"PROBLEM {p}")
+    print("OK: every group processed exactly once" if not problems else f"{len(problems)} problems")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
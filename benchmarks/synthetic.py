@@ -0,0 +1,193 @@
+import os
+import numpy as np
+
+# Synthetic lightcurves with solar-like oscillations, used by the benchmarks.
+# Times are in days (TESS BTJD-like), fluxes are relative (1 + ppm * 1e-6),
+# i.e. what STEP1 produces and STEP3 expects.
+
+
+def delta_nu_from_numax(numax):
+    """Large frequency separation (uHz) from numax (uHz), Stello et al. 2009 scaling."""
+    return 0.263 * numax ** 0.772
+
+
+def oscillation_signal(t, numax, amplitude=None, granulation_ppm=None, noise_ppm=50.0, rng=None):
+    """
+    Solar-like oscillation signal in ppm at times t (days).
+
+    Radial (l=0), dipole (l=1) and quadrupole (l=2) modes of the orders within
+    +/- 4 delta_nu of numax, with a Gaussian amplitude envelope and random
+    phases, plus AR(1) granulation noise and white noise.
+    """
+    rng = np.random.default_rng(rng)
+    if amplitude is None:
+        amplitude = 2.5 * (3090.0 / numax) ** 0.8
+    if granulation_ppm is None:
+        granulation_ppm = 4 * amplitude
+
+    delta_nu = delta_nu_from_numax(numax)
+    t_s = (t - t[0]) * 86400.0
+    signal = np.zeros_like(t_s)
+
+    n_max = numax / delta_nu
+    width = 0.66 * numax ** 0.88 / (2 * np.sqrt(2 * np.log(2)))
+    for n in range(int(n_max - 4), int(n_max + 5)):
+        for l, offset, visibility in ((0, 0.0, 1.0), (1, 0.5, 1.5), (2, -0.12, 0.6)):
+            nu = delta_nu * (n + 1.4 + offset)
+            if nu <= 0:
+                continue
+            amp = amplitude * np.sqrt(visibility) * np.exp(-0.5 * ((nu - numax) / width) ** 2)
+            signal += amp * np.sin(2 * np.pi * nu * 1e-6 * t_s + rng.uniform(0, 2 * np.pi))
+
+    # Granulation: AR(1) process with timescale ~ 1 / (2 pi numax / 3)
+    dt = np.median(np.diff(t_s)) if len(t_s) > 1 else 1.0
+    phi = np.exp(-dt * 2 * np.pi * numax * 1e-6 / 3)
+    innovations = rng.normal(0, granulation_ppm * np.sqrt(1 - phi ** 2), len(t_s))
+    gran = np.empty_like(t_s)
+    acc = 0.0
+    for i, x in enumerate(innovations):
+        acc = phi * acc + x
+        gran[i] = acc
+    signal += gran
+
+    return signal + rng.normal(0, noise_ppm, len(t_s))
+
+
+def sector_times(cadence, n_sectors=1, sector_days=27.4, orbit_gap_days=1.0, start=1325.0, sector_step=1):
+    """
+    Time stamps (days) of n_sectors consecutive TESS-like sectors at the given
+    cadence (seconds), each with a mid-sector downlink gap.
+    """
+    dt = cadence / 86400.0
+    times = []
+    for k in range(n_sectors):
+        t0 = start + k * sector_step * sector_days
+        t = t0 + np.arange(int(sector_days / dt)) * dt
+        mid = t0 + sector_days / 2
+        times.append(t[np.abs(t - mid) > orbit_gap_days / 2])
+    return np.concatenate(times)
+
+
+def synthetic_lightcurve(cadence, n_sectors=1, numax=None, seed=0):
+    """
+    Relative-flux lightcurve (t in days, f = 1 + ppm * 1e-6) of a star with
+    solar-like oscillations observed for n_sectors at the given cadence.
+    numax defaults to a value well below the cadence Nyquist frequency.
+    """
+    rng = np.random.default_rng(seed)
+    t = sector_times(cadence, n_sectors)
+    if numax is None:
+        nyquist = 1e6 / (2 * cadence)
+        numax = min(0.4 * nyquist, 3000.0)
+    f = 1 + 1e-6 * oscillation_signal(t, numax, rng=rng)
+    return t, f
+
+
+# ---------------------------------------------------------------------------
+# Raw files in the naming convention of the pipeline (see STEP2 find_groups)
+# ---------------------------------------------------------------------------
+
+SECTOR_DAYS = {'TESS': 27.4, 'K2': 80.0}
+ORBIT_GAP_DAYS = {'TESS': 1.0, 'K2': 0.0}
+RAW_FLUX_SCALE = 1e4  # e-/s of a relative flux of 1
+
+
+def raw_file_name(irow, target, exptime, mission, number, author='SPOC'):
+    """
+    Raw lightcurve file name as the download step writes it, e.g.
+    00042_target_TIC_42_LK_targetname_LK_exptime_120_LK_mission_TESS_Sector_1_LK_author_SPOC.txt
+    """
+    if mission == 'TESS':
+        mission_info = f"TESS_Sector_{number}"
+    else:
+        mission_info = f"K2_Campaign_{number:02d}"
+    return (f"{irow:05d}_target_{target}_LK_targetname_LK_exptime_{exptime}"
+            f"_LK_mission_{mission_info}_LK_author_{author}.txt")
+
+
+def inject_gaps(t, rng, max_gaps=3, min_days=0.05, max_days=2.0):
+    """Boolean mask removing up to max_gaps random data gaps from t."""
+    keep = np.ones(len(t), dtype=bool)
+    for _ in range(rng.integers(0, max_gaps + 1)):
+        start = rng.uniform(t[0], t[-1])
+        keep &= ~((t >= start) & (t < start + rng.uniform(min_days, max_days)))
+    return keep
+
+
+def inject_outliers(f, rng, fraction=1e-3, sigma=20.0, nan_fraction=5e-3):
+    """Copy of f with positive/negative outliers of ~sigma standard deviations and NaNs."""
+    f = f.copy()
+    scatter = np.std(f)
+    hit = rng.random(len(f)) < fraction
+    f[hit] += rng.choice([-1, 1], hit.sum()) * sigma * scatter * rng.uniform(1, 3, hit.sum())
+    f[rng.random(len(f)) < nan_fraction] = np.nan
+    return f
+
+
+def write_raw_lightcurve(path, t, f):
+    """Write a raw lightcurve: whitespace-delimited time, flux error, flux (e-/s)."""
+    flux = RAW_FLUX_SCALE * f
+    err = np.full_like(flux, RAW_FLUX_SCALE * 1e-4)
+    np.savetxt(path, np.column_stack([t, err, flux]))
+    return path
+
+
+def write_star(directory, irow, cadence, mission='TESS', numbers=(1,), numax=None, seed=0):
+    """
+    Write the raw files of one star observed in the given sectors/campaigns.
+
+    The oscillation signal is continuous across sectors; each sector gets
+    its own downlink gap, random data gaps, outliers and NaNs.
+
+    Returns:
+        list: Paths of the written files.
+    """
+    rng = np.random.default_rng(seed)
+    sector_days = SECTOR_DAYS[mission]
+    if numax is None:
+        nyquist = 1e6 / (2 * cadence)
+        numax = min(0.4 * nyquist, 3000.0) * rng.uniform(0.6, 1.0)
+
+    parts = [sector_times(cadence, 1, sector_days=sector_days, orbit_gap_days=ORBIT_GAP_DAYS[mission],
+                          start=1325.0 + n * sector_days) for n in numbers]
+    t = np.concatenate(parts)
+    f = 1 + 1e-6 * oscillation_signal(t, numax, rng=rng)
+
+    paths = []
+    start = 0
+    for n, part in zip(numbers, parts):
+        t_sec = t[start:start + len(part)]
+        f_sec = f[start:start + len(part)]
+        start += len(part)
+        keep = inject_gaps(t_sec, rng)
+        path = os.path.join(directory, raw_file_name(irow, f"SYN_{irow}", cadence, mission, n))
+        paths.append(write_raw_lightcurve(path, t_sec[keep], inject_outliers(f_sec[keep], rng)))
+    return paths
+
+
+def make_dataset(directory, n_stars, seed=0, max_sectors=3, k2_fraction=0.2,
+                 cadences=(20, 120, 1800), cadence_weights=(0.1, 0.3, 0.6)):
+    """
+    Write raw files for n_stars synthetic stars: TESS stars at 20/120/1800 s
+    in 1 to max_sectors (not always consecutive) sectors, and K2 stars at
+    1800 s in one or two campaigns.
+
+    Returns:
+        dict: irow -> (cadence, mission, sector/campaign numbers, paths)
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    stars = {}
+    for irow in range(n_stars):
+        if rng.random() < k2_fraction:
+            mission, cadence = 'K2', 1800
+            first = int(rng.integers(1, 18))
+            numbers = [first] if rng.random() < 0.5 else [first, first + 1]
+        else:
+            mission = 'TESS'
+            cadence = int(rng.choice(cadences, p=cadence_weights))
+            n_sectors = int(rng.integers(1, max_sectors + 1))
+            numbers = sorted(int(n) for n in rng.choice(np.arange(1, 70), n_sectors, replace=False))
+        paths = write_star(directory, irow, cadence, mission, numbers, seed=seed * 100003 + irow)
+        stars[irow] = (cadence, mission, numbers, paths)
+    return stars
@@ -1,18 +1,418 @@
-import pandas as pd
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import multiprocessing
+import threading
 import os
 
+from config import load_config
+from lc_io import BINARY_EXTENSION, atomic_write, binary_path, is_binary, load_binary, load_many, load_text, save_binary
+from instrumentation import add_metrics_arguments, metrics_from_args, record, track_item, track_phase
+from lightcurve import LightCurve, LightCurveMeta
+from pipelined import run_pipelined
+from ragged import compress_offsets, segment_ids, segment_lengths, segment_median, segment_std
+from result_cache import add_cache_arguments, cache_from_args
+from sharding import add_shard_arguments, claim_and_run, in_shard, parse_shard, queue_from_args
+from running_median import local_normalize, local_normalize_ragged
+
+
+def fill_gaps(time, flux, gap_threshold=1.5 / 24, time_step=None):
+    """
+    Fill gaps shorter than gap_threshold by linear interpolation.
+
+    A gap is any step between consecutive samples larger than 1.95 times the
+    median time step. Each gap is filled with points spaced by the median
+    step (np.arange(start + step, end, step)) whose fluxes are linearly
+    interpolated between the two samples bounding the gap. All insertion
+    points and interpolated samples are computed in one vectorized pass and
+    spliced into preallocated output arrays, so the cost is O(n) regardless
+    of the number of gaps.
+
+    Parameters:
+        time (array): Time stamps, sorted in increasing order.
+        flux (array): Flux values.
+        gap_threshold (float): Only gaps shorter than this (in days) are filled.
+        time_step (float): Median time step to use instead of the one of this
+            series, e.g. the global step when filling one chunk of a longer series.
+
+    Returns:
+        tuple: (time, flux, n_filled) where n_filled is the number of inserted points.
+    """
+    time = np.asarray(time, dtype=float)
+    flux = np.asarray(flux, dtype=float)
+    if len(time) < 2:
+        return time.copy(), flux.copy(), 0
+
+    time_diff = np.diff(time)
+    approx_time_step = np.median(time_diff) if time_step is None else time_step
+
+    # Index (into time) of the sample right after each gap
+    gap_idx = np.nonzero((approx_time_step * 1.95 < time_diff) & (time_diff < gap_threshold))[0] + 1
+    out_time, out_flux, counts = _insert_gap_points(time, flux, gap_idx, approx_time_step)
+    return out_time, out_flux, int(counts.sum())
+
+
+def _insert_gap_points(time, flux, gap_idx, time_step):
+    """
+    Insert the points of fill_gaps before the rows gap_idx, with time_step
+    the spacing of all gaps or an array with the spacing of each gap.
+
+    Returns:
+        tuple: (time, flux, counts) with counts the points inserted in each gap.
+    """
+    start_time = time[gap_idx - 1]
+    end_time = time[gap_idx]
+    start_flux = flux[gap_idx - 1]
+    end_flux = flux[gap_idx]
+
+    # Number of points np.arange(start + step, end, step) generates for each gap
+    first_time = start_time + time_step
+    counts = np.ceil((end_time - first_time) / time_step)
+    counts = np.clip(np.nan_to_num(counts), 0, None).astype(np.intp)
+    n_filled = int(counts.sum())
+    if n_filled == 0:
+        return time.copy(), flux.copy(), counts
+
+    # New samples, laid out gap after gap (np.arange spacing and np.interp slope)
+    which_gap = np.repeat(np.arange(len(gap_idx)), counts)
+    k = np.arange(n_filled) - np.repeat(np.cumsum(counts) - counts, counts)
+    delta = (first_time + time_step) - first_time
+    new_times = np.where(k == 0, first_time[which_gap], first_time[which_gap] + k * delta[which_gap])
+    slope = (end_flux - start_flux) / (end_time - start_time)
+    new_fluxes = slope[which_gap] * (new_times - start_time[which_gap]) + start_flux[which_gap]
+
+    # Splice into preallocated arrays: original sample i moves right by the
+    # number of points inserted before it
+    inserted_before = np.zeros(len(time), dtype=np.intp)
+    inserted_before[gap_idx] = counts
+    orig_pos = np.arange(len(time)) + np.cumsum(inserted_before)
+    is_new = np.ones(len(time) + n_filled, dtype=bool)
+    is_new[orig_pos] = False
+
+    out_time = np.empty(len(time) + n_filled)
+    out_flux = np.empty(len(time) + n_filled)
+    out_time[orig_pos] = time
+    out_flux[orig_pos] = flux
+    out_time[is_new] = new_times
+    out_flux[is_new] = new_fluxes
+
+    return out_time, out_flux, counts
+
+
+def fill_gaps_ragged(time, flux, offsets, gap_threshold=1.5 / 24):
+    """
+    fill_gaps of every lightcurve of a ragged batch (see ragged.py) at once,
+    each with the median time step of its own samples.
+
+    Returns:
+        tuple: (time, flux, offsets, n_filled) with n_filled the number of
+        inserted points of every lightcurve.
+    """
+    time = np.asarray(time, dtype=float)
+    flux = np.asarray(flux, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = segment_lengths(offsets)
+    n_diffs = np.maximum(lengths - 1, 0)
+    if len(time) < 2:
+        return time.copy(), flux.copy(), offsets.copy(), np.zeros(len(lengths), dtype=np.int64)
+
+    # Steps within a lightcurve (not across two of them) and their median per lightcurve
+    time_diff = np.diff(time)
+    within = np.ones(len(time_diff), dtype=bool)
+    boundaries = offsets[1:-1]
+    within[boundaries[(boundaries > 0) & (boundaries < len(time))] - 1] = False
+    diff_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(n_diffs, out=diff_offsets[1:])
+    time_step = np.full(len(time_diff), np.nan)
+    time_step[within] = np.repeat(segment_median(time_diff[within], diff_offsets), n_diffs)
+
+    gap_idx = np.nonzero(within & (time_step * 1.95 < time_diff) & (time_diff < gap_threshold))[0] + 1
+    out_time, out_flux, counts = _insert_gap_points(time, flux, gap_idx, time_step[gap_idx - 1])
+    n_filled = np.bincount(segment_ids(offsets)[gap_idx], weights=counts, minlength=len(lengths)).astype(np.int64)
+    new_offsets = offsets.copy()
+    new_offsets[1:] += np.cumsum(n_filled)
+    return out_time, out_flux, new_offsets, n_filled
+
+
+def load_raw_lightcurve(file_path):
+    """
+    Load a raw lightcurve (whitespace-delimited text with flux in the third
+    column, or a binary .lcb container, memory-mapped).
+
+    Returns:
+        LightCurve: Time and flux, with metadata parsed from the file name.
+    """
+    if is_binary(file_path):
+        time, flux, _ = load_binary(file_path)
+    else:
+        time, flux = load_text(file_path, time_col=0, flux_col=2)
+    return LightCurve(time, flux, meta=LightCurveMeta.from_file_name(file_path))
+
+
+def clean_lightcurve(lc, gap_threshold=1.5 / 24, sigma_clip=4, filter_window=10, metrics=None):
+    """
+    In-memory core of process_lightcurve: drop NaNs, fill small gaps, sigma-clip
+    and apply the double running-median normalization.
+
+    Parameters:
+        lc (LightCurve): Raw lightcurve (time in days); masked rows are ignored.
+        gap_threshold (float): Gap threshold in days (default is 1.5 hours).
+        sigma_clip (float): Sigma threshold for clipping outliers.
+        filter_window (float): Half-width in days of the running-median window.
+        metrics (Metrics): Optional instrumentation (see instrumentation.py).
+
+    Returns:
+        LightCurve: Cleaned and normalized lightcurve (no masked rows), with
+        the number of gap-filled points in meta.n_filled.
+    """
+    # Mask rows with NaNs in time or flux; only copied out if there are any
+    time, flux = lc.mask_nan().valid()
+
+    # Fill small gaps by linear interpolation
+    with track_phase(metrics, 'fill_gaps'):
+        t, f, n_filled = fill_gaps(time, flux, gap_threshold)
+
+    # Apply sigma clipping
+    n_before_clip = len(f)
+    with track_phase(metrics, 'sigma_clip'):
+        if len(f) > 0:
+            flux_median = np.median(f)
+            flux_std = np.std(f, ddof=1) if len(f) > 1 else np.nan
+            keep = (f >= flux_median - sigma_clip * flux_std) & (f <= flux_median + sigma_clip * flux_std)
+            t = t[keep]
+            f = f[keep]
+
+    with track_phase(metrics, 'normalize'):
+        # Local normalization: divide by the running median over +/- filter_window days
+        f_normalized = local_normalize(t, f, filter_window)
+
+        # Second normalization
+        f_double_normalized = local_normalize(t, f_normalized, filter_window)
+
+    record(metrics, rows_in=len(lc), rows_nan=len(lc) - len(time), n_filled=n_filled,
+           n_clipped=n_before_clip - len(f), rows_out=len(t))
+    return LightCurve(t, f_double_normalized, meta=lc.meta.copy(n_filled=n_filled))
+
+
+def clean_lightcurves_ragged(time, flux, offsets, gap_threshold=1.5 / 24, sigma_clip=4, filter_window=10,
+                             metrics=None):
+    """
+    clean_lightcurve for many lightcurves at once, packed as a ragged batch
+    (concatenated arrays plus offsets, as lc_io.load_many returns them).
+
+    Every stage runs on the whole batch with a fixed number of numpy calls:
+    NaN screening, gap detection and filling with per-lightcurve median
+    steps, sigma clipping with per-lightcurve medians and standard
+    deviations, and the two running-median normalizations (see
+    running_median_ragged). The results are those of clean_lightcurve on
+    each lightcurve, except that the standard deviations are summed in a
+    different order (see ragged.segment_std), so a sample lying within
+    rounding of the clipping threshold could be clipped differently.
+
+    Parameters:
+        time, flux (array): Concatenated raw time stamps and fluxes.
+        offsets (array): Lightcurve i is time[offsets[i]:offsets[i + 1]].
+        gap_threshold, sigma_clip, filter_window: As in clean_lightcurve.
+        metrics (Metrics): Optional instrumentation; phases are recorded in
+            the current item.
+
+    Returns:
+        tuple: (time, flux, offsets, n_filled) of the cleaned and normalized
+        lightcurves, with n_filled the number of gap-filled points of each.
+    """
+    time = np.asarray(time, dtype=float)
+    flux = np.asarray(flux, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_rows = len(time)
+
+    # Drop rows with NaNs in time or flux
+    keep = ~(np.isnan(time) | np.isnan(flux))
+    if not keep.all():
+        time, flux, offsets = time[keep], flux[keep], compress_offsets(keep, offsets)
+    n_valid = len(time)
+
+    # Fill small gaps by linear interpolation
+    with track_phase(metrics, 'fill_gaps'):
+        t, f, offsets, n_filled = fill_gaps_ragged(time, flux, offsets, gap_threshold)
+
+    # Apply sigma clipping
+    n_before_clip = len(f)
+    with track_phase(metrics, 'sigma_clip'):
+        lengths = segment_lengths(offsets)
+        flux_median = np.repeat(segment_median(f, offsets), lengths)
+        flux_std = np.repeat(segment_std(f, offsets, ddof=1), lengths)
+        keep = (f >= flux_median - sigma_clip * flux_std) & (f <= flux_median + sigma_clip * flux_std)
+        t, f, offsets = t[keep], f[keep], compress_offsets(keep, offsets)
+
+    with track_phase(metrics, 'normalize'):
+        # Local normalization: divide by the running median over +/- filter_window days
+        f_normalized = local_normalize_ragged(t, f, offsets, filter_window)
+
+        # Second normalization
+        f_double_normalized = local_normalize_ragged(t, f_normalized, offsets, filter_window)
+
+    record(metrics, rows_in=n_rows, rows_nan=n_rows - n_valid, n_filled=int(n_filled.sum()),
+           n_clipped=n_before_clip - len(f), rows_out=len(t))
+    return t, f_double_normalized, offsets, n_filled
+
+
+def parameter_grid(gap_thresholds=(1.5 / 24,), sigma_clips=(4,), filter_windows=(10,)):
+    """
+    Every combination of STEP1 parameters, as the parameter sets of a sweep.
+
+    Returns:
+        list: Dicts with gap_threshold, sigma_clip and filter_window, ordered
+        by gap_threshold, then sigma_clip, then filter_window (duplicates removed).
+    """
+    grid = []
+    for gap_threshold in dict.fromkeys(gap_thresholds):
+        for sigma_clip in dict.fromkeys(sigma_clips):
+            for filter_window in dict.fromkeys(filter_windows):
+                grid.append({'gap_threshold': gap_threshold, 'sigma_clip': sigma_clip,
+                             'filter_window': filter_window})
+    return grid
+
+
+def _format_value(value):
+    """Shortest exact text of a parameter value ('4' for 4.0, '0.0625')."""
+    text = repr(float(value))
+    return text[:-2] if text.endswith('.0') else text
+
+
+def sweep_tag(params):
+    """Name tagging the outputs of one parameter set, e.g. 'gap0.0625_sig4_win10'."""
+    return (f"gap{_format_value(params['gap_threshold'])}_sig{_format_value(params['sigma_clip'])}"
+            f"_win{_format_value(params['filter_window'])}")
+
+
+def sweep_clean_lightcurve(lc, grid, metrics=None):
+    """
+    clean_lightcurve for several parameter sets, sharing the work they have
+    in common.
+
+    NaN masking is done once, gap filling and the clipping statistics (median
+    and standard deviation) once per gap_threshold, and the two normalization
+    passes once per filter_window and set of kept rows, so sigma_clip values
+    that clip the same samples share them. Only the gap-filled series of the
+    current gap_threshold is kept, so grids should be ordered by
+    gap_threshold (as parameter_grid does). Every result is identical to
+    clean_lightcurve(lc, **params).
+
+    Parameters:
+        lc (LightCurve): Raw lightcurve (time in days); masked rows are ignored.
+        grid (list): Parameter sets (dicts with gap_threshold, sigma_clip and
+            filter_window), e.g. from parameter_grid.
+        metrics (Metrics): Optional instrumentation; records how many gap
+            fills and normalizations the sweep needed.
+
+    Yields:
+        tuple: (params, LightCurve) for every parameter set, in grid order.
+    """
+    time, flux = lc.mask_nan().valid()
+    filled = {}
+    normalized = {}
+    n_gap_fills = n_normalizations = 0
+    for params in grid:
+        gap_threshold = params['gap_threshold']
+        if gap_threshold not in filled:
+            with track_phase(metrics, 'fill_gaps'):
+                t, f, n_filled = fill_gaps(time, flux, gap_threshold)
+            with track_phase(metrics, 'sigma_clip'):
+                flux_median = np.median(f) if len(f) > 0 else np.nan
+                flux_std = np.std(f, ddof=1) if len(f) > 1 else np.nan
+            filled = {gap_threshold: (t, f, n_filled, flux_median, flux_std)}
+            normalized = {}
+            n_gap_fills += 1
+        t, f, n_filled, flux_median, flux_std = filled[gap_threshold]
+
+        # Same clipping as clean_lightcurve
+        sigma_clip = params['sigma_clip']
+        with track_phase(metrics, 'sigma_clip'):
+            if len(f) > 0:
+                keep = (f >= flux_median - sigma_clip * flux_std) & (f <= flux_median + sigma_clip * flux_std)
+            else:
+                keep = np.ones(0, dtype=bool)
+
+        key = (np.packbits(keep).tobytes(), int(keep.sum()), params['filter_window'])
+        if key not in normalized:
+            t_kept = t[keep]
+            with track_phase(metrics, 'normalize'):
+                f_normalized = local_normalize(t_kept, f[keep], params['filter_window'])
+                normalized[key] = (t_kept, local_normalize(t_kept, f_normalized, params['filter_window']))
+            n_normalizations += 1
+        t_kept, f_double_normalized = normalized[key]
+        yield params, LightCurve(t_kept, f_double_normalized, meta=lc.meta.copy(n_filled=n_filled))
+
+    record(metrics, rows_in=len(lc), rows_nan=len(lc) - len(time), n_param_sets=len(grid),
+           n_gap_fills=n_gap_fills, n_normalizations=n_normalizations)
+
+
+def processed_name(original_name):
+    """Name STEP1 gives the processed version of a raw lightcurve file."""
+    return f"{original_name[:6]}fill_sigclip_hipass_{original_name[6:]}"
+
+
+def processed_path(file_path, output_dir, output_format='csv'):
+    """Path process_lightcurve writes the processed version of file_path to."""
+    output_path = os.path.join(output_dir, processed_name(os.path.basename(file_path)))
+    return binary_path(output_path) if output_format == 'binary' else output_path
+
+
+def save_processed(output_path, lc, output_format='csv', metadata=None):
+    """
+    Save the valid rows of a processed LightCurve as CSV (header "0,1") or as
+    a binary .lcb container, in which case the extension of output_path is
+    replaced.
+
+    Returns:
+        str: Path of the written file.
+    """
+    time, flux = lc.valid()
+    if output_format == 'binary':
+        return save_binary(binary_path(output_path), time, flux, metadata=metadata)
+
+    import pandas as pd
+
+    with atomic_write(output_path) as tmp_path:
+        pd.DataFrame(np.column_stack((time, flux))).to_csv(tmp_path, index=False)
+    return output_path
+
+
+# Code the processed arrays depend on: part of every process_lightcurve
+# cache key, so that editing any of it invalidates the cached results
+_PROCESS_CODE = (clean_lightcurve, local_normalize, LightCurve)
+
+
+def _process_cache_key(cache, file_path, params):
+    """
+    ResultCache key of the processed file_path with the STEP1 params. Every
+    entry point (process_lightcurve, the sweep, pipelined and ragged modes
+    and run_pipeline) uses it, so they share their cache entries.
+    """
+    return cache.make_key('process_lightcurve', [file_path], params, _PROCESS_CODE)
+
+
+def _cached_process(cache, file_path, params, compute):
+    """The LightCurve compute() returns for file_path, through its cache entry if a cache is given."""
+    if cache is None:
+        return compute()
+    key = _process_cache_key(cache, file_path, params)
+    arrays = cache.get(key)
+    if arrays is None:
+        arrays = compute().to_arrays()
+        cache.put(key, arrays)
+    return LightCurve.from_arrays(arrays)
+
 
 def process_lightcurve(file_path, output_dir, time_col='TIME', flux_col='PDCSAP_FLUX',
-                       gap_threshold=1.5 / 24, sigma_clip=4, filter_window=10):
+                       gap_threshold=1.5 / 24, sigma_clip=4, filter_window=10, output_format='csv',
+                       cache=None, metrics=None, streaming=False, chunk_days=None, flux_dtype='float64'):
     """
     Process a lightcurve to:
     1. Remove rows with NaNs in flux at the beginning or end of the lightcurve.
     2. Fill gaps smaller than 1.5 hours using linear interpolation.
     3. Drop rows if the NaN gaps are larger than 1.5 hours.
     4. Apply 5-sigma clipping to remove flux outliers.
-    5. Normalize flux using a Gaussian filter to remove low-frequency signals.
+    5. Normalize flux by a running median (applied twice) to remove low-frequency signals.
 
     Parameters:
         file_path (str): Path to the lightcurve CSV file.
@@ -21,139 +421,542 @@ def process_lightcurve(file_path, output_dir, time_col='TIME', flux_col='PDCSAP_
         flux_col (str): Name of the flux column. Default is 'PDCSAP_FLUX'.
         gap_threshold (float): Gap threshold in days (default is 1.5 hours).
         sigma_clip (float): Sigma threshold for clipping outliers.
-        filter_window (float): Window size for the Gaussian filter in days.
+        filter_window (float): Half-width in days of the running-median window used
+            for local normalization.
+        output_format (str): 'csv' (default) or 'binary' to write a memory-mappable
+            .lcb container (see lc_io).
+        cache (ResultCache): Optional cache; the processed arrays are reused when
+            the input bytes, parameters and code are unchanged.
+        metrics (Metrics): Optional instrumentation; the file is recorded as one
+            item with load, fill_gaps, sigma_clip, normalize and write phases.
+        streaming (bool): Process the file in chunks with peak memory bounded by
+            the chunk size instead of the file length (see streaming.py). The
+            cache is not used in this mode.
+        chunk_days (float): Streaming chunk length in days. Default is
+            4 * filter_window.
+        flux_dtype (str): Streaming scratch storage of the flux, 'float64'
+            (default, same output as in memory) or 'float32' (half the disk
+            traffic, output rounded to float32).
 
     Returns:
         str: Path to the processed lightcurve file.
     """
-    # Load the light curve data
-    lc = pd.read_csv(file_path, header=None, usecols=[0, 2], names=[time_col, flux_col], sep='\\s+')
-
-    # Remove rows with NaNs in 'TIME' or 'PDCSAP_FLUX' at the beginning or end
-    lc = lc.dropna(subset=[time_col, flux_col]).reset_index(drop=True)
-    lc_clean = lc.copy()
-
-    # Calculate time differences between consecutive observations
-    lc['time_diff'] = lc[time_col].diff()
-
-    #############################################
-    # Define a function to interpolate small gaps
-    approx_time_step = lc[time_col].diff().median()
-
-    # Identify gaps larger than the threshold
-    gaps = lc[((approx_time_step*1.95) < lc['time_diff']) & (lc['time_diff'] < gap_threshold)]
-
-    # Initialize the output DataFrame
-    filled_lc = lc.copy()
-
-    #  Iterate over each gap and fill it
-    for idx in gaps.index:
-        # Start and end of the gap
-        start_time = lc.loc[idx - 1, time_col]
-        end_time = lc.loc[idx, time_col]
-        start_flux = lc.loc[idx - 1, flux_col]
-        end_flux = lc.loc[idx, flux_col]
-        
-        # Generate new time points within the gap
-        new_times = np.arange(start_time + approx_time_step, end_time, approx_time_step)
-        if len(new_times) > 0:
-            # Linearly interpolate flux values for the new times
-            new_fluxes = np.interp(new_times, [start_time, end_time], [start_flux, end_flux])
-            
-            # Create a DataFrame for the new points
-            new_points = pd.DataFrame({time_col: new_times, flux_col: new_fluxes})
-            
-            # Insert the new points into the DataFrame
-            filled_lc = pd.concat([filled_lc, new_points]).sort_values(by=time_col).reset_index(drop=True)
-
-    # Drop the time_diff column and display the result
-    filled_lc = filled_lc.drop(columns=['time_diff'])
-
-
-    # Apply 4-sigma clipping
-    flux_median = filled_lc['PDCSAP_FLUX'].median()
-    flux_std = filled_lc['PDCSAP_FLUX'].std()
-    filled_lc = filled_lc[(filled_lc['PDCSAP_FLUX'] >= flux_median - sigma_clip * flux_std) & (filled_lc['PDCSAP_FLUX'] <= flux_median + sigma_clip * flux_std)]
-
-    t = filled_lc[time_col].values
-    f = filled_lc[flux_col].values
-
-    # Define the width of the window for local normalization
-    width = 10  # Adjust this value as needed
-
-    # Initialize an array to store the normalized flux
-    f_normalized = np.full_like(f, np.nan)
-
-    # Perform local normalization using vectorized operations
-    for j in range(len(t)):
-        if not np.isnan(f[j]):
-            # Determine the window of indices within the specified width
-            mask = np.abs(t - t[j]) <= width
-            if np.any(mask):
-                f_normalized[j] = f[j] / np.nanmedian(f[mask])
-
-    # Second normalization
-    f_double_normalized = np.full_like(f_normalized, np.nan)
-    for j in range(len(t)):
-        if not np.isnan(f_normalized[j]):
-            # Determine the window of indices within the specified width
-            mask = np.abs(t - t[j]) <= width
-            if np.any(mask):
-                f_double_normalized[j] = f_normalized[j] / np.nanmedian(f_normalized[mask])
-
-    # Combine the time and double-normalized flux into a single array
-    result = np.column_stack((t, f_double_normalized))
-
-    # Save the processed lightcurve
-    original_name = os.path.basename(file_path)
-    new_name = f"{original_name[:6]}fill_sigclip_hipass_{original_name[6:]}"
-    output_path = os.path.join(output_dir, new_name)
-    pd.DataFrame(result).to_csv(output_path, index=False)
+    def compute():
+        with track_phase(metrics, 'load'):
+            lc = load_raw_lightcurve(file_path)
+        return clean_lightcurve(lc, metrics=metrics, **params)
+
+    with track_item(metrics, 'process_lightcurve', file_path):
+        if streaming:
+            from streaming import stream_process_lightcurve
+            return stream_process_lightcurve(file_path, output_dir, gap_threshold, sigma_clip, filter_window,
+                                             output_format, chunk_days=chunk_days, flux_dtype=flux_dtype,
+                                             metrics=metrics)
+
+        # Load the light curve data, then gap filling, sigma clipping and normalization
+        params = {'gap_threshold': gap_threshold, 'sigma_clip': sigma_clip, 'filter_window': filter_window}
+        lc = _cached_process(cache, file_path, params, compute)
+
+        # Save the processed lightcurve
+        output_path = os.path.join(output_dir, processed_name(os.path.basename(file_path)))
+        with track_phase(metrics, 'write'):
+            return save_processed(output_path, lc, output_format, _processed_metadata(file_path, params, lc.meta.n_filled))
+
+def _processed_metadata(file_path, params, n_filled):
+    """
+    Header metadata of a processed .lcb file (also written by streaming.py and
+    run_pipeline.py, so that every mode writes the same header).
+    """
+    return dict({'source': os.path.basename(file_path)}, **params, n_filled=n_filled)
 
-    return output_path
+def sweep_path(file_path, output_dir, params, output_format='csv'):
+    """Path sweep_lightcurve writes the output of one parameter set to: output_dir/<sweep_tag>/<processed name>."""
+    return processed_path(file_path, os.path.join(output_dir, sweep_tag(params)), output_format)
 
-def batch_process_lightcurves(input_dir, output_dir, n_jobs=4, **kwargs):
+def sweep_lightcurve(file_path, output_dir, grid, output_format='csv', cache=None, metrics=None):
+    """
+    process_lightcurve for every parameter set of a sweep, loading the raw
+    file once and sharing the stages the sets have in common (see
+    sweep_clean_lightcurve).
+
+    Parameters:
+        file_path (str): Path to the raw lightcurve file.
+        output_dir (str): Directory of the sweep; each parameter set is written
+            to its own subdirectory named by sweep_tag, which can be given to
+            STEP2 as is.
+        grid (list): Parameter sets, e.g. from parameter_grid.
+        output_format (str): 'csv' (default) or 'binary'.
+        cache (ResultCache): Optional cache, with the same entries as
+            process_lightcurve; the file is not loaded if every set is cached.
+        metrics (Metrics): Optional instrumentation; the file is recorded as
+            one item of stage sweep_lightcurve.
+
+    Returns:
+        list: Output paths, in grid order.
+    """
+    with track_item(metrics, 'sweep_lightcurve', file_path):
+        keys = [None] * len(grid)
+        results = [None] * len(grid)
+        if cache is not None:
+            for i, params in enumerate(grid):
+                keys[i] = _process_cache_key(cache, file_path, params)
+                cached = cache.get(keys[i])
+                if cached is not None:
+                    results[i] = LightCurve.from_arrays(cached)
+
+        missing = [i for i in range(len(grid)) if results[i] is None]
+        if missing:
+            with track_phase(metrics, 'load'):
+                lc = load_raw_lightcurve(file_path)
+            cleaned = sweep_clean_lightcurve(lc, [grid[i] for i in missing], metrics=metrics)
+            for i, (_, result) in zip(missing, cleaned):
+                results[i] = result
+                if cache is not None:
+                    cache.put(keys[i], result.to_arrays())
+
+        output_paths = []
+        with track_phase(metrics, 'write'):
+            for params, lc in zip(grid, results):
+                output_path = sweep_path(file_path, output_dir, params, output_format)
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                output_paths.append(save_processed(output_path, lc, output_format,
+                                                   _processed_metadata(file_path, params, lc.meta.n_filled)))
+        return output_paths
+
+def process_lightcurves_pipelined(file_paths, output_dir, time_col='TIME', flux_col='PDCSAP_FLUX',
+                                  gap_threshold=1.5 / 24, sigma_clip=4, filter_window=10, output_format='csv',
+                                  cache=None, metrics=None, queue=None, prefetch=4, write_behind=4, io_threads=2):
+    """
+    process_lightcurve for many files, with the loading (and cache lookups)
+    of upcoming files and the writing of finished ones in background threads,
+    overlapping the cleaning (see pipelined.py).
+
+    Parameters:
+        file_paths (list): Raw lightcurve files.
+        output_dir, time_col, flux_col, gap_threshold, sigma_clip,
+        filter_window, output_format, cache: As in process_lightcurve.
+        metrics (Metrics): Optional instrumentation; each file is recorded as
+            items of the stages process_lightcurve/load, process_lightcurve
+            (the cleaning) and process_lightcurve/write.
+        queue (WorkQueue): Claim each file before loading it (see sharding.py).
+        prefetch (int): Loaded files that may wait for the cleaning.
+        write_behind (int): Processed lightcurves that may wait for writing.
+        io_threads (int): Number of reader threads (one writer thread is used).
+
+    Yields:
+        tuple: (file_path, output_path, error) in completion order;
+        output_path and error are both None for files claimed by another worker.
+    """
+    params = {'gap_threshold': gap_threshold, 'sigma_clip': sigma_clip, 'filter_window': filter_window}
+
+    def load(fp):
+        if queue is not None and not queue.claim(os.path.basename(fp)):
+            return None
+        with track_item(metrics, 'process_lightcurve/load', fp):
+            key = None
+            if cache is not None:
+                key = _process_cache_key(cache, fp, params)
+                cached = cache.get(key)
+                if cached is not None:
+                    return key, LightCurve.from_arrays(cached), True
+            return key, load_raw_lightcurve(fp), False
+
+    def compute(fp, loaded):
+        if loaded is None:
+            return None
+        key, lc, is_cached = loaded
+        if not is_cached:
+            with track_item(metrics, 'process_lightcurve', fp):
+                lc = clean_lightcurve(lc, metrics=metrics, **params)
+        return key, lc, is_cached
+
+    def write(fp, result):
+        if result is None:
+            return None
+        key, lc, is_cached = result
+        with track_item(metrics, 'process_lightcurve/write', fp):
+            if key is not None and not is_cached:
+                cache.put(key, lc.to_arrays())
+            output_path = save_processed(processed_path(fp, output_dir, output_format), lc, output_format,
+                                         _processed_metadata(fp, params, lc.meta.n_filled))
+        if queue is not None:
+            queue.complete(os.path.basename(fp))
+        return output_path
+
+    for fp, output_path, error in run_pipelined(file_paths, load, compute, write, prefetch=prefetch,
+                                                write_behind=write_behind, n_readers=io_threads):
+        if error is not None and queue is not None:
+            queue.release(os.path.basename(fp))
+        yield fp, output_path, error
+
+def process_lightcurves_ragged(file_paths, output_dir, time_col='TIME', flux_col='PDCSAP_FLUX',
+                               gap_threshold=1.5 / 24, sigma_clip=4, filter_window=10, output_format='csv',
+                               cache=None, metrics=None, queue=None, io_threads=4):
+    """
+    process_lightcurve for a batch of (typically short) files as one ragged
+    batch: the files are read into concatenated arrays with lc_io.load_many,
+    cleaned together by clean_lightcurves_ragged and split back into one
+    output per file, so the per-file overhead is paid once per batch.
+
+    Parameters:
+        file_paths (list): Raw lightcurve files.
+        output_dir, time_col, flux_col, gap_threshold, sigma_clip,
+        filter_window, output_format, cache: As in process_lightcurve.
+        metrics (Metrics): Optional instrumentation; the batch is recorded
+            as one item of stage process_lightcurves_ragged.
+        queue (WorkQueue): Claim each file before loading it (see sharding.py).
+        io_threads (int): Number of reader threads of load_many.
+
+    Yields:
+        tuple: (file_path, output_path, error) in input order; output_path and
+        error are both None for files claimed by another worker. If a file of
+        the batch cannot be read, the files are processed one by one.
+    """
+    params = {'gap_threshold': gap_threshold, 'sigma_clip': sigma_clip, 'filter_window': filter_window}
+    file_paths = list(file_paths)
+    if not file_paths:
+        return
+
+    with track_item(metrics, 'process_lightcurves_ragged', os.path.basename(file_paths[0])):
+        record(metrics, n_files=len(file_paths))
+        claimed = [fp for fp in file_paths if queue is None or queue.claim(os.path.basename(fp))]
+        results = {}
+        keys = {}
+        if cache is not None:
+            for fp in claimed:
+                keys[fp] = _process_cache_key(cache, fp, params)
+                cached = cache.get(keys[fp])
+                if cached is not None:
+                    results[fp] = LightCurve.from_arrays(cached)
+
+        missing = [fp for fp in claimed if fp not in results]
+        errors = {}
+        if missing:
+            try:
+                with track_phase(metrics, 'load'):
+                    time, flux, offsets = load_many(missing, n_threads=io_threads, time_col=0, flux_col=2)
+            except (OSError, ValueError) as e:
+                # A file of the batch cannot be read (parser errors are ValueErrors): find it file by file
+                print(f"Cannot read the batch starting with {os.path.basename(missing[0])} "
+                      f"({type(e).__name__}: {e}), processing its files one by one")
+                offsets = None
+            if offsets is None:
+                for fp in missing:
+                    try:
+                        with track_phase(metrics, 'load'):
+                            lc = load_raw_lightcurve(fp)
+                        results[fp] = clean_lightcurve(lc, metrics=metrics, **params)
+                    except Exception as e:
+                        errors[fp] = f"{type(e).__name__}: {e}"
+            else:
+                t, f, offsets, n_filled = clean_lightcurves_ragged(time, flux, offsets, metrics=metrics, **params)
+                for i, fp in enumerate(missing):
+                    meta = LightCurveMeta.from_file_name(fp).copy(n_filled=n_filled[i])
+                    results[fp] = LightCurve(t[offsets[i]:offsets[i + 1]], f[offsets[i]:offsets[i + 1]], meta=meta)
+
+        computed = set(missing)
+        outputs = {}
+        with track_phase(metrics, 'write'):
+            for fp in claimed:
+                if fp in errors:
+                    continue
+                try:
+                    lc = results[fp]
+                    if fp in keys and fp in computed:
+                        cache.put(keys[fp], lc.to_arrays())
+                    outputs[fp] = save_processed(processed_path(fp, output_dir, output_format), lc, output_format,
+                                                 _processed_metadata(fp, params, lc.meta.n_filled))
+                except Exception as e:
+                    errors[fp] = f"{type(e).__name__}: {e}"
+
+    for fp in file_paths:
+        if fp in outputs:
+            if queue is not None:
+                queue.complete(os.path.basename(fp))
+            yield fp, outputs[fp], None
+        elif fp in errors:
+            if queue is not None:
+                queue.release(os.path.basename(fp))
+            yield fp, None, errors[fp]
+        else:
+            yield fp, None, None
+
+def _process_chunk(file_paths, output_dir, kwargs, queue=None, pipeline=None, sweep=None, ragged=None):
+    """
+    Process a chunk of files inside one worker.
+
+    A failure in one file is caught and reported in the results instead of
+    aborting the chunk. With a WorkQueue, files claimed by another worker are
+    skipped (output_path and error both None). pipeline is None or the
+    prefetch/write_behind/io_threads settings of process_lightcurves_pipelined.
+    With a sweep grid, files go through sweep_lightcurve and output_path is
+    the list of its outputs. ragged is None or the io_threads setting of
+    process_lightcurves_ragged, which then processes the chunk as one batch.
+    Returns (worker_name, [(file_path, output_path, error), ...]).
+    """
+    worker = multiprocessing.current_process().name
+    if worker == 'MainProcess':
+        worker = threading.current_thread().name
+
+    # The batch modes take the options of process_lightcurve except the streaming ones
+    batch_kwargs = {k: v for k, v in kwargs.items() if k not in ('streaming', 'chunk_days', 'flux_dtype')}
+    if ragged:
+        return worker, list(process_lightcurves_ragged(file_paths, output_dir, queue=queue, **ragged, **batch_kwargs))
+
+    if pipeline and not kwargs.get('streaming'):
+        return worker, list(process_lightcurves_pipelined(file_paths, output_dir, queue=queue, **pipeline,
+                                                          **batch_kwargs))
+
+    if sweep:
+        sweep_kwargs = {k: kwargs[k] for k in ('output_format', 'cache', 'metrics') if k in kwargs}
+        run = lambda fp: sweep_lightcurve(fp, output_dir, sweep, **sweep_kwargs)
+    else:
+        run = lambda fp: process_lightcurve(fp, output_dir, **kwargs)
+
+    results = []
+    for fp in file_paths:
+        try:
+            _, output_path = claim_and_run(queue, os.path.basename(fp), lambda: run(fp))
+            results.append((fp, output_path, None))
+        except Exception as e:
+            results.append((fp, None, f"{type(e).__name__}: {e}"))
+    return worker, results
+
+
+def batch_process_lightcurves(input_dir, output_dir, n_jobs=4, executor='process', chunksize=None, catalog=None,
+                              shard=None, queue=None, resume=False, prefetch=0, write_behind=0, io_threads=2,
+                              sweep=None, ragged=False, **kwargs):
     """
     Batch process lightcurves in a directory using multiprocessing.
 
+    Files are submitted to the workers in chunks, dealt out largest first so
+    that every chunk gets a similar mix of sizes and the biggest lightcurves
+    do not end up as stragglers in one worker. A file
+    that fails is reported and skipped; the rest of the batch continues.
+    If kwargs contain metrics (see instrumentation.py), a summary table is
+    printed at the end.
+
     Parameters:
         input_dir (str): Directory containing input lightcurve files.
         output_dir (str): Directory to save processed lightcurve files.
         n_jobs (int): Number of parallel processes to use.
+        executor (str): 'process' (process pool), 'thread' (thread pool) or
+            'serial' (no pool, useful for benchmarking and debugging).
+        chunksize (int): Maximum files per submitted task. Default splits the
+            batch into about 4 chunks per worker.
+        catalog (Catalog): Optional file catalog (see catalog.py); the job
+            list and file sizes come from it instead of listing and stat-ing
+            input_dir.
+        shard (str): "i/N" to process only the targets of shard i of N
+            (see sharding.py).
+        queue (WorkQueue): Claim each file in this shared queue before
+            processing it, so several runs can share the batch.
+        resume (bool): Skip files whose output already exists.
+        prefetch (int): If > 0 (or write_behind > 0), each worker loads up to
+            prefetch files ahead and writes results in the background while
+            it computes (see process_lightcurves_pipelined). Default is 0 (off).
+        write_behind (int): Processed files that may wait for writing.
+        io_threads (int): Reader threads per worker in pipelined mode.
+        sweep (list): Parameter sets (see parameter_grid) to process every
+            file with, loading it once (see sweep_lightcurve). The outputs of
+            each set go to output_dir/<sweep_tag>; gap_threshold, sigma_clip
+            and filter_window in kwargs are ignored. Default is a single run.
+        ragged (bool): Clean each chunk of files as one ragged batch with
+            vectorized kernels (see process_lightcurves_ragged), which pays
+            off for many short lightcurves; chunksize is the batch size.
 
     Returns:
-        list: List of processed file paths.
+        list: List of processed file paths (in sweep mode, every output of
+        every file).
     """
+    if executor not in ('process', 'thread', 'serial'):
+        raise ValueError(f"Unknown executor '{executor}', expected 'process', 'thread' or 'serial'")
+    if sweep and (kwargs.get('streaming') or prefetch > 0 or write_behind > 0):
+        raise ValueError("A parameter sweep cannot be combined with streaming or pipelined I/O")
+    if ragged and (sweep or kwargs.get('streaming') or prefetch > 0 or write_behind > 0):
+        raise ValueError("Ragged batches cannot be combined with a sweep, streaming or pipelined I/O")
+
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    file_paths = [os.path.join(input_dir, f) for f in os.listdir(input_dir) if f.endswith('.txt')]
-
-    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
-        results = list(executor.map(lambda fp: process_lightcurve(fp, output_dir, **kwargs), file_paths))
-
-    return results
-
-if __name__ == "__main__":
-    import argparse
-
-    parser = argparse.ArgumentParser(description="Batch process lightcurves with gap filling and signal filtering.")
-    parser.add_argument("input_dir", type=str, help="Directory containing input lightcurve files.")
-    parser.add_argument("output_dir", type=str, help="Directory to save processed lightcurve files.")
+    # Largest files first
+    if catalog is not None:
+        catalog.update(input_dir)
+        rows = catalog.files(input_dir, order_by='size')
+        file_paths = [row['path'] for row in reversed(rows)]
+    else:
+        file_paths = [os.path.join(input_dir, f) for f in os.listdir(input_dir) if f.endswith(('.txt', BINARY_EXTENSION))]
+        file_paths.sort(key=os.path.getsize, reverse=True)
+
+    if shard is not None:
+        shard = parse_shard(shard)
+        file_paths = [fp for fp in file_paths if in_shard(os.path.basename(fp)[:5], shard)]
+    if resume:
+        output_format = kwargs.get('output_format', 'csv')
+        n_before = len(file_paths)
+        if sweep:
+            file_paths = [fp for fp in file_paths
+                          if not all(os.path.exists(sweep_path(fp, output_dir, params, output_format))
+                                     for params in sweep)]
+        else:
+            file_paths = [fp for fp in file_paths
+                          if not os.path.exists(processed_path(fp, output_dir, output_format))]
+        print(f"Resuming: {n_before - len(file_paths)} of {n_before} files already processed")
+
+    if chunksize is None:
+        chunksize = max(1, -(-len(file_paths) // (4 * n_jobs)))
+    # Deal the files out round-robin, so every chunk gets its share of the
+    # largest ones (contiguous slices would put them all in the first chunk)
+    n_chunks = -(-len(file_paths) // chunksize)
+    chunks = [file_paths[i::n_chunks] for i in range(n_chunks)]
+
+    pipeline = None
+    if prefetch > 0 or write_behind > 0:
+        pipeline = {'prefetch': prefetch, 'write_behind': write_behind, 'io_threads': io_threads}
+    ragged = {'io_threads': io_threads} if ragged else None
+
+    outputs = {}
+    failures = []
+    skipped = []
+    worker_counts = {}
+    n_done = 0
+
+    def report(worker, results):
+        nonlocal n_done
+        for fp, output_path, error in results:
+            n_done += 1
+            if error is None and output_path is None:
+                skipped.append(fp)
+                print(f"[{worker}] ({n_done}/{len(file_paths)}) {os.path.basename(fp)} claimed by another worker, skipped")
+                continue
+            worker_counts[worker] = worker_counts.get(worker, 0) + 1
+            if error is None:
+                outputs[fp] = output_path
+                print(f"[{worker}] ({n_done}/{len(file_paths)}) {os.path.basename(fp)}")
+            else:
+                failures.append((fp, error))
+                print(f"[{worker}] ({n_done}/{len(file_paths)}) FAILED {os.path.basename(fp)}: {error}")
+
+    if executor == 'serial':
+        for chunk in chunks:
+            report(*_process_chunk(chunk, output_dir, kwargs, queue, pipeline, sweep, ragged))
+    else:
+        pool_cls = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        with pool_cls(max_workers=n_jobs) as pool:
+            futures = [pool.submit(_process_chunk, chunk, output_dir, kwargs, queue, pipeline, sweep, ragged)
+                       for chunk in chunks]
+            for future in as_completed(futures):
+                report(*future.result())
+
+    # Claims are tried once more, in case a lock went stale meanwhile (its
+    # owner was killed); files still held belong to a live worker
+    if skipped:
+        retry = list(skipped)
+        skipped.clear()
+        n_done -= len(retry)
+        print(f"Retrying {len(retry)} files claimed by other workers")
+        report(*_process_chunk(retry, output_dir, kwargs, queue, pipeline, sweep, ragged))
+
+    for worker in sorted(worker_counts):
+        print(f"{worker}: {worker_counts[worker]} files")
+    if failures:
+        print(f"{len(failures)} of {len(file_paths)} files failed:")
+        for fp, error in failures:
+            print(f"  {fp}: {error}")
+    if kwargs.get('metrics') is not None:
+        kwargs['metrics'].report()
+
+    if sweep:
+        return [path for fp in file_paths if fp in outputs for path in outputs[fp]]
+    return [outputs[fp] for fp in file_paths if fp in outputs]
+
+def add_arguments(parser):
+    """Add the command-line options of STEP1 to an argparse parser."""
+    parser.add_argument("input_dir", type=str, nargs="?", default=None, help="Directory containing input lightcurve files. Default is raw_dir of the config.")
+    parser.add_argument("output_dir", type=str, nargs="?", default=None, help="Directory to save processed lightcurve files. Default is processed_dir of the config.")
+    parser.add_argument("--config", type=str, default=None, help="JSON file with the data directories (see config.py). Default is $LIGHTCURVEPROCESSOR_CONFIG or ./lightcurveprocessor.json.")
     parser.add_argument("--n_jobs", type=int, default=4, help="Number of parallel processes to use. Default is 4.")
+    parser.add_argument("--executor", choices=["thread", "process", "serial"], default="process", help="Execution mode. Default is 'process'.")
+    parser.add_argument("--chunksize", type=int, default=None, help="Files per submitted task. Default is about 4 chunks per worker.")
     parser.add_argument("--gap_threshold", type=float, default=1.5 / 24, help="Gap threshold in days. Default is 1.5 hours.")
-    parser.add_argument("--sigma_clip", type=float, default=4, help="Sigma threshold for clipping outliers. Default is 5.")
-    parser.add_argument("--filter_window", type=float, default=10, help="Window size for Gaussian filter in days. Default is 10.")
-
-    args = parser.parse_args()
+    parser.add_argument("--sigma_clip", type=float, default=4, help="Sigma threshold for clipping outliers. Default is 4.")
+    parser.add_argument("--filter_window", type=float, default=10, help="Half-width of the running-median normalization window in days. Default is 10.")
+    parser.add_argument("--sweep_gap_threshold", type=float, nargs="+", default=None, help="Parameter sweep: gap thresholds in days to try (replaces --gap_threshold).")
+    parser.add_argument("--sweep_sigma_clip", type=float, nargs="+", default=None, help="Parameter sweep: sigma thresholds to try (replaces --sigma_clip).")
+    parser.add_argument("--sweep_filter_window", type=float, nargs="+", default=None, help="Parameter sweep: normalization half-widths in days to try (replaces --filter_window). "
+                        "With any --sweep_* option, every combination is processed, loading each file once, into output_dir/gap<g>_sig<s>_win<w>.")
+
+    add_cache_arguments(parser)
+    parser.add_argument("--output_format", choices=["csv", "binary"], default="csv", help="Output format: CSV text or binary .lcb container. Default is csv.")
+    parser.add_argument("--catalog", type=str, default=None, help="SQLite file catalog used for the job list (see catalog.py). Default is a directory listing.")
+    parser.add_argument("--prefetch", type=int, default=0, help="Files each worker loads ahead while computing (pipelined I/O). Default is 0 (off).")
+    parser.add_argument("--write_behind", type=int, default=0, help="Results each worker may queue for background writing (pipelined I/O). Default is 0 (off).")
+    parser.add_argument("--io_threads", type=int, default=2, help="Reader threads per worker with --prefetch or --ragged. Default is 2.")
+    parser.add_argument("--ragged", action="store_true", help="Clean each chunk of files as one batch with vectorized kernels (faster for many short lightcurves; --chunksize sets the batch size).")
+    parser.add_argument("--streaming", action="store_true", help="Process each file in memory-bounded chunks (for very long lightcurves). Disables the cache.")
+    parser.add_argument("--chunk_days", type=float, default=None, help="With --streaming, chunk length in days. Default is 4 * filter_window.")
+    parser.add_argument("--float32", action="store_true", help="With --streaming, keep the flux as float32 in the scratch files and output.")
+    add_shard_arguments(parser, item='file')
+    parser.add_argument("--resume", action="store_true", help="Skip files whose output already exists.")
+    add_metrics_arguments(parser, item='file')
+
+def main_from_args(args):
+    """Run STEP1 with options parsed by add_arguments."""
+    if args.input_dir is None or args.output_dir is None:
+        config = load_config(args.config)
+        args.input_dir = args.input_dir or config['raw_dir']
+        args.output_dir = args.output_dir or config['processed_dir']
+
+    cache = cache_from_args(args)
+
+    catalog = None
+    if args.catalog:
+        from catalog import Catalog
+        catalog = Catalog(args.catalog)
+
+    metrics = metrics_from_args(args, 'STEP1')
+
+    sweep = None
+    if args.sweep_gap_threshold or args.sweep_sigma_clip or args.sweep_filter_window:
+        sweep = parameter_grid(args.sweep_gap_threshold or [args.gap_threshold],
+                               args.sweep_sigma_clip or [args.sigma_clip],
+                               args.sweep_filter_window or [args.filter_window])
+        print(f"Parameter sweep over {len(sweep)} sets: {', '.join(sweep_tag(params) for params in sweep)}")
 
     processed_files = batch_process_lightcurves(
         input_dir=args.input_dir,
         output_dir=args.output_dir,
         n_jobs=args.n_jobs,
+        executor=args.executor,
+        chunksize=args.chunksize,
+        catalog=catalog,
+        shard=args.shard,
+        queue=queue_from_args(args),
+        resume=args.resume,
+        prefetch=args.prefetch,
+        write_behind=args.write_behind,
+        io_threads=args.io_threads,
+        sweep=sweep,
+        ragged=args.ragged,
         gap_threshold=args.gap_threshold,
         sigma_clip=args.sigma_clip,
-        filter_window=args.filter_window
+        filter_window=args.filter_window,
+        output_format=args.output_format,
+        cache=cache,
+        metrics=metrics,
+        streaming=args.streaming,
+        chunk_days=args.chunk_days,
+        flux_dtype='float32' if args.float32 else 'float64',
     )
 
     print(f"Processed {len(processed_files)} files. Results saved in {args.output_dir}.")
+
+    if cache is not None and args.cache_stats:
+        cache.report()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Batch process lightcurves with gap filling and signal filtering.")
+    add_arguments(parser)
+    main_from_args(parser.parse_args())
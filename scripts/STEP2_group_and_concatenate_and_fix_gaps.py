@@ -1,12 +1,23 @@
 import os
 import re
 import glob
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import numpy as np
 
-def find_groups(directory):
+from config import load_config
+from lc_io import BINARY_EXTENSION, atomic_write, binary_path, is_binary, load_binary, load_text, save_binary
+from instrumentation import add_metrics_arguments, metrics_from_args, record, track_item, track_phase
+from lightcurve import LightCurve, LightCurveMeta
+from result_cache import add_cache_arguments, cache_from_args, cached_call
+from sharding import add_shard_arguments, claim_and_run, in_shard, parse_shard, queue_from_args
+
+def find_groups(directory, catalog=None):
     """
     Returns a dictionary where the key is (prefix5, exptimeXXXX, mission)
-    and the value is a list of filepaths belonging to that group.
+    and the value is a sorted list of filepaths belonging to that group.
+
+    If a Catalog (see catalog.py) is given, it is updated incrementally and
+    queried instead of globbing and parsing every file name.
 
     We assume filenames contain something like:
       <prefix5>...LK_exptime_XXXX_LK_mission_TESS_Sector_XX_LK_author.txt
@@ -24,7 +35,11 @@ def find_groups(directory):
     #   2) second group: captures TESS or K2 from  LK_mission_(TESS|K2)_
     pattern = re.compile(r'LK_exptime_(\w+)_LK_mission_(TESS|K2)_')
 
-    txt_files = glob.glob(os.path.join(directory, '*.txt'))
+    if catalog is not None:
+        catalog.update(directory)
+        return catalog.groups(directory)
+
+    txt_files = glob.glob(os.path.join(directory, '*.txt')) + glob.glob(os.path.join(directory, '*' + BINARY_EXTENSION))
     groups = {}
 
     for fpath in txt_files:
@@ -43,8 +58,11 @@ def find_groups(directory):
         if key not in groups:
             groups[key] = []
         groups[key].append(fpath)
-        groups[key] = sorted(groups[key])
-    
+
+    # Sort each group once
+    for file_list in groups.values():
+        file_list.sort()
+
     return groups
 
 def parse_sector_campaign_nums(file_list, mission):
@@ -71,123 +89,353 @@ def parse_sector_campaign_nums(file_list, mission):
     
     return sorted(nums)
 
-def concatenate_and_fix_gaps(filepaths, gap_threshold=80.0):
+def read_processed_lightcurve(fpath):
     """
-    Reads each .txt file (columns: time, flux) in filepaths,
-    concatenates them, and fixes large time gaps > gap_threshold
-    by shifting the left segments in a SINGLE pass for performance.
+    Read a processed lightcurve (STEP1 CSV with header "0,1", or binary .lcb).
 
-    Returns (time, flux) as numpy arrays.
+    Returns a LightCurve (empty if the file has no rows) with the metadata
+    of the file name.
     """
-    all_time = []
-    all_flux = []
-
-    # 1) Read each file (skip the header line "0,1")
-    for fpath in filepaths:
-        data = np.genfromtxt(fpath, delimiter=',', skip_header=1)
-        if data.size == 0:
-            print('WARNING file {} empty'.format(fpath))
-            continue
-        all_time.append(data[:,0])
-        all_flux.append(data[:,1])
-    
-    if not all_time:
-        return np.array([]), np.array([])
-    
-    # 2) Concatenate
-    time = np.concatenate(all_time)
-    flux = np.concatenate(all_flux)
-
-    # 3) Sort by time
-    sort_idx = np.argsort(time)
-    time = time[sort_idx]
-    flux = flux[sort_idx]
-
-    # 4) Compute median time step
-    if len(time) > 1:
-        dt_all = np.diff(time)
-        median_dt = np.median(dt_all)
+    if is_binary(fpath):
+        time, flux, _ = load_binary(fpath)
     else:
-        median_dt = 0.0
+        # The header is "0,1", which looks numeric, so it is skipped explicitly
+        time, flux = load_text(fpath, delimiter=',', header=True)
+    return LightCurve(time, flux, meta=LightCurveMeta.from_file_name(fpath))
 
-    # 5) Identify all gap indices where gap > gap_threshold
-    if len(time) > 1:
-        dt = np.diff(time)
-        gap_indices = np.where(dt > gap_threshold)[0]
-    else:
-        gap_indices = np.array([])
+def merge_sorted_segments(lightcurves):
+    """
+    Merge time-sorted lightcurves (their valid rows) into one time-sorted
+    LightCurve.
+
+    Segments are ordered by start time; when they don't overlap (the usual
+    case for separate sectors/campaigns) they are simply concatenated in that
+    order, and the row range of each single-sector input is kept in
+    segments. Otherwise the concatenation is a sequence of sorted runs, which
+    a stable (timsort) argsort merges in O(n log k) for k segments.
+
+    The metadata is the one of the first lightcurve, with the sectors of all
+    of them and the total number of gap-filled points.
+    """
+    segments = []
+    for lc in lightcurves:
+        time, flux = lc.valid()
+        if len(time) > 1 and np.any(time[1:] < time[:-1]):
+            order = np.argsort(time, kind='stable')
+            time, flux = time[order], flux[order]
+        if len(time):
+            segments.append((time, flux, lc.meta.sectors))
+    meta = LightCurveMeta() if not lightcurves else lightcurves[0].meta.copy(
+        sectors=sorted({n for lc in lightcurves for n in lc.meta.sectors}),
+        n_filled=sum(lc.meta.n_filled for lc in lightcurves), source=None,
+    )
+    if not segments:
+        return LightCurve(np.array([]), np.array([]), meta=meta)
+
+    segments.sort(key=lambda seg: seg[0][0])
+    time = np.concatenate([seg[0] for seg in segments])
+    flux = np.concatenate([seg[1] for seg in segments])
+
+    overlapping = any(nxt[0][0] < prev[0][-1] for prev, nxt in zip(segments[:-1], segments[1:]))
+    bounds = None
+    if overlapping:
+        order = np.argsort(time, kind='stable')
+        time, flux = time[order], flux[order]
+    elif all(len(seg[2]) == 1 for seg in segments):
+        stops = np.cumsum([len(seg[0]) for seg in segments])
+        bounds = [(seg[2][0], stop - len(seg[0]), stop) for seg, stop in zip(segments, stops)]
+
+    return LightCurve(time, flux, meta=meta, segments=bounds)
+
+def merge_and_fix_gaps(lightcurves, gap_threshold=80.0):
+    """
+    In-memory core of concatenate_and_fix_gaps: merges the time-sorted
+    lightcurves and closes large time gaps > gap_threshold.
+
+    Shift semantics: every gap larger than gap_threshold is collapsed to one
+    median time step. The last segment keeps its times; each earlier point
+    is shifted forward by the sum of (gap - median_dt) over all large gaps
+    after it. The output stays sorted, and consecutive segments end up
+    separated by exactly median_dt.
+
+    Returns a LightCurve; meta.shifts holds the offset of each piece between
+    large gaps (empty if nothing was shifted).
+    """
+    # 1) Merge the pre-sorted segments
+    merged = merge_sorted_segments(lightcurves)
+    time, flux = merged.time, merged.flux
+    if len(time) < 2:
+        return merged
+
+    # 2) Median time step and large gaps
+    dt = np.diff(time)
+    median_dt = np.median(dt)
+    gap_indices = np.nonzero(dt > gap_threshold)[0]
 
     if len(gap_indices) == 0:
         # No large gaps found
-        is_shifted = False
-        return time, flux, is_shifted
-
-    # 6) Apply shifts to segments left of each gap in one pass
-    total_shift = 0.0  # Track cumulative shift
-    new_time = time.copy()  # Create a new array for modified time
-
-    for i in gap_indices:
-        gap_size = time[i+1] - time[i]
-        if gap_size > gap_threshold:
-            total_shift += gap_size + median_dt
-            # Apply the total shift to all times up to index i
-            new_time[:i+1] += total_shift
-            is_shifted = True
-    return new_time, flux, is_shifted
-
-def main():
-    directory = "/Users/creyes/Projects/harps/processed_lightcurves"
-    new_directory = "/Users/creyes/Projects/harps/concatenated_lightcurves"
-    gap_threshold = 80.0
+        return merged
 
-    # 1) Group files by (prefix5, exptimeXXXX, mission)
-    grouped_files = find_groups(directory)
+    # 3) Shift of each point = sum of (gap - median_dt) over the gaps to its
+    #    right, applied in one vectorized pass
+    excess = np.zeros(len(time))
+    excess[gap_indices] = dt[gap_indices] - median_dt
+    shift = np.cumsum(excess[::-1])[::-1]
+    piece_starts = np.concatenate([[0], gap_indices + 1])
 
-    # 2) For each group, parse sector/campaign numbers, fix gaps, and write output
-    for (prefix5, exptime_val, mission), file_list in grouped_files.items():
-        if not file_list:
-            continue
+    return LightCurve(time + shift, flux, meta=merged.meta.copy(shifts=shift[piece_starts]),
+                      segments=merged.segments)
 
-        # Get all sector/campaign numbers from these files
-        sc_nums = parse_sector_campaign_nums(file_list, mission)  # sorted list
+def concatenate_and_fix_gaps(filepaths, gap_threshold=80.0, cache=None, metrics=None):
+    """
+    Reads each .txt (columns: time, flux) or binary .lcb file in filepaths,
+    concatenates them, and fixes large time gaps > gap_threshold
+    by shifting the left segments in a SINGLE pass for performance.
 
-        # Concatenate & fix gaps
-        final_time, final_flux, is_shifted = concatenate_and_fix_gaps(file_list, gap_threshold=gap_threshold)
-        if len(final_time) == 0:
-            print(f"No valid data for group ({prefix5}, {exptime_val}, {mission}), skipping.")
-            continue
+    If a ResultCache is given, the result is reused as long as the input
+    files, gap_threshold and code are unchanged. If Metrics are given, the
+    load and merge_and_fix_gaps phases and the row counts are recorded.
 
-        # Build the "Sectors_XX_XX" or "Campaigns_XX_XX" string
-        if mission == "TESS":
-            # e.g. "Sectors_31_32_45"
-            sc_string = "Sectors_" + "_".join(str(num) for num in sc_nums)
-        else:  # mission == "K2"
-            # e.g. "Campaigns_06_07"
-            sc_string = "Campaigns_" + "_".join(str(num) for num in sc_nums)
+    Returns a LightCurve (see merge_and_fix_gaps).
+    """
+    def compute():
+        lightcurves = []
 
-        # Construct output filename
-        if is_shifted:
-            shifted_flag = 'IS_'
-        else:
-            shifted_flag = 'NOT_'
+        # 1) Read each file (skip the header line "0,1")
+        with track_phase(metrics, 'load'):
+            for fpath in filepaths:
+                lc = read_processed_lightcurve(fpath)
+                if len(lc) == 0:
+                    print('WARNING file {} empty'.format(fpath))
+                    continue
+                lightcurves.append(lc)
 
-        out_name = (
-            f"{prefix5}_LK_exptime_{exptime_val}_LK_mission_{sc_string}_{shifted_flag}SHIFTED_CONCATENATED.txt"
-        )
-        out_path = os.path.join(new_directory, out_name)
+        with track_phase(metrics, 'merge_and_fix_gaps'):
+            result = merge_and_fix_gaps(lightcurves, gap_threshold=gap_threshold)
+        record(metrics, n_files=len(filepaths), rows_in=sum(len(lc) for lc in lightcurves))
+        return result.to_arrays()
 
-        # Save final data
-        header_str = "TIME,FLUX"
+    lc = LightCurve.from_arrays(cached_call(cache, 'concatenate_and_fix_gaps', list(filepaths),
+                                            {'gap_threshold': gap_threshold}, compute,
+                                            code=(merge_and_fix_gaps, LightCurve)))
+    record(metrics, rows_out=len(lc), is_shifted=lc.meta.is_shifted)
+    return lc
+
+def concatenated_name(prefix5, exptime_val, mission, sc_nums, is_shifted):
+    """Output filename of a concatenated group."""
+    # Build the "Sectors_XX_XX" or "Campaigns_XX_XX" string
+    if mission == "TESS":
+        # e.g. "Sectors_31_32_45"
+        sc_string = "Sectors_" + "_".join(str(num) for num in sc_nums)
+    else:  # mission == "K2"
+        # e.g. "Campaigns_06_07"
+        sc_string = "Campaigns_" + "_".join(str(num) for num in sc_nums)
+
+    if is_shifted:
+        shifted_flag = 'IS_'
+    else:
+        shifted_flag = 'NOT_'
+
+    return f"{prefix5}_LK_exptime_{exptime_val}_LK_mission_{sc_string}_{shifted_flag}SHIFTED_CONCATENATED.txt"
+
+def save_concatenated(out_path, lc, output_format="csv", metadata=None):
+    """
+    Save the valid rows of a concatenated LightCurve as "TIME,FLUX" CSV or as
+    a binary .lcb container, in which case the extension of out_path is
+    replaced. The binary metadata also gets the row ranges of the
+    sectors/campaigns (lc.segments) when they are known.
+
+    Returns the path of the written file.
+    """
+    lc = lc.compress()
+    time, flux = lc.time, lc.flux
+    if output_format == "binary":
+        if lc.segments is not None:
+            metadata = dict(metadata or {}, segments=[list(s) for s in lc.segments])
+        return save_binary(binary_path(out_path), time, flux, metadata=metadata)
+
+    header_str = "TIME,FLUX"
+    with atomic_write(out_path) as tmp_path:
         np.savetxt(
-            out_path,
-            np.column_stack([final_time, final_flux]),
+            tmp_path,
+            np.column_stack([time, flux]),
             fmt="%.10f",
             delimiter=",",
             header=header_str,
             comments=""
         )
+    return out_path
+
+def _concatenated_metadata(key, sc_nums, is_shifted, gap_threshold):
+    """
+    Header metadata of a concatenated .lcb file (also written by
+    run_pipeline.py, so that both write the same header).
+    """
+    prefix5, exptime_val, mission = key
+    return {
+        "prefix5": prefix5,
+        "exptime": exptime_val,
+        "mission": mission,
+        "sectors": sc_nums,
+        "is_shifted": is_shifted,
+        "gap_threshold": gap_threshold,
+    }
+
+def concatenate_group(key, file_list, new_directory, gap_threshold=80.0, output_format="csv", cache=None,
+                      metrics=None):
+    """
+    Concatenate one (prefix5, exptimeXXXX, mission) group and write it to
+    new_directory. Returns the output path, or None if the group has no data.
+    """
+    prefix5, exptime_val, mission = key
+
+    with track_item(metrics, 'concatenate_group', "_".join(key)):
+        # Get all sector/campaign numbers from these files
+        sc_nums = parse_sector_campaign_nums(file_list, mission)  # sorted list
+
+        # Concatenate & fix gaps
+        lc = concatenate_and_fix_gaps(file_list, gap_threshold=gap_threshold, cache=cache, metrics=metrics)
+        if len(lc) == 0:
+            return None
+
+        # Construct output filename
+        out_name = concatenated_name(prefix5, exptime_val, mission, sc_nums, lc.meta.is_shifted)
+        out_path = os.path.join(new_directory, out_name)
+
+        # Save final data
+        with track_phase(metrics, 'write'):
+            return save_concatenated(out_path, lc, output_format,
+                                     _concatenated_metadata(key, sc_nums, lc.meta.is_shifted, gap_threshold))
+
+def concatenated_exists(key, file_list, new_directory, output_format="csv"):
+    """True if the output of a group exists (shifted or not)."""
+    prefix5, exptime_val, mission = key
+    sc_nums = parse_sector_campaign_nums(file_list, mission)
+    for is_shifted in (True, False):
+        out_path = os.path.join(new_directory, concatenated_name(prefix5, exptime_val, mission, sc_nums, is_shifted))
+        if os.path.exists(binary_path(out_path) if output_format == "binary" else out_path):
+            return True
+    return False
+
+def _concatenate_group_safe(key, file_list, kwargs, queue=None):
+    """
+    Worker entry point: concatenate one group, reporting a failure instead of
+    raising. Returns (key, claimed, out_path, error); claimed is False if the
+    group is claimed by another worker of the queue.
+    """
+    try:
+        claimed, out_path = claim_and_run(queue, "_".join(key), lambda: concatenate_group(key, file_list, **kwargs))
+        return key, claimed, out_path, None
+    except Exception as e:
+        return key, True, None, f"{type(e).__name__}: {e}"
+
+def main(directory=None, new_directory=None, gap_threshold=80.0, output_format="csv", cache=None, n_jobs=4,
+         executor="serial", catalog=None, metrics=None, shard=None, queue=None, resume=False, config=None):
+    """
+    Concatenate every group of directory into new_directory.
+
+    The directories default to processed_dir and concatenated_dir of config
+    (a dict from config.load_config, loaded if not given).
+
+    shard ("i/N") restricts the run to the targets of one shard, queue (a
+    WorkQueue) makes the groups be claimed from a queue shared with other
+    runs, and resume skips groups whose output already exists (see
+    sharding.py).
+    """
+
+    if directory is None or new_directory is None:
+        config = config or load_config()
+        directory = directory or config['processed_dir']
+        new_directory = new_directory or config['concatenated_dir']
+    os.makedirs(new_directory, exist_ok=True)
+
+    # 1) Group files by (prefix5, exptimeXXXX, mission)
+    grouped_files = find_groups(directory, catalog=catalog)
+    tasks = [(key, file_list) for key, file_list in grouped_files.items() if file_list]
+    if shard is not None:
+        shard = parse_shard(shard)
+        tasks = [(key, file_list) for key, file_list in tasks if in_shard(key[0], shard)]
+    if resume:
+        n_before = len(tasks)
+        tasks = [(key, file_list) for key, file_list in tasks
+                 if not concatenated_exists(key, file_list, new_directory, output_format)]
+        print(f"Resuming: {n_before - len(tasks)} of {n_before} groups already concatenated")
+
+    # 2) For each group, parse sector/campaign numbers, fix gaps, and write output
+    kwargs = dict(new_directory=new_directory, gap_threshold=gap_threshold, output_format=output_format, cache=cache,
+                  metrics=metrics)
+
+    skipped = []
 
-        print(f"Saved: {out_path}")
+    def report(key, claimed, out_path, error):
+        if not claimed:
+            skipped.append(key)
+            print(f"Group {key} claimed by another worker, skipping.")
+        elif error is not None:
+            print(f"Error processing group {key}: {error}")
+        elif out_path is None:
+            print(f"No valid data for group {key}, skipping.")
+        else:
+            print(f"Saved: {out_path}")
+
+    if executor == "serial":
+        for key, file_list in tasks:
+            report(*_concatenate_group_safe(key, file_list, kwargs, queue))
+    else:
+        pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+        with pool_cls(max_workers=n_jobs) as pool:
+            futures = [pool.submit(_concatenate_group_safe, key, file_list, kwargs, queue) for key, file_list in tasks]
+            for future in as_completed(futures):
+                report(*future.result())
+
+    # Claims are tried once more, in case a lock went stale meanwhile (its
+    # owner was killed); groups still held belong to a live worker
+    if skipped:
+        retry = set(skipped)
+        skipped.clear()
+        print(f"Retrying {len(retry)} groups claimed by other workers")
+        for key, file_list in tasks:
+            if key in retry:
+                report(*_concatenate_group_safe(key, file_list, kwargs, queue))
+
+    if metrics is not None:
+        metrics.report()
+
+def add_arguments(parser):
+    """Add the command-line options of STEP2 to an argparse parser."""
+    parser.add_argument("--config", type=str, default=None, help="JSON file with the data directories (see config.py). Default is $LIGHTCURVEPROCESSOR_CONFIG or ./lightcurveprocessor.json.")
+    parser.add_argument("--gap_threshold", type=float, default=80.0, help="Gaps longer than this many days are shortened to the median time step. Default is 80.")
+    parser.add_argument("--output_format", choices=["csv", "binary"], default="csv", help="Output format: CSV text or binary .lcb container. Default is csv.")
+    parser.add_argument("--n_jobs", type=int, default=4, help="Number of parallel processes to use. Default is 4.")
+    parser.add_argument("--executor", choices=["thread", "process", "serial"], default="serial", help="Execution mode. Default is 'serial'.")
+    add_cache_arguments(parser)
+    parser.add_argument("--catalog", type=str, default=None, help="SQLite file catalog used for grouping (see catalog.py). Default is a directory scan.")
+    add_shard_arguments(parser, item='group')
+    parser.add_argument("--resume", action="store_true", help="Skip groups whose output already exists.")
+    add_metrics_arguments(parser, item='group')
+
+def main_from_args(args):
+    """Run STEP2 with options parsed by add_arguments."""
+    cache = cache_from_args(args)
+
+    catalog = None
+    if args.catalog:
+        from catalog import Catalog
+        catalog = Catalog(args.catalog)
+
+    metrics = metrics_from_args(args, 'STEP2')
+
+    queue = queue_from_args(args)
+    main(gap_threshold=args.gap_threshold, output_format=args.output_format, cache=cache, n_jobs=args.n_jobs,
+         executor=args.executor, catalog=catalog, metrics=metrics, shard=args.shard, queue=queue, resume=args.resume,
+         config=load_config(args.config))
+
+    if cache is not None and args.cache_stats:
+        cache.report()
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Group processed lightcurves, concatenate them and close large gaps.")
+    add_arguments(parser)
+    main_from_args(parser.parse_args())
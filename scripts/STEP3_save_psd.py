@@ -1,21 +1,75 @@
 import os
+import math
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
 import numpy as np
-from astropy.timeseries import LombScargle
-import pandas as pd
 
-def define_paths():
-    """Define input and output paths."""
-    input_path = '/Users/creyes/Projects/harps/concatenated_lightcurves'
-    output_path = '/Users/creyes/Projects/harps/psd'
+from config import load_config
+from lc_io import BINARY_EXTENSION, atomic_write, is_binary, load_binary, load_text
+from instrumentation import add_metrics_arguments, metrics_from_args, record, track_item, track_phase
+from lightcurve import LightCurve, LightCurveMeta
+from pipelined import run_pipelined
+from psd_io import DEFAULT_LOG_BINS, DEFAULT_SMOOTH_WIDTHS, PSD_EXTENSION, is_psd_binary, save_multires_psd
+from result_cache import add_cache_arguments, cache_from_args, cached_call
+from sharding import add_shard_arguments, claim_and_run, in_shard, parse_shard, queue_from_args
+
+def define_paths(config=None):
+    """Define input and output paths (concatenated_dir and psd_dir of config, see config.py)."""
+    config = config or load_config()
+    input_path = config['concatenated_dir']
+    output_path = config['psd_dir']
 
     # Ensure the output directory exists
     os.makedirs(output_path, exist_ok=True)
 
     return input_path, output_path
 
-def psd(file, input_path, cadence, rgb):
-    """Compute the Power Spectral Density (PSD) of the given file."""
-    # Determine max frequency based on cadence and RGB classification
+# Lomb-Scargle engines:
+#   'fast'    - Press & Rybicki extirpolation + FFT, O(N + n_freq log n_freq)
+#   'exact'   - direct summation (astropy 'cython'), O(N * n_freq) time, O(N + n_freq) memory
+#   'chunked' - vectorized direct summation (astropy 'slow') over blocks of
+#               frequencies, with at most CHUNK_ELEMENTS temporaries per block
+#   'auto'    - 'exact' when N * n_freq <= AUTO_EXACT_LIMIT, 'fast' otherwise
+PSD_ENGINES = ('auto', 'fast', 'exact', 'chunked')
+AUTO_EXACT_LIMIT = 1e6
+CHUNK_ELEMENTS = 2 ** 22
+
+# PSD output formats:
+#   'csv'      - Frequency,Power text table (<name>_psd.csv)
+#   'multires' - float32 full-resolution PSD plus log-binned and smoothed
+#                levels in one binary file (<name>_psd.psdb, see psd_io.py)
+PSD_FORMATS = ('csv', 'multires')
+
+def choose_engine(n_points, n_freq):
+    """Engine picked by engine='auto' for N points and n_freq frequencies."""
+    return 'exact' if n_points * n_freq <= AUTO_EXACT_LIMIT else 'fast'
+
+def lomb_scargle_power(t, f, frequency, engine='auto', chunk_elements=CHUNK_ELEMENTS):
+    """
+    Lomb-Scargle power (astropy 'psd' normalization) of (t, f) on a regular
+    frequency grid, computed with the selected engine.
+    """
+    from astropy.timeseries import LombScargle
+
+    if engine == 'auto':
+        engine = choose_engine(len(t), len(frequency))
+
+    ls = LombScargle(t, f)
+    if engine == 'fast':
+        return ls.power(frequency, method='fast', normalization='psd', assume_regular_frequency=True)
+    elif engine == 'exact':
+        return ls.power(frequency, method='cython', normalization='psd')
+    elif engine == 'chunked':
+        step = max(1, int(chunk_elements // len(t)))
+        return np.concatenate([
+            ls.power(frequency[i:i + step], method='slow', normalization='psd')
+            for i in range(0, len(frequency), step)
+        ])
+    else:
+        raise ValueError(f"Unknown PSD engine '{engine}', expected one of {PSD_ENGINES}")
+
+def max_frequency(cadence, rgb):
+    """Maximum frequency (uHz) of the PSD for a given cadence and RGB classification."""
     if rgb == 'RGB_CMD':
         if cadence == 1800:
             max_freq = 280
@@ -30,21 +84,41 @@ def psd(file, input_path, cadence, rgb):
             max_freq = 4000
         else:
             max_freq = 280
+    return max_freq
 
-    # Read the input file
-    filepath = os.path.join(input_path, file)
-    q = np.loadtxt(filepath, delimiter=',', skiprows=1)
+def read_lightcurve(filepath):
+    """Read a concatenated lightcurve (CSV or binary .lcb) as a LightCurve."""
+    segments = None
+    if is_binary(filepath):
+        t, f, metadata = load_binary(filepath)
+        segments = metadata.get('segments')
+    else:
+        t, f = load_text(filepath, delimiter=',', header=True)
+    return LightCurve(t, f, meta=LightCurveMeta.from_file_name(filepath), segments=segments)
 
-    # Remove rows with NaNs in any column
-    q = q[~np.isnan(q).any(axis=1)]
+def psd_from_lightcurve(lc, cadence, rgb, engine='auto', frequency=None, metrics=None):
+    """
+    Compute the PSD of a LightCurve (time in days, relative flux) with the
+    given Lomb-Scargle engine (see PSD_ENGINES). Masked rows and rows with
+    NaNs are ignored.
+
+    By default the frequency grid is the autopower grid of this lightcurve
+    (10 samples per peak up to the maximum frequency). A precomputed grid in
+    uHz, e.g. a shared batch grid, can be passed as frequency instead.
+    If Metrics are given, the grid and lomb_scargle phases, the number of
+    points, the grid size and the engine used are recorded.
+    """
+    # Determine max frequency based on cadence and RGB classification
+    max_freq = max_frequency(cadence, rgb)
+
+    # Mask rows with NaNs in any column (only copied out if there are any)
+    t, f = lc.mask_nan().valid()
+
+    # Scaled copies; the inputs may be shared or read-only memmaps
+    f = f * 1e6
 
-    # Extract time and flux columns
-    t = q[:, 0]  # Time
-    f = q[:, 1]  # Flux
-    f *=1e6
-    
     # Convert time to days
-    t *= 0.0864
+    t = t * 0.0864
 
     # Replace NaNs in flux with zero (if any)
     f = np.nan_to_num(f, nan=0)
@@ -57,52 +131,604 @@ def psd(file, input_path, cadence, rgb):
     mean_dt = np.mean(dt)
     median_dt = np.median(dt)
 
-    freq, power = LombScargle(t, f).autopower(
-        nyquist_factor=(mean_dt / median_dt),
-        normalization='psd',
-        samples_per_peak=10,
-        maximum_frequency=max_freq
-    )
+    with track_phase(metrics, 'grid'):
+        if frequency is None:
+            from astropy.timeseries import LombScargle
+
+            freq = LombScargle(t, f).autofrequency(
+                nyquist_factor=(mean_dt / median_dt),
+                samples_per_peak=10,
+                maximum_frequency=max_freq
+            )
+        else:
+            freq = frequency
+    with track_phase(metrics, 'lomb_scargle'):
+        power = lomb_scargle_power(t, f, freq, engine)
+    record(metrics, n_points=len(t), n_freq=len(freq),
+           engine=choose_engine(len(t), len(freq)) if engine == 'auto' else engine)
 
     # Normalize power (flux in ppm -> power in ppm^2/uHz)
     power = (2 * power * var) / ((np.sum(power)) * (freq[1] - freq[0]))
 
     return freq, power
 
-def main():
-    """Main function to process all files and compute PSD."""
-    input_path, output_path = define_paths()
+def psd(file, input_path, cadence, rgb, cache=None, engine='auto', metrics=None, output_file=None,
+        resolutions=None, segmented=None):
+    """
+    Compute the Power Spectral Density (PSD) of the given file.
+
+    engine selects the Lomb-Scargle implementation (see PSD_ENGINES). If a
+    ResultCache is given, the PSD is reused as long as the file content,
+    cadence, RGB flag, engine and code are unchanged. If output_file is
+    given, the PSD is also saved there (see save_psd; resolutions are its
+    log_bins and smooth_widths for a multi-resolution file).
+
+    segmented is None for one periodogram of the whole series, or a dict of
+    segmented_psd_from_lightcurve options (possibly empty) for a segmented,
+    averaged PSD.
+    """
+    # Validate cadence before reading the file
+    max_frequency(cadence, rgb)
+
+    filepath = os.path.join(input_path, file)
+
+    def compute():
+        with track_phase(metrics, 'load'):
+            lc = read_lightcurve(filepath)
+        if segmented is not None:
+            return segmented_psd_from_lightcurve(lc, cadence, rgb, engine, metrics=metrics, **segmented)
+        return psd_from_lightcurve(lc, cadence, rgb, engine, metrics=metrics)
+
+    params, code = _psd_cache_params(cadence, rgb, engine, segmented)
+    freq, power = cached_call(cache, 'psd', [filepath], params, compute, code=code)
+    if output_file is not None:
+        with track_phase(metrics, 'write'):
+            save_psd(output_file, freq, power, metadata=psd_metadata(file, cadence, rgb, engine, segmented),
+                     **(resolutions or {}))
+    return freq, power
+
+def _psd_cache_params(cadence, rgb, engine, segmented, **extra):
+    """ResultCache params and code of a PSD (unchanged keys for the full-length PSD)."""
+    params = dict({'cadence': cadence, 'rgb': rgb, 'engine': engine}, **extra)
+    if segmented is None:
+        return params, (psd_from_lightcurve,)
+    params['segmented'] = segmented
+    return params, (psd_from_lightcurve, split_segments, segmented_psd_from_lightcurve)
+
+def psd_file_name(file_name, psd_format='csv', segmented=False):
+    """
+    Name of the PSD file of a concatenated lightcurve in the given format
+    (see PSD_FORMATS); segmented PSDs are named <name>_psd_segmented.
+    """
+    if psd_format not in PSD_FORMATS:
+        raise ValueError(f"Unknown PSD format '{psd_format}', expected one of {PSD_FORMATS}")
+    extension = PSD_EXTENSION if psd_format == 'multires' else '.csv'
+    return f"{os.path.splitext(file_name)[0]}_psd{'_segmented' if segmented else ''}{extension}"
+
+def psd_metadata(file_name, cadence, rgb, engine, segmented=None):
+    """Metadata stored in a multi-resolution PSD file."""
+    metadata = {'source': os.path.basename(file_name), 'cadence': cadence, 'rgb': rgb, 'engine': engine}
+    if segmented is not None:
+        metadata['segmented'] = segmented
+    return metadata
+
+def save_psd(output_file, freq, power, log_bins=DEFAULT_LOG_BINS, smooth_widths=DEFAULT_SMOOTH_WIDTHS,
+             metadata=None):
+    """
+    Save the PSD data to a CSV file, or to a multi-resolution file if
+    output_file ends in .psdb (see psd_io.py; log_bins, smooth_widths and
+    metadata only apply to those).
+    """
+    if is_psd_binary(output_file):
+        save_multires_psd(output_file, freq, power, log_bins, smooth_widths, metadata)
+        return
+    header = 'Frequency,Power'
+    with atomic_write(output_file) as tmp_path:
+        np.savetxt(tmp_path, np.column_stack((freq, power)), delimiter=',', header=header, comments='')
+
+@lru_cache(maxsize=64)
+def shared_frequency_grid(max_freq, baseline, samples_per_peak=10):
+    """
+    Regular frequency grid (uHz) for a baseline in Ms, built the same way as
+    LombScargle.autofrequency: spacing 1 / (samples_per_peak * baseline),
+    starting at half a step. Cached, so every star of a batch reuses it.
+    """
+    df = 1.0 / baseline / samples_per_peak
+    f0 = 0.5 * df
+    n_freq = 1 + int(np.round((max_freq - f0) / df))
+    grid = f0 + df * np.arange(n_freq)
+    grid.flags.writeable = False
+    return grid
+
+def baseline_bucket(baseline, bucket_width=0.05):
+    """
+    Upper edge of the logarithmic baseline bucket containing baseline.
+
+    Stars in the same bucket share the grid of the bucket's upper edge, which
+    oversamples each of them by at most a factor (1 + bucket_width).
+    """
+    k = math.floor(math.log(baseline) / math.log1p(bucket_width))
+    return math.exp((k + 1) * math.log1p(bucket_width))
+
+# Segmented (Welch-style) PSD: the lightcurve is split into segments, each
+# segment's PSD is computed on one shared grid with the resolution of the
+# longest segment (samples_per_peak per 1 / baseline, coarser than the
+# full-length PSD) and the spectra are averaged. Each segment gets the
+# normalization of psd_from_lightcurve (ppm^2/uHz, integral 2 * variance of
+# that segment), and the average is weighted by the number of points, so
+# short or gappy segments count less. Segments covering less than
+# min_coverage of their duration are left out.
+SEGMENT_GAP_DAYS = 0.5
+
+def split_segments(lc, segment_days=None, gap_days=SEGMENT_GAP_DAYS):
+    """
+    Split a time-sorted LightCurve for the segmented PSD into views.
+
+    With segment_days, into consecutive windows of that many days from the
+    first time stamp. Otherwise at its sectors/campaigns when they are known
+    (lc.segments, set by the fused pipeline and kept in binary STEP2 files),
+    else at time gaps longer than gap_days (e.g. between sectors, but also
+    the TESS mid-sector gaps). Empty pieces are dropped.
+    """
+    if len(lc) == 0:
+        return []
+    if segment_days:
+        n_windows = int((lc.time[-1] - lc.time[0]) // segment_days) + 1
+        edges = np.searchsorted(lc.time, lc.time[0] + segment_days * np.arange(n_windows + 1), side='left')
+        edges[-1] = len(lc)
+    elif lc.segments:
+        return [lc[start:stop] for _, start, stop in lc.segments if stop > start]
+    else:
+        edges = np.concatenate([[0], np.nonzero(np.diff(lc.time) > gap_days)[0] + 1, [len(lc)]])
+    return [lc[start:stop] for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+def segmented_psd_from_lightcurve(lc, cadence, rgb, engine='auto', segment_days=None, gap_days=SEGMENT_GAP_DAYS,
+                                  samples_per_peak=2, min_coverage=0.25, n_jobs=1, metrics=None):
+    """
+    Segmented (Welch-style) PSD of a LightCurve: the weighted mean of the
+    PSDs of its segments on a shared grid (see split_segments and the notes
+    above it).
+
+    Parameters:
+        lc (LightCurve): Concatenated lightcurve (time in days, relative flux).
+        cadence (float): Cadence in seconds.
+        rgb (str): RGB classification (sets the maximum frequency).
+        engine (str): Lomb-Scargle engine (see PSD_ENGINES).
+        segment_days (float): Window length in days. Default is None: split
+            at the sectors/campaigns (or gaps longer than gap_days).
+        gap_days (float): Gap length that splits when the sectors are unknown.
+        samples_per_peak (int): Grid oversampling relative to the longest
+            segment. Default is 2.
+        min_coverage (float): Minimum fraction of a segment's duration
+            covered by points (points * cadence / duration). Default is 0.25.
+        n_jobs (int): Threads computing segments in parallel. Default is 1.
+        metrics (Metrics): If given, the segments phase and the numbers of
+            used and skipped segments are recorded.
+
+    Returns:
+        tuple: (freq, power), power in ppm^2/uHz.
+    """
+    max_freq = max_frequency(cadence, rgb)
+    lc = lc.mask_nan().compress()
+
+    used = []
+    pieces = split_segments(lc, segment_days, gap_days)
+    for piece in pieces:
+        if len(piece) < 3:
+            continue
+        duration = segment_days or (piece.time[-1] - piece.time[0]) + cadence / 86400
+        if len(piece) * cadence / 86400 / duration >= min_coverage:
+            used.append(piece)
+    if not used:
+        raise ValueError(f"No segment covers at least {min_coverage:.0%} of its duration")
+
+    # Grid with the resolution of the longest segment (baseline in Ms)
+    baseline = max(piece.time[-1] - piece.time[0] for piece in used) * 0.0864
+    freq = shared_frequency_grid(max_freq, baseline, samples_per_peak)
+
+    def segment_power(piece):
+        return psd_from_lightcurve(piece, cadence, rgb, engine, frequency=freq)[1]
+
+    # Accumulated in segment order, so the sum doesn't depend on n_jobs
+    total = np.zeros(len(freq))
+    with track_phase(metrics, 'segments'):
+        if n_jobs > 1 and len(used) > 1:
+            with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+                for piece, power in zip(used, pool.map(segment_power, used)):
+                    total += len(piece) * power
+        else:
+            for piece in used:
+                total += len(piece) * segment_power(piece)
+    record(metrics, n_points=len(lc), n_freq=len(freq), n_segments=len(used), n_segments_skipped=len(pieces) - len(used))
+
+    return freq, total / sum(len(piece) for piece in used)
+
+def read_time_span(filepath):
+    """
+    First and last time stamps (days) of a concatenated lightcurve, read
+    without parsing the whole file (binary header + memmap, or the first and
+    last line of the CSV).
+    """
+    if is_binary(filepath):
+        t, _, _ = load_binary(filepath)
+        return float(t[0]), float(t[-1])
+
+    with open(filepath, 'rb') as fh:
+        fh.readline()  # header
+        first = fh.readline()
+        fh.seek(0, os.SEEK_END)
+        size = fh.tell()
+        fh.seek(max(0, size - 4096))
+        last = fh.read().splitlines()[-1]
+    return float(first.split(b',')[0]), float(last.split(b',')[0])
 
-    df = pd.read_csv('/Users/creyes/Projects/harps/df_lightcurves_describe.csv')
+def _psd_batch(batch, input_path, output_path, engine, cache, metrics=None, queue=None, pipeline=None,
+               psd_format='csv', resolutions=None, segmented=None):
+    """
+    Worker: compute and save the PSDs of one batch of stars sharing cadence,
+    RGB class and baseline bucket. Returns [(file_name, output_file, error), ...];
+    output_file and error are both None for stars claimed by another worker
+    of the queue.
+
+    pipeline is None or the prefetch/write_behind/io_threads settings of
+    the pipelined mode, in which lightcurves are read ahead and PSDs written
+    by background threads (see pipelined.py); the metrics stages are then
+    psd/load, psd and psd/write.
+
+    psd_format and resolutions select the output (see save_psd). With
+    segmented (a dict of segmented_psd_from_lightcurve options), the stars
+    get segmented PSDs on their own grids instead of the bucket grid.
+    """
+    resolutions = resolutions or {}
+
+    def compute(lc, cadence, rgb, bucket):
+        if segmented is not None:
+            params, code = _psd_cache_params(cadence, rgb, engine, segmented, segments=lc.segments)
+            return cached_call(
+                cache, 'psd_batch', [lc.time, lc.flux], params,
+                lambda: segmented_psd_from_lightcurve(lc, cadence, rgb, engine, metrics=metrics, **segmented),
+                code=code,
+            )
+        baseline = (np.nanmax(lc.time) - np.nanmin(lc.time)) * 0.0864
+        max_freq = max_frequency(cadence, rgb)
+        # Fall back to the star's own grid if the bucket guess was wrong
+        grid = shared_frequency_grid(max_freq, bucket) if baseline <= bucket else None
+        return cached_call(
+            cache, 'psd_batch', [lc.time, lc.flux], {'cadence': cadence, 'rgb': rgb, 'engine': engine, 'bucket': bucket},
+            lambda: psd_from_lightcurve(lc, cadence, rgb, engine, frequency=grid, metrics=metrics),
+            code=(psd_from_lightcurve,),
+        )
+
+    def compute_star(file_name, cadence, rgb, bucket, output_file):
+        with track_item(metrics, 'psd', file_name):
+            with track_phase(metrics, 'load'):
+                lc = read_lightcurve(os.path.join(input_path, file_name))
+            freq, power = compute(lc, cadence, rgb, bucket)
+            with track_phase(metrics, 'write'):
+                save_psd(output_file, freq, power, metadata=psd_metadata(file_name, cadence, rgb, engine, segmented),
+                         **resolutions)
+        return output_file
+
+    if pipeline:
+        def load_step(job):
+            if queue is not None and not queue.claim(job[0]):
+                return None
+            with track_item(metrics, 'psd/load', job[0]):
+                return read_lightcurve(os.path.join(input_path, job[0]))
+
+        def compute_step(job, lc):
+            if lc is None:
+                return None
+            with track_item(metrics, 'psd', job[0]):
+                return compute(lc, *job[1:])
+
+        def write_step(job, result):
+            if result is None:
+                return None
+            output_file = os.path.join(output_path, psd_file_name(job[0], psd_format, segmented is not None))
+            with track_item(metrics, 'psd/write', job[0]):
+                save_psd(output_file, *result, metadata=psd_metadata(job[0], job[1], job[2], engine, segmented),
+                         **resolutions)
+            if queue is not None:
+                queue.complete(job[0])
+            return output_file
+
+        results = []
+        for job, output_file, error in run_pipelined(batch, load_step, compute_step, write_step,
+                                                     prefetch=pipeline['prefetch'], write_behind=pipeline['write_behind'],
+                                                     n_readers=pipeline['io_threads']):
+            if error is not None and queue is not None:
+                queue.release(job[0])
+            results.append((job[0], output_file, error))
+        return results
+
+    results = []
+    for file_name, cadence, rgb, bucket in batch:
+        output_file = os.path.join(output_path, psd_file_name(file_name, psd_format, segmented is not None))
+        try:
+            _, output_file = claim_and_run(queue, file_name,
+                                           lambda: compute_star(file_name, cadence, rgb, bucket, output_file))
+            results.append((file_name, output_file, None))
+        except Exception as e:
+            results.append((file_name, None, f"{type(e).__name__}: {e}"))
+    return results
+
+def batch_psd(jobs, input_path, output_path, n_jobs=4, executor='process', engine='auto',
+              bucket_width=0.05, batch_size=32, cache=None, metrics=None, queue=None, prefetch=0, write_behind=0,
+              io_threads=2, psd_format='csv', resolutions=None, segmented=None):
+    """
+    Compute PSDs for many stars in batches.
+
+    Stars are grouped by (cadence, RGB class, baseline bucket); each group
+    shares one precomputed frequency grid. Groups are split into batches of
+    at most batch_size stars and spread over a process pool. A star that
+    fails is logged and the rest continue.
+
+    Parameters:
+        jobs (list): (file_name, cadence, rgb) tuples.
+        input_path (str): Directory with the concatenated lightcurves.
+        output_path (str): Directory for the PSD files.
+        n_jobs (int): Number of parallel workers.
+        executor (str): 'process', 'thread' or 'serial'.
+        engine (str): Lomb-Scargle engine (see PSD_ENGINES).
+        bucket_width (float): Relative width of the baseline buckets.
+        batch_size (int): Maximum number of stars per submitted batch.
+        cache (ResultCache): Optional result cache.
+        metrics (Metrics): Optional instrumentation, one item per star.
+        queue (WorkQueue): Claim each star in this shared queue before
+            computing it (see sharding.py).
+        prefetch (int): If > 0 (or write_behind > 0), each worker reads up to
+            prefetch lightcurves ahead and writes PSDs in the background while
+            it computes (see _psd_batch). Default is 0 (off).
+        write_behind (int): PSDs that may wait for writing.
+        io_threads (int): Reader threads per worker in pipelined mode.
+        psd_format (str): Output format (see PSD_FORMATS).
+        resolutions (dict): log_bins and smooth_widths of the 'multires'
+            format (see save_psd). Default is psd_io's defaults.
+        segmented (dict): Options of segmented_psd_from_lightcurve for
+            segmented PSDs. Default is None (full-length PSDs).
+
+    Returns:
+        tuple: (list of PSD files, list of (file_name, error) failures).
+    """
+    groups = {}
+    failures = []
+    for file_name, cadence, rgb in jobs:
+        try:
+            t_first, t_last = read_time_span(os.path.join(input_path, file_name))
+            bucket = baseline_bucket((t_last - t_first) * 0.0864, bucket_width)
+        except (OSError, ValueError, IndexError) as e:
+            failures.append((file_name, f"{type(e).__name__}: {e}"))
+            print(f"Error processing {file_name}: {e}")
+            continue
+        groups.setdefault((cadence, rgb, bucket), []).append((file_name, cadence, rgb, bucket))
+
+    batches = []
+    for key in sorted(groups, key=str):
+        members = groups[key]
+        batches.extend(members[i:i + batch_size] for i in range(0, len(members), batch_size))
+    print(f"{len(jobs)} stars in {len(groups)} (cadence, RGB, baseline) groups, {len(batches)} batches")
+
+    pipeline = None
+    if prefetch > 0 or write_behind > 0:
+        pipeline = {'prefetch': prefetch, 'write_behind': write_behind, 'io_threads': io_threads}
+    outputs = []
+    skipped = []
+
+    def report(results):
+        for file_name, output_file, error in results:
+            if error is None and output_file is None:
+                skipped.append(file_name)
+                print(f"{file_name} claimed by another worker, skipping.")
+            elif error is None:
+                outputs.append(output_file)
+                print(f"Saved PSD data to: {output_file}")
+            else:
+                failures.append((file_name, error))
+                print(f"Error processing {file_name}: {error}")
+
+    if executor == 'serial':
+        for batch in batches:
+            report(_psd_batch(batch, input_path, output_path, engine, cache, metrics, queue, pipeline,
+                              psd_format, resolutions, segmented))
+    else:
+        pool_cls = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        with pool_cls(max_workers=n_jobs) as pool:
+            futures = [pool.submit(_psd_batch, batch, input_path, output_path, engine, cache, metrics, queue, pipeline,
+                                   psd_format, resolutions, segmented)
+                       for batch in batches]
+            for future in as_completed(futures):
+                report(future.result())
+
+    # Claims are tried once more, in case a lock went stale meanwhile (its
+    # owner was killed); stars still held belong to a live worker
+    if skipped:
+        retry = set(skipped)
+        skipped.clear()
+        print(f"Retrying {len(retry)} stars claimed by other workers")
+        for batch in batches:
+            batch = [job for job in batch if job[0] in retry]
+            if batch:
+                report(_psd_batch(batch, input_path, output_path, engine, cache, metrics, queue, pipeline,
+                                  psd_format, resolutions, segmented))
+
+    return outputs, failures
+
+def main(cache=None, engine='auto', batch=False, n_jobs=4, executor='process', bucket_width=0.05, catalog=None,
+         metrics=None, shard=None, queue=None, prefetch=0, write_behind=0, io_threads=2, psd_format='csv',
+         resolutions=None, segmented=None, config=None, overwrite=False):
+    """
+    Main function to process all files and compute PSD.
+
+    With batch=True, stars are grouped by cadence, RGB class and baseline and
+    computed in parallel batches sharing frequency grids (see batch_psd),
+    optionally with pipelined I/O (prefetch, write_behind, io_threads).
+
+    If a Catalog (see catalog.py) is given, the job list comes from it: the
+    cadence is the exptime of the file name and the RGB class the one stored
+    in the catalog (catalog.py --describe_csv). Otherwise both are read from
+    df_lightcurves_describe.csv.
+
+    The directories and df_lightcurves_describe.csv are those of config (a
+    dict from config.load_config, loaded if not given).
+
+    shard ("i/N") restricts the run to the targets of one shard and queue (a
+    WorkQueue) makes the stars be claimed from a queue shared with other
+    runs (see sharding.py). Stars whose PSD exists are skipped, unless
+    overwrite is True: then every PSD is recomputed (from the cache when its
+    inputs and parameters are unchanged) and replaced, e.g. after changing
+    the parameters.
+
+    psd_format 'multires' writes compact multi-resolution files (see
+    psd_io.py) with the log_bins and smooth_widths given in resolutions.
+    segmented (a dict of segmented_psd_from_lightcurve options) computes
+    segmented, averaged PSDs instead of full-length ones.
+    """
+    config = config or load_config()
+    input_path, output_path = define_paths(config)
+
+    if catalog is not None:
+        catalog.update(input_path)
+        candidates = catalog.psd_jobs(input_path)
+    else:
+        import pandas as pd
+
+        df = pd.read_csv(config['describe_csv'])
+        # Set cadence and RGB flag (you can customize how these values are determined)
+        candidates = [(file['file_name'], file['cadence'], file['RGB'])
+                      for _, file in df.iterrows()
+                      if file['file_name'].endswith(('.txt', BINARY_EXTENSION))]  # Process only CSV or binary files
+
+    if shard is not None:
+        shard = parse_shard(shard)
+        candidates = [c for c in candidates if in_shard(str(c[0])[:5], shard)]
+
+    jobs = []
     # Iterate through all files
-    for _, file in df.iterrows():
-        if file['file_name'].endswith('.txt'):  # Process only CSV files
+    for file_name, cadence, rgb in candidates:
+        # Create an appropriate name for the output file
+        output_file = os.path.join(output_path, psd_file_name(file_name, psd_format, segmented is not None))
 
-            # Create an appropriate name for the output file
-            base_name = os.path.splitext(file['file_name'])[0]  # Remove the .csv extension
-            output_file = os.path.join(output_path, f"{base_name}_psd.csv")
+        # Check if the output file already exists
+        if not overwrite and os.path.exists(output_file):
+            print(f"Output already exists for {file_name}, skipping.")
+            continue  # Skip processing if the output file exists
 
-            # Check if the output file already exists
-            if os.path.exists(output_file):
-                print(f"Output already exists for {file['file_name']}, skipping.")
-                continue  # Skip processing if the output file exists
+        jobs.append((file_name, cadence, rgb))
 
-            # Set cadence and RGB flag (you can customize how these values are determined)
-            cadence = file['cadence']  # Example cadence value
-            rgb = file['RGB']  # Example RGB flag (can also be dynamically set per file)
+    if batch:
+        _, failures = batch_psd(jobs, input_path, output_path, n_jobs=n_jobs, executor=executor,
+                                engine=engine, bucket_width=bucket_width, cache=cache, metrics=metrics, queue=queue,
+                                prefetch=prefetch, write_behind=write_behind, io_threads=io_threads,
+                                psd_format=psd_format, resolutions=resolutions, segmented=segmented)
+    else:
+        failures = []
+        skipped = []
+
+        def run_star(file_name, cadence, rgb):
+            output_file = os.path.join(output_path, psd_file_name(file_name, psd_format, segmented is not None))
+            def compute_star():
+                with track_item(metrics, 'psd', file_name):
+                    # Compute the PSD and save it to the output file
+                    psd(file_name, input_path, cadence, rgb, cache=cache, engine=engine, metrics=metrics,
+                        output_file=output_file, resolutions=resolutions, segmented=segmented)
 
             try:
-                print(f"Processing file: {file['file_name']}")
-                freq, power = psd(file['file_name'], input_path, cadence, rgb)
+                print(f"Processing file: {file_name}")
+                claimed, _ = claim_and_run(queue, file_name, compute_star)
+                if claimed:
+                    print(f"Saved PSD data to: {output_file}")
+                else:
+                    skipped.append((file_name, cadence, rgb))
+                    print(f"{file_name} claimed by another worker, skipping.")
 
-                # Save the PSD data to the output file
-                header = 'Frequency,Power'
-                np.savetxt(output_file, np.column_stack((freq, power)), delimiter=',', header=header, comments='')
-                print(f"Saved PSD data to: {output_file}")
+            except Exception as e:
+                # One bad star is recorded, as in batch mode, instead of ending the run
+                print(f"Error processing {file_name}: {e}")
+                failures.append((file_name, f"{type(e).__name__}: {e}"))
 
-            except ValueError as e:
-                print(f"Error processing {file['file_name']}: {e}")
-                break
+        for file_name, cadence, rgb in jobs:
+            run_star(file_name, cadence, rgb)
+
+        # Claims are tried once more, in case a lock went stale meanwhile (its
+        # owner was killed); stars still held belong to a live worker
+        if skipped:
+            retry = list(skipped)
+            skipped.clear()
+            print(f"Retrying {len(retry)} stars claimed by other workers")
+            for file_name, cadence, rgb in retry:
+                run_star(file_name, cadence, rgb)
+
+    if failures:
+        print(f"{len(failures)} of {len(jobs)} files failed:")
+        for file_name, error in failures:
+            print(f"  {file_name}: {error}")
+    if metrics is not None:
+        metrics.report()
+
+def add_segmented_arguments(parser):
+    """Add the segmented PSD options (shared with run_pipeline.py) to an argparse parser."""
+    parser.add_argument("--segmented", action="store_true", help="Compute segmented (Welch-style) PSDs: the average of the PSDs of the sectors or of fixed windows, on a coarser grid. Saved as <name>_psd_segmented.")
+    parser.add_argument("--segment_days", type=float, default=None, help="With --segmented, split into windows of this many days. Default is the sectors/campaigns (or gaps longer than --segment_gap_days when they are unknown).")
+    parser.add_argument("--segment_gap_days", type=float, default=SEGMENT_GAP_DAYS, help=f"With --segmented, gap length in days that splits segments when the sectors are unknown. Default is {SEGMENT_GAP_DAYS}.")
+    parser.add_argument("--segment_samples_per_peak", type=int, default=2, help="With --segmented, grid oversampling relative to the longest segment. Default is 2.")
+    parser.add_argument("--min_coverage", type=float, default=0.25, help="With --segmented, leave out segments whose points cover less than this fraction of their duration. Default is 0.25.")
+    parser.add_argument("--segment_jobs", type=int, default=1, help="With --segmented, threads computing the segments of a star in parallel. Default is 1.")
+
+def segmented_from_args(args):
+    """segmented option dict (or None) from the options of add_segmented_arguments."""
+    if not args.segmented:
+        return None
+    return {'segment_days': args.segment_days, 'gap_days': args.segment_gap_days,
+            'samples_per_peak': args.segment_samples_per_peak, 'min_coverage': args.min_coverage,
+            'n_jobs': args.segment_jobs}
+
+def add_arguments(parser):
+    """Add the command-line options of STEP3 to an argparse parser."""
+    parser.add_argument("--config", type=str, default=None, help="JSON file with the data directories (see config.py). Default is $LIGHTCURVEPROCESSOR_CONFIG or ./lightcurveprocessor.json.")
+    parser.add_argument("--engine", choices=PSD_ENGINES, default="auto", help="Lomb-Scargle engine. Default is auto.")
+    parser.add_argument("--batch", action="store_true", help="Group stars by cadence, RGB class and baseline and compute them in parallel batches.")
+    parser.add_argument("--n_jobs", type=int, default=4, help="Number of parallel processes in batch mode. Default is 4.")
+    parser.add_argument("--executor", choices=["thread", "process", "serial"], default="process", help="Execution mode in batch mode. Default is 'process'.")
+    parser.add_argument("--bucket_width", type=float, default=0.05, help="Relative width of the baseline buckets in batch mode. Default is 0.05.")
+    parser.add_argument("--psd_format", choices=PSD_FORMATS, default="csv", help="Output format: csv, or multires for one compact binary file per star with the float32 PSD plus log-binned and smoothed versions. Default is csv.")
+    parser.add_argument("--log_bins", type=str, default=",".join(f"{n:g}" for n in DEFAULT_LOG_BINS), help=f"With --psd_format multires, comma-separated bins per decade of the log-binned levels (empty for none). Default is {','.join(f'{n:g}' for n in DEFAULT_LOG_BINS)}.")
+    parser.add_argument("--smooth_widths", type=str, default=",".join(f"{w:g}" for w in DEFAULT_SMOOTH_WIDTHS), help=f"With --psd_format multires, comma-separated boxcar widths in uHz of the smoothed levels (empty for none). Default is {','.join(f'{w:g}' for w in DEFAULT_SMOOTH_WIDTHS)}.")
+    add_segmented_arguments(parser)
+    parser.add_argument("--overwrite", action="store_true", help="Recompute and replace PSDs that already exist (e.g. after changing parameters). Default is to skip them.")
+    add_cache_arguments(parser)
+    parser.add_argument("--catalog", type=str, default=None, help="SQLite file catalog providing the job list (see catalog.py) instead of df_lightcurves_describe.csv.")
+    parser.add_argument("--prefetch", type=int, default=0, help="In batch mode, lightcurves each worker reads ahead while computing (pipelined I/O). Default is 0 (off).")
+    parser.add_argument("--write_behind", type=int, default=0, help="In batch mode, PSDs each worker may queue for background writing (pipelined I/O). Default is 0 (off).")
+    parser.add_argument("--io_threads", type=int, default=2, help="Reader threads per worker with --prefetch. Default is 2.")
+    add_shard_arguments(parser, item='star')
+    add_metrics_arguments(parser, item='star')
+
+def main_from_args(args):
+    """Run STEP3 with options parsed by add_arguments."""
+    cache = cache_from_args(args)
+
+    catalog = None
+    if args.catalog:
+        from catalog import Catalog
+        catalog = Catalog(args.catalog)
+
+    metrics = metrics_from_args(args, 'STEP3')
+
+    queue = queue_from_args(args)
+    resolutions = {'log_bins': [float(n) for n in args.log_bins.split(',') if n],
+                   'smooth_widths': [float(w) for w in args.smooth_widths.split(',') if w]}
+    main(cache=cache, engine=args.engine, batch=args.batch, n_jobs=args.n_jobs, executor=args.executor, bucket_width=args.bucket_width,
+         catalog=catalog, metrics=metrics, shard=args.shard, queue=queue, prefetch=args.prefetch,
+         write_behind=args.write_behind, io_threads=args.io_threads, psd_format=args.psd_format, resolutions=resolutions,
+         segmented=segmented_from_args(args), config=load_config(args.config), overwrite=args.overwrite)
+
+    if cache is not None and args.cache_stats:
+        cache.report()
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compute the PSD of every concatenated lightcurve listed in df_lightcurves_describe.csv or in the file catalog.")
+    add_arguments(parser)
+    main_from_args(parser.parse_args())
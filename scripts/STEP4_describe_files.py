@@ -2,8 +2,23 @@ import os
 from glob import glob
 import csv
 
-def main(output_dir = '/Users/creyes/Projects/harps/lightcurves/'):
-    
+from config import load_config
+
+def main(output_dir=None, catalog=None, config=None):
+    """
+    Write describe_files_per_irow.csv: per irow, the target name and the
+    mission info (sector/campaign) of its files for every exptime code.
+
+    output_dir defaults to the raw_dir of config (a dict from
+    config.load_config, loaded if not given).
+
+    If a Catalog (see catalog.py) is given, it is updated incrementally and
+    queried instead of parsing every file name of output_dir.
+    """
+
+    if output_dir is None:
+        output_dir = (config or load_config())['raw_dir']
+
     # Dictionary to store data in the form:
     # data[irow] = {
     #     'tel_target': some_string_or_None,
@@ -11,60 +26,64 @@ def main(output_dir = '/Users/creyes/Projects/harps/lightcurves/'):
     #         exptime_code: [list_of_mission_info_strings]
     #     }
     # }
-    data = {}
-
-    # Read all files in the directory
-    for file_path in sorted(glob(os.path.join(output_dir, "*"))):
-        filename = os.path.basename(file_path)
-
-        # Extract the first 5 characters as irow
-        irow = filename[:5]
-
-        # Ensure we have an entry for this irow
-        if irow not in data:
-            data[irow] = {
-                "tel_target": None,
-                "exptime": {}
-            }
-
-        # ----------------------------------------------------------------------
-        # 1) Optional: Parse tel_target (between "target_" and "_LK_targetname")
-        # ----------------------------------------------------------------------
-        try:
-            start_idx = filename.index("target_") + len("target_")
-            end_idx = filename.index("_LK_targetname", start_idx)
-            tel_target = filename[start_idx:end_idx]
-            # Store or overwrite tel_target (assuming it's the same for a given irow)
-            data[irow]["tel_target"] = tel_target
-        except ValueError:
-            # If the pattern doesn't exist in the filename, ignore
-            pass
-
-        # ----------------------------------------------------------------------
-        # 2) Parse the exptime code (between "LK_exptime_" and "_LK_mission")
-        # ----------------------------------------------------------------------
-        exptime_code = None
-        try:
-            start_exp = filename.index("LK_exptime_") + len("LK_exptime_")
-            end_exp = filename.index("_LK_mission", start_exp)
-            exptime_code = filename[start_exp:end_exp]
-        except ValueError:
-            # If "LK_exptime_" or "_LK_mission" not found, skip
-            pass
-
-        # If we found an exptime_code, parse mission_info
-        if exptime_code:
+    if catalog is not None:
+        catalog.update(output_dir)
+        data = catalog.describe(output_dir)
+    else:
+        data = {}
+
+        # Read all files in the directory
+        for file_path in sorted(glob(os.path.join(output_dir, "*"))):
+            filename = os.path.basename(file_path)
+
+            # Extract the first 5 characters as irow
+            irow = filename[:5]
+
+            # Ensure we have an entry for this irow
+            if irow not in data:
+                data[irow] = {
+                    "tel_target": None,
+                    "exptime": {}
+                }
+
+            # ----------------------------------------------------------------------
+            # 1) Optional: Parse tel_target (between "target_" and "_LK_targetname")
+            # ----------------------------------------------------------------------
             try:
-                start_mis = filename.index("LK_mission_") + len("LK_mission_")
-                end_mis = filename.index("_LK_author", start_mis)
-                mission_info = filename[start_mis:end_mis]
+                start_idx = filename.index("target_") + len("target_")
+                end_idx = filename.index("_LK_targetname", start_idx)
+                tel_target = filename[start_idx:end_idx]
+                # Store or overwrite tel_target (assuming it's the same for a given irow)
+                data[irow]["tel_target"] = tel_target
             except ValueError:
-                # If "LK_mission_" or "_LK_author" not found, skip
-                mission_info = None
+                # If the pattern doesn't exist in the filename, ignore
+                pass
 
-            # Add mission_info to our data structure
-            if mission_info:
-                data[irow]["exptime"].setdefault(exptime_code, []).append(mission_info)
+            # ----------------------------------------------------------------------
+            # 2) Parse the exptime code (between "LK_exptime_" and "_LK_mission")
+            # ----------------------------------------------------------------------
+            exptime_code = None
+            try:
+                start_exp = filename.index("LK_exptime_") + len("LK_exptime_")
+                end_exp = filename.index("_LK_mission", start_exp)
+                exptime_code = filename[start_exp:end_exp]
+            except ValueError:
+                # If "LK_exptime_" or "_LK_mission" not found, skip
+                pass
+
+            # If we found an exptime_code, parse mission_info
+            if exptime_code:
+                try:
+                    start_mis = filename.index("LK_mission_") + len("LK_mission_")
+                    end_mis = filename.index("_LK_author", start_mis)
+                    mission_info = filename[start_mis:end_mis]
+                except ValueError:
+                    # If "LK_mission_" or "_LK_author" not found, skip
+                    mission_info = None
+
+                # Add mission_info to our data structure
+                if mission_info:
+                    data[irow]["exptime"].setdefault(exptime_code, []).append(mission_info)
 
     # --------------------------------------------------------------------------
     # Collect all unique exptime codes across all irows
@@ -105,5 +124,23 @@ def main(output_dir = '/Users/creyes/Projects/harps/lightcurves/'):
 
             writer.writerow(row)
 
+def add_arguments(parser):
+    """Add the command-line options of STEP4 to an argparse parser."""
+    parser.add_argument("--config", type=str, default=None, help="JSON file with the data directories (see config.py). Default is $LIGHTCURVEPROCESSOR_CONFIG or ./lightcurveprocessor.json.")
+    parser.add_argument("--catalog", type=str, default=None, help="SQLite file catalog to query (see catalog.py). Default is a directory scan.")
+
+def main_from_args(args):
+    """Run STEP4 with options parsed by add_arguments."""
+    catalog = None
+    if args.catalog:
+        from catalog import Catalog
+        catalog = Catalog(args.catalog)
+
+    main(catalog=catalog, config=load_config(args.config))
+
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize the lightcurve files per irow and exptime.")
+    add_arguments(parser)
+    main_from_args(parser.parse_args())
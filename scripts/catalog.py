@@ -0,0 +1,298 @@
+import os
+import re
+import sqlite3
+
+from lc_io import BINARY_EXTENSION, is_binary, read_binary_header
+
+# Persistent catalog of lightcurve files.
+#
+# One SQLite table holds the metadata parsed from every file name
+# (irow, target, exptime, mission, sectors/campaigns, author) together with
+# its size, mtime and row count. update() walks a directory with os.scandir
+# and only re-parses and re-counts files whose size or mtime changed, so
+# the full scan of a large directory is paid once. Grouping (STEP2), PSD
+# job lists (STEP3) and the per-target summary (STEP4) are SQL queries.
+
+LIGHTCURVE_EXTENSIONS = ('.txt', BINARY_EXTENSION)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path         TEXT PRIMARY KEY,
+    directory    TEXT NOT NULL,
+    file_name    TEXT NOT NULL,
+    irow         TEXT NOT NULL,
+    target       TEXT,
+    exptime      TEXT,
+    mission      TEXT,
+    mission_info TEXT,
+    sectors      TEXT,
+    author       TEXT,
+    size         INTEGER NOT NULL,
+    mtime        REAL NOT NULL,
+    n_rows       INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_group ON files (directory, irow, exptime, mission);
+CREATE TABLE IF NOT EXISTS targets (
+    irow TEXT PRIMARY KEY,
+    rgb  TEXT
+);
+"""
+
+_COLUMNS = ('path', 'directory', 'file_name', 'irow', 'target', 'exptime', 'mission',
+            'mission_info', 'sectors', 'author', 'size', 'mtime', 'n_rows')
+
+# Same fields the STEP2 regexes and STEP4 str.index logic extract
+_TARGET = re.compile(r'target_(.*?)_LK_targetname')
+_EXPTIME = re.compile(r'LK_exptime_(\w+)_LK_mission_')
+_MISSION = re.compile(r'LK_mission_(TESS|K2)_')
+_MISSION_INFO = re.compile(r'LK_mission_(.*?)_LK_author')
+_SECTOR = {'TESS': re.compile(r'TESS_Sector_(\d+)'), 'K2': re.compile(r'K2_Campaign_(\d+)')}
+# Concatenated (STEP2) names: ..._LK_mission_Sectors_1_2_40_IS_SHIFTED_...
+_CONCATENATED = re.compile(r'LK_mission_(Sectors|Campaigns)((?:_\d+)+)_')
+_AUTHOR = re.compile(r'_LK_author_?(.*)$')
+
+
+def parse_file_name(file_name):
+    """
+    Parse the metadata encoded in a lightcurve file name.
+
+    Handles raw and processed names
+      <irow>...target_<target>_LK_targetname_LK_exptime_<exptime>_LK_mission_TESS_Sector_<n>_LK_author_<author>.txt
+    and concatenated STEP2 names
+      <irow>_LK_exptime_<exptime>_LK_mission_Sectors_<n>_<m>_..._SHIFTED_CONCATENATED.txt
+
+    Returns:
+        dict: irow, target, exptime, mission ('TESS', 'K2' or None),
+        mission_info, sectors (sorted list of sector/campaign numbers) and
+        author. Fields missing from the name are None.
+    """
+    stem = os.path.splitext(file_name)[0]
+    info = {'irow': file_name[:5], 'target': None, 'exptime': None, 'mission': None,
+            'mission_info': None, 'sectors': [], 'author': None}
+
+    m = _TARGET.search(stem)
+    if m:
+        info['target'] = m.group(1)
+    m = _EXPTIME.search(stem)
+    if m:
+        info['exptime'] = m.group(1)
+    m = _MISSION_INFO.search(stem)
+    if m:
+        info['mission_info'] = m.group(1)
+    m = _AUTHOR.search(stem)
+    if m:
+        info['author'] = m.group(1)
+
+    m = _MISSION.search(stem)
+    if m:
+        info['mission'] = m.group(1)
+        info['sectors'] = sorted({int(n) for n in _SECTOR[m.group(1)].findall(stem)})
+    else:
+        m = _CONCATENATED.search(stem)
+        if m:
+            info['mission'] = 'TESS' if m.group(1) == 'Sectors' else 'K2'
+            info['sectors'] = sorted({int(n) for n in m.group(2).split('_') if n})
+
+    return info
+
+
+def count_rows(path, block_size=1 << 20):
+    """
+    Number of data rows of a lightcurve file: the header of a binary
+    container, or the non-empty lines of a text file minus a header line
+    (textual, or STEP1's "0,1").
+    """
+    if is_binary(path):
+        header, _ = read_binary_header(path)
+        return header['n_rows']
+
+    n_lines = 0
+    first = None
+    last_byte = b'\n'
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            if first is None:
+                first = block.split(b'\n', 1)[0].strip()
+            n_lines += block.count(b'\n')
+            last_byte = block[-1:]
+    if first is None:
+        return 0
+    if last_byte != b'\n':
+        n_lines += 1
+
+    try:
+        float(first.replace(b',', b' ').split()[0])
+        has_header = first == b'0,1'
+    except (ValueError, IndexError):
+        has_header = True
+    return max(0, n_lines - has_header)
+
+
+class Catalog:
+    """
+    SQLite catalog of lightcurve files and their file-name metadata.
+
+    Parameters:
+        db_path (str): SQLite database file (created if missing).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def update(self, directory, count=True):
+        """
+        Bring the catalog entries of directory up to date.
+
+        Only new files and files whose size or mtime changed are parsed (and
+        their rows counted if count is True); entries of deleted files are
+        dropped.
+
+        Returns:
+            tuple: (n_added_or_changed, n_removed)
+        """
+        directory = os.path.abspath(directory)
+        known = {path: (size, mtime) for path, size, mtime in self.conn.execute(
+            "SELECT path, size, mtime FROM files WHERE directory = ?", (directory,))}
+
+        changed = []
+        seen = set()
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not entry.name.endswith(LIGHTCURVE_EXTENSIONS) or not entry.is_file():
+                    continue
+                seen.add(entry.path)
+                st = entry.stat()
+                if known.get(entry.path) == (st.st_size, st.st_mtime):
+                    continue
+                info = parse_file_name(entry.name)
+                changed.append((
+                    entry.path, directory, entry.name, info['irow'], info['target'], info['exptime'],
+                    info['mission'], info['mission_info'], ','.join(str(n) for n in info['sectors']),
+                    info['author'], st.st_size, st.st_mtime, count_rows(entry.path) if count else None,
+                ))
+
+        removed = [(path,) for path in known if path not in seen]
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO files ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                changed)
+            self.conn.executemany("DELETE FROM files WHERE path = ?", removed)
+        return len(changed), len(removed)
+
+    def files(self, directory, order_by='path'):
+        """List of row dicts for the files of directory."""
+        if order_by not in _COLUMNS:
+            raise ValueError(f"Unknown column '{order_by}'")
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM files WHERE directory = ? ORDER BY {order_by}",
+            (os.path.abspath(directory),))
+        return [dict(zip(_COLUMNS, row)) for row in cursor]
+
+    def groups(self, directory):
+        """
+        Files of directory grouped like STEP2's find_groups: a dict mapping
+        (irow, exptime, mission) to the sorted list of paths, for raw or
+        processed files with a TESS_Sector / K2_Campaign field.
+        """
+        groups = {}
+        cursor = self.conn.execute(
+            "SELECT irow, exptime, mission, path FROM files "
+            "WHERE directory = ? AND exptime IS NOT NULL "
+            "AND file_name LIKE '%LK\\_mission\\_' || mission || '\\_%' ESCAPE '\\' "
+            "ORDER BY path", (os.path.abspath(directory),))
+        for irow, exptime, mission, path in cursor:
+            groups.setdefault((irow, exptime, mission), []).append(path)
+        return groups
+
+    def sector_numbers(self, paths):
+        """Sorted unique sector/campaign numbers of the given catalogued files."""
+        nums = set()
+        for path in paths:
+            row = self.conn.execute("SELECT sectors FROM files WHERE path = ?", (os.path.abspath(path),)).fetchone()
+            if row and row[0]:
+                nums.update(int(n) for n in row[0].split(','))
+        return sorted(nums)
+
+    def set_rgb(self, rgb_by_irow):
+        """Store the RGB classification per irow (e.g. from a describe table)."""
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO targets (irow, rgb) VALUES (?, ?)",
+                                  [(str(irow)[:5], rgb) for irow, rgb in rgb_by_irow.items()])
+
+    def import_rgb(self, describe_csv):
+        """Load the 'file_name' -> 'RGB' columns of a df_lightcurves_describe.csv style table."""
+        import pandas as pd
+
+        df = pd.read_csv(describe_csv)
+        self.set_rgb({str(name)[:5]: rgb for name, rgb in zip(df['file_name'], df['RGB'])})
+
+    def rgb_lookup(self):
+        """Dict irow -> RGB classification."""
+        return dict(self.conn.execute("SELECT irow, rgb FROM targets"))
+
+    def psd_jobs(self, directory, default_rgb=''):
+        """
+        STEP3 job list for the concatenated lightcurves of directory:
+        (file_name, cadence, rgb) with the cadence taken from the exptime
+        field, ordered by file name.
+        """
+        jobs = []
+        cursor = self.conn.execute(
+            "SELECT f.file_name, f.exptime, t.rgb FROM files f LEFT JOIN targets t ON f.irow = t.irow "
+            "WHERE f.directory = ? AND f.exptime IS NOT NULL ORDER BY f.file_name",
+            (os.path.abspath(directory),))
+        for file_name, exptime, rgb in cursor:
+            try:
+                cadence = float(exptime)
+            except ValueError:
+                continue
+            jobs.append((file_name, cadence, default_rgb if rgb is None else rgb))
+        return jobs
+
+    def describe(self, directory):
+        """
+        Per-irow summary in STEP4's layout: a dict
+        irow -> {'tel_target': ..., 'exptime': {exptime: [mission_info, ...]}}.
+        """
+        data = {}
+        cursor = self.conn.execute(
+            "SELECT irow, target, exptime, mission_info FROM files WHERE directory = ? ORDER BY file_name",
+            (os.path.abspath(directory),))
+        for irow, target, exptime, mission_info in cursor:
+            entry = data.setdefault(irow, {'tel_target': None, 'exptime': {}})
+            if target is not None:
+                entry['tel_target'] = target
+            if exptime and mission_info:
+                entry['exptime'].setdefault(exptime, []).append(mission_info)
+        return data
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or update the lightcurve file catalog.")
+    parser.add_argument("db_path", type=str, help="SQLite catalog file.")
+    parser.add_argument("directories", nargs="+", help="Directories to scan.")
+    parser.add_argument("--describe_csv", type=str, default=None, help="Import the RGB class per target from this CSV ('file_name' and 'RGB' columns).")
+    parser.add_argument("--no_count", action="store_true", help="Don't count the rows of new or changed files.")
+
+    args = parser.parse_args()
+
+    with Catalog(args.db_path) as catalog:
+        for directory in args.directories:
+            n_changed, n_removed = catalog.update(directory, count=not args.no_count)
+            print(f"{directory}: {n_changed} new or changed, {n_removed} removed, "
+                  f"{len(catalog.files(directory))} files catalogued")
+        if args.describe_csv:
+            catalog.import_rgb(args.describe_csv)
@@ -0,0 +1,66 @@
+import json
+import os
+
+# Data locations of the pipeline.
+#
+# The steps take their default directories from a JSON file, the first of:
+# the --config option, $LIGHTCURVEPROCESSOR_CONFIG, or lightcurveprocessor.json
+# in the working directory. For example
+#   {"data_dir": "/data/harps", "psd_dir": "/scratch/harps_psd"}
+# Paths not set in the file are DEFAULT_LAYOUT below data_dir. A relative
+# data_dir is relative to the config file, other relative paths to data_dir.
+# Without a data_dir in the file, $LIGHTCURVEPROCESSOR_DATA_DIR is used,
+# and without that the location the scripts have always used.
+CONFIG_ENV = 'LIGHTCURVEPROCESSOR_CONFIG'
+DATA_DIR_ENV = 'LIGHTCURVEPROCESSOR_DATA_DIR'
+CONFIG_FILE_NAME = 'lightcurveprocessor.json'
+DEFAULT_DATA_DIR = '/Users/creyes/Projects/harps'
+DEFAULT_LAYOUT = {
+    'raw_dir': 'lightcurves',
+    'processed_dir': 'processed_lightcurves',
+    'concatenated_dir': 'concatenated_lightcurves',
+    'psd_dir': 'psd',
+    'describe_csv': 'df_lightcurves_describe.csv',
+}
+
+
+def find_config_file(path=None):
+    """Config file to use: path, $LIGHTCURVEPROCESSOR_CONFIG or ./lightcurveprocessor.json (None if none applies)."""
+    if path:
+        return path
+    if os.environ.get(CONFIG_ENV):
+        return os.environ[CONFIG_ENV]
+    if os.path.exists(CONFIG_FILE_NAME):
+        return CONFIG_FILE_NAME
+    return None
+
+
+def load_config(path=None):
+    """
+    Load the pipeline configuration.
+
+    Parameters:
+        path (str): Config file. Default is $LIGHTCURVEPROCESSOR_CONFIG or
+            ./lightcurveprocessor.json if they exist (see find_config_file).
+
+    Returns:
+        dict: data_dir and every DEFAULT_LAYOUT key, as absolute paths.
+    """
+    config_file = find_config_file(path)
+    values = {}
+    base_dir = os.getcwd()
+    if config_file is not None:
+        with open(config_file) as fh:
+            values = json.load(fh)
+        unknown = set(values) - set(DEFAULT_LAYOUT) - {'data_dir'}
+        if unknown:
+            raise ValueError(f"Unknown keys in {config_file}: {sorted(unknown)}, "
+                             f"expected data_dir or {sorted(DEFAULT_LAYOUT)}")
+        base_dir = os.path.dirname(os.path.abspath(config_file))
+
+    data_dir = values.get('data_dir') or os.environ.get(DATA_DIR_ENV) or DEFAULT_DATA_DIR
+    data_dir = os.path.join(base_dir, os.path.expanduser(data_dir))
+    config = {'data_dir': os.path.normpath(data_dir)}
+    for key, default in DEFAULT_LAYOUT.items():
+        config[key] = os.path.normpath(os.path.join(data_dir, os.path.expanduser(values.get(key, default))))
+    return config
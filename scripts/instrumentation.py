@@ -0,0 +1,271 @@
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Per-item metrics of the pipeline stages.
+#
+# An item is one unit of work of a batch (a file in STEP1, a group in STEP2, a
+# star in STEP3). track_item() opens a record for it; inside, the stage code
+# times its phases with track_phase() and adds counters with record(). Every
+# finished item is appended as one JSON line to the run's metrics file, so
+# worker processes write directly to it, like the cache stats log. report()
+# reads the file back and prints a summary table.
+#
+# All helpers accept metrics=None and then do nothing, so the stage functions
+# take an optional metrics argument the same way they take an optional cache.
+
+
+def _peak_rss_mb():
+    """High-water mark of the resident memory of this process, in MB."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1e6 if sys.platform == 'darwin' else rss / 1e3  # bytes on macOS, kB on Linux
+
+
+def _safe_name(name):
+    return re.sub(r'[^\w.-]+', '_', str(name))[-150:]
+
+
+class Metrics:
+    """
+    Collector of per-item wall/CPU time, counters and peak memory for one run.
+
+    Parameters:
+        metrics_dir (str): Directory of the metrics files.
+        run_name (str): Prefix of the JSON-lines file <run_name>_<timestamp>_<pid>.jsonl.
+        profile (int): If > 0, profile every item with cProfile and keep the
+            profiles of the profile slowest items per stage (see report()).
+        trace_memory (bool): Measure the peak Python/numpy allocation of each
+            item with tracemalloc (slower). Otherwise only the process peak
+            RSS is recorded, which never decreases within a worker.
+    """
+
+    def __init__(self, metrics_dir, run_name='run', profile=0, trace_memory=False):
+        os.makedirs(metrics_dir, exist_ok=True)
+        run_id = f"{run_name}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        self.path = os.path.join(metrics_dir, run_id + '.jsonl')
+        self.profile = profile
+        self.profile_dir = os.path.join(metrics_dir, run_id + '_profiles') if profile else None
+        self.trace_memory = trace_memory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local'], state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def item(self, stage, name):
+        """Record one item of a stage; appended to the metrics file on exit."""
+        rec = {'stage': stage, 'item': str(name), 'pid': os.getpid(), 'phases': {}, 'counters': {}}
+        stack = self._stack()
+        stack.append(rec)
+
+        profiler = None
+        if self.profile and len(stack) == 1:
+            profiler = cProfile.Profile()
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+
+        wall0, cpu0 = time.perf_counter(), time.thread_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield rec
+        except BaseException as e:
+            rec['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            rec['wall'] = time.perf_counter() - wall0
+            rec['cpu'] = time.thread_time() - cpu0
+            if self.trace_memory:
+                rec['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+                if started_tracing:
+                    tracemalloc.stop()
+            rec['peak_rss_mb'] = _peak_rss_mb()
+            stack.pop()
+            if profiler is not None:
+                rec['profile'] = self._dump_profile(profiler, stage, name)
+            self._write(rec)
+
+    def _dump_profile(self, profiler, stage, name):
+        directory = os.path.join(self.profile_dir, stage)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{_safe_name(os.path.splitext(os.path.basename(str(name)))[0])}_{os.getpid()}.prof")
+        profiler.dump_stats(path)
+        return path
+
+    def _write(self, rec):
+        line = json.dumps(rec, default=str) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as fh:
+                fh.write(line)
+
+    @contextmanager
+    def phase(self, name):
+        """Add the wall and CPU time of the block to phase name of the current item."""
+        stack = self._stack()
+        if not stack:
+            yield
+            return
+        wall0, cpu0 = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            entry = stack[-1]['phases'].setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+            entry['wall'] += time.perf_counter() - wall0
+            entry['cpu'] += time.thread_time() - cpu0
+
+    def record(self, **values):
+        """Add numeric counters to the current item (other values are stored as is)."""
+        stack = self._stack()
+        if not stack:
+            return
+        counters = stack[-1]['counters']
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and key in counters:
+                counters[key] += value
+            else:
+                counters[key] = value
+
+    def records(self):
+        """All records written so far to this run's metrics file."""
+        try:
+            with open(self.path) as fh:
+                return [json.loads(line) for line in fh if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def report(self, n_slowest=5):
+        """
+        Print a per-stage, per-phase summary table and the slowest items.
+
+        With profiling on, only the profiles of the n = profile slowest items
+        per stage are kept (a pstats text summary is written next to each);
+        the others are deleted.
+        """
+        records = self.records()
+        if not records:
+            print(f"No metrics recorded in {self.path}")
+            return
+
+        by_stage = {}
+        for rec in records:
+            by_stage.setdefault(rec['stage'], []).append(rec)
+
+        print(f"Metrics of {len(records)} items saved in {self.path}")
+        print(f"{'stage':>24s} {'phase':>20s} {'n':>6s} {'wall s':>10s} {'cpu s':>10s} {'% wall':>7s}")
+        for stage, recs in by_stage.items():
+            total_wall = sum(r['wall'] for r in recs)
+            total_cpu = sum(r['cpu'] for r in recs)
+            print(f"{stage:>24s} {'total':>20s} {len(recs):6d} {total_wall:10.3f} {total_cpu:10.3f} {100.0:7.1f}")
+            phases = {}
+            for r in recs:
+                for name, p in r['phases'].items():
+                    acc = phases.setdefault(name, [0, 0.0, 0.0])
+                    acc[0] += 1
+                    acc[1] += p['wall']
+                    acc[2] += p['cpu']
+            for name, (n, wall, cpu) in phases.items():
+                share = 100.0 * wall / total_wall if total_wall > 0 else 0.0
+                print(f"{'':>24s} {name:>20s} {n:6d} {wall:10.3f} {cpu:10.3f} {share:7.1f}")
+
+            counters = {}
+            for r in recs:
+                for key, value in r['counters'].items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        counters[key] = counters.get(key, 0) + value
+            if counters:
+                print(f"{'':>24s} " + ', '.join(f"{k}={v:g}" for k, v in counters.items()))
+            peaks = [r.get('peak_traced_mb') or r.get('peak_rss_mb') for r in recs]
+            peaks = [p for p in peaks if p is not None]
+            if peaks:
+                kind = 'traced' if any('peak_traced_mb' in r for r in recs) else 'RSS'
+                print(f"{'':>24s} peak memory ({kind}): max {max(peaks):.1f} MB")
+            n_failed = sum('error' in r for r in recs)
+            if n_failed:
+                print(f"{'':>24s} {n_failed} failed items")
+
+            slowest = sorted(recs, key=lambda r: r['wall'], reverse=True)
+            print(f"{'':>24s} slowest:")
+            for r in slowest[:n_slowest]:
+                print(f"{'':>26s}{r['wall']:9.3f} s  {r['item']}")
+
+            if self.profile:
+                self._keep_profiles(slowest)
+
+    def _keep_profiles(self, slowest):
+        import pstats
+
+        kept = []
+        for rank, r in enumerate(slowest):
+            path = r.get('profile')
+            if not path or not os.path.exists(path):
+                continue
+            if rank < self.profile:
+                with open(os.path.splitext(path)[0] + '.txt', 'w') as fh:
+                    pstats.Stats(path, stream=fh).sort_stats('cumulative').print_stats(40)
+                kept.append(path)
+            else:
+                os.remove(path)
+        if kept:
+            print(f"{'':>24s} cProfile output of the {len(kept)} slowest items in {os.path.dirname(kept[0])}")
+
+
+def track_item(metrics, stage, name):
+    """metrics.item(stage, name) if metrics are collected, otherwise a no-op context."""
+    return nullcontext() if metrics is None else metrics.item(stage, name)
+
+
+def track_phase(metrics, name):
+    """metrics.phase(name) if metrics are collected, otherwise a no-op context."""
+    return nullcontext() if metrics is None else metrics.phase(name)
+
+
+def record(metrics, **values):
+    """metrics.record(**values) if metrics are collected."""
+    if metrics is not None:
+        metrics.record(**values)
+
+
+def add_metrics_arguments(parser, item='file'):
+    """Add the metrics options (shared by the pipeline CLIs) to an argparse parser."""
+    parser.add_argument("--metrics_dir", type=str, default=None, help=f"Write per-{item} metrics (JSON lines) to this directory and print a summary. Default is off.")
+    parser.add_argument("--profile", type=int, default=0, help=f"With --metrics_dir, keep cProfile output of the N slowest {item}s. Default is 0 (off).")
+    parser.add_argument("--trace_memory", action="store_true", help=f"With --metrics_dir, measure per-{item} peak allocations with tracemalloc (slower).")
+
+
+def metrics_from_args(args, run_name):
+    """Metrics (or None) for run run_name from the options of add_metrics_arguments."""
+    if not args.metrics_dir:
+        return None
+    return Metrics(args.metrics_dir, run_name=run_name, profile=args.profile, trace_memory=args.trace_memory)
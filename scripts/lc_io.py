@@ -0,0 +1,273 @@
+import json
+import os
+import struct
+import threading
+import warnings
+from contextlib import contextmanager
+import numpy as np
+
+# Binary lightcurve container (.lcb):
+#   8 bytes   magic b'LCBIN01\n'
+#   8 bytes   little-endian uint64 length of the JSON header
+#   JSON header {"columns": [...], "n_rows": n, "dtype": "<f8", "metadata": {...}},
+#   space-padded so the data starts on a 64-byte boundary
+#   data      one contiguous little-endian float64 array per column (columnar)
+BINARY_EXTENSION = '.lcb'
+_MAGIC = b'LCBIN01\n'
+_ALIGN = 64
+_WRITE_BLOCK = 1 << 20  # rows converted and written at a time
+
+
+@contextmanager
+def atomic_write(path):
+    """
+    Yield a temporary path next to path and rename it to path once the block
+    succeeds, so a killed writer never leaves a partial file behind. The
+    temporary name starts with a dot, so directory scans don't pick it up.
+    """
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def is_binary(path):
+    """True if path points to a binary lightcurve container."""
+    return path.endswith(BINARY_EXTENSION)
+
+
+def binary_path(path):
+    """Replace the extension of path with the binary container extension."""
+    return os.path.splitext(path)[0] + BINARY_EXTENSION
+
+
+def save_binary(path, time, flux, metadata=None, columns=('TIME', 'FLUX')):
+    """
+    Write time and flux to a binary lightcurve container.
+
+    The columns are converted and written in blocks, so time and flux may
+    be memory maps (of any float dtype) longer than fits in memory. The file
+    appears at path only once complete (see atomic_write).
+
+    Parameters:
+        path (str): Output path (conventionally ending in .lcb).
+        time (array): Time column.
+        flux (array): Flux column, same length as time.
+        metadata (dict): JSON-serializable metadata stored in the header.
+        columns (tuple): Column names stored in the header.
+
+    Returns:
+        str: The output path.
+    """
+    if np.ndim(time) != 1 or np.shape(time) != np.shape(flux):
+        raise ValueError("time and flux must be 1-D arrays of the same length")
+
+    header = json.dumps({
+        'columns': list(columns),
+        'n_rows': len(time),
+        'dtype': '<f8',
+        'metadata': metadata or {},
+    }).encode()
+    prefix_len = len(_MAGIC) + 8
+    header += b' ' * (-(prefix_len + len(header)) % _ALIGN)
+
+    with atomic_write(path) as tmp_path, open(tmp_path, 'wb') as fh:
+        fh.write(_MAGIC)
+        fh.write(struct.pack('<Q', len(header)))
+        fh.write(header)
+        for column in (time, flux):
+            for i in range(0, len(column), _WRITE_BLOCK):
+                fh.write(np.ascontiguousarray(column[i:i + _WRITE_BLOCK], dtype='<f8').tobytes())
+
+    return path
+
+
+def read_binary_header(path):
+    """Return (header dict, byte offset of the data block) of a binary container."""
+    with open(path, 'rb') as fh:
+        if fh.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"{path} is not a binary lightcurve file")
+        (header_len,) = struct.unpack('<Q', fh.read(8))
+        header = json.loads(fh.read(header_len))
+    return header, len(_MAGIC) + 8 + header_len
+
+
+def load_binary(path, mmap=True):
+    """
+    Read a binary lightcurve container.
+
+    With mmap=True the columns are read-only np.memmap views into the file,
+    so nothing is copied until the data is modified or indexed.
+
+    Returns:
+        tuple: (time, flux, metadata)
+    """
+    header, offset = read_binary_header(path)
+    shape = (len(header['columns']), header['n_rows'])
+    if shape[1] == 0:
+        empty = np.empty(0)
+        return empty, empty.copy(), header['metadata']
+
+    if mmap:
+        data = np.memmap(path, dtype=header['dtype'], mode='r', offset=offset, shape=shape)
+    else:
+        with open(path, 'rb') as fh:
+            fh.seek(offset)
+            data = np.fromfile(fh, dtype=header['dtype'], count=shape[0] * shape[1]).reshape(shape)
+
+    return data[0], data[1], header['metadata']
+
+
+def _sniff(path):
+    """Return (delimiter, has_header) from the first non-empty line of a text file."""
+    with open(path, 'r') as fh:
+        for line in fh:
+            if line.strip():
+                break
+        else:
+            return None, False
+
+    delimiter = ',' if ',' in line else None
+    first_token = line.split(delimiter)[0].strip()
+    try:
+        float(first_token)
+        has_header = False
+    except ValueError:
+        has_header = first_token.lower() not in ('', 'nan')
+    return delimiter, has_header
+
+
+def load_text(path, time_col=0, flux_col=1, delimiter='auto', header='auto'):
+    """
+    Read the time column and one flux column of a text lightcurve.
+
+    Handles whitespace- or comma-delimited files with or without a header
+    line and parses only the two requested columns. The C parser of
+    np.loadtxt is used first; files with empty fields (how pandas writes NaN)
+    fall back to pandas' C parser, which reads them as NaN. Both paths parse
+    floats exactly, and 'nan' strings are NaN in both.
+
+    Parameters:
+        path (str): Text file to read.
+        time_col (int): Index of the time column.
+        flux_col (int): Index of the flux column.
+        delimiter (str): ',' or None (whitespace); 'auto' detects it.
+        header (bool): Whether the first line is a header; 'auto' detects it.
+            A purely numeric header such as STEP1's "0,1" cannot be detected
+            and must be passed explicitly.
+
+    Returns:
+        tuple: (time, flux) as contiguous float64 numpy arrays.
+    """
+    sniffed_delimiter, sniffed_header = _sniff(path)
+    if delimiter == 'auto':
+        delimiter = sniffed_delimiter
+    if header == 'auto':
+        header = sniffed_header
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)  # empty input
+            data = np.loadtxt(path, delimiter=delimiter, skiprows=1 if header else 0,
+                              usecols=(time_col, flux_col), ndmin=2)
+        return np.ascontiguousarray(data[:, 0]), np.ascontiguousarray(data[:, 1])
+    except ValueError:
+        pass
+
+    import pandas as pd
+
+    try:
+        df = pd.read_csv(
+            path,
+            sep=r'\s+' if delimiter is None else delimiter,
+            header=None,
+            skiprows=1 if header else 0,
+            usecols=[time_col, flux_col],
+            dtype=np.float64,
+            engine='c',
+            float_precision='round_trip',
+        )
+    except pd.errors.EmptyDataError:
+        return np.array([]), np.array([])
+
+    return df[time_col].to_numpy(), df[flux_col].to_numpy()
+
+
+def iter_text(path, time_col=0, flux_col=1, delimiter='auto', header='auto', chunk_rows=1 << 20):
+    """
+    Read a text lightcurve like load_text, but yield it as (time, flux)
+    blocks of at most chunk_rows rows, so only one block is in memory.
+
+    Uses pandas' C parser with round-trip float parsing, which gives the
+    same values as load_text.
+    """
+    import pandas as pd
+
+    sniffed_delimiter, sniffed_header = _sniff(path)
+    if delimiter == 'auto':
+        delimiter = sniffed_delimiter
+    if header == 'auto':
+        header = sniffed_header
+
+    try:
+        reader = pd.read_csv(
+            path,
+            sep=r'\s+' if delimiter is None else delimiter,
+            header=None,
+            skiprows=1 if header else 0,
+            usecols=[time_col, flux_col],
+            dtype=np.float64,
+            engine='c',
+            float_precision='round_trip',
+            chunksize=chunk_rows,
+        )
+        with reader:
+            for df in reader:
+                yield df[time_col].to_numpy(), df[flux_col].to_numpy()
+    except pd.errors.EmptyDataError:
+        return
+
+
+def load_many(paths, n_threads=4, **kwargs):
+    """
+    Read many text or binary lightcurves concurrently and pack them into two
+    preallocated arrays.
+
+    Parameters:
+        paths (list): Files to read.
+        n_threads (int): Number of reader threads.
+        **kwargs: Passed to load_text for text files.
+
+    Returns:
+        tuple: (time, flux, offsets) where the i-th lightcurve is
+        time[offsets[i]:offsets[i + 1]].
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def read(path):
+        if is_binary(path):
+            time, flux, _ = load_binary(path)
+            return time, flux
+        return load_text(path, **kwargs)
+
+    if n_threads > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            parts = list(pool.map(read, paths))
+    else:
+        parts = [read(path) for path in paths]
+
+    offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(time) for time, _ in parts])
+    time = np.empty(offsets[-1])
+    flux = np.empty(offsets[-1])
+    for i, (t, f) in enumerate(parts):
+        time[offsets[i]:offsets[i + 1]] = t
+        flux[offsets[i]:offsets[i + 1]] = f
+    return time, flux, offsets
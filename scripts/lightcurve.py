@@ -0,0 +1,184 @@
+import json
+import os
+import numpy as np
+
+from catalog import parse_file_name
+
+# Lightcurve type passed between the pipeline stages.
+#
+# time and flux are contiguous float64 arrays (or read-only memory maps of a
+# .lcb file). Invalid rows are flagged with an optional boolean mask instead
+# of being deleted, so loading and NaN screening don't copy; valid() gives
+# the valid rows, as the arrays themselves when nothing is masked. Slices,
+# between() and sector() are views sharing the arrays. The metadata that
+# otherwise only lives in the file names travels in a LightCurveMeta.
+
+
+class LightCurveMeta:
+    """
+    Metadata of a lightcurve.
+
+    Parameters:
+        irow (str): Target prefix (first 5 characters of the file names).
+        target (str): Target name.
+        exptime (str): Exposure time field of the file names (cadence in seconds).
+        mission (str): 'TESS' or 'K2'.
+        sectors (list): Sector or campaign numbers.
+        shifts (list): Time offsets in days that STEP2's gap fixing added to
+            the pieces between large gaps, in time order. Empty if not shifted.
+        n_filled (int): Points inserted by STEP1's gap filling.
+        source (str): Name of the file the lightcurve was read from.
+    """
+
+    __slots__ = ('irow', 'target', 'exptime', 'mission', 'sectors', 'shifts', 'n_filled', 'source')
+
+    def __init__(self, irow=None, target=None, exptime=None, mission=None, sectors=(), shifts=(), n_filled=0,
+                 source=None):
+        self.irow = irow
+        self.target = target
+        self.exptime = exptime
+        self.mission = mission
+        self.sectors = [int(n) for n in sectors]
+        self.shifts = [float(s) for s in shifts]
+        self.n_filled = int(n_filled)
+        self.source = source
+
+    @classmethod
+    def from_file_name(cls, path):
+        """Metadata parsed from a raw, processed or concatenated file name (see catalog.parse_file_name)."""
+        file_name = os.path.basename(path)
+        info = parse_file_name(file_name)
+        return cls(info['irow'], info['target'], info['exptime'], info['mission'], info['sectors'], source=file_name)
+
+    @property
+    def is_shifted(self):
+        return bool(self.shifts)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def copy(self, **changes):
+        """Copy of the record with some fields replaced."""
+        fields = self.to_dict()
+        fields.update(changes)
+        return LightCurveMeta(**fields)
+
+    def __repr__(self):
+        return f"LightCurveMeta({', '.join(f'{k}={v!r}' for k, v in self.to_dict().items())})"
+
+
+class LightCurve:
+    """
+    Time series with a validity mask and metadata.
+
+    Parameters:
+        time (array): Time stamps in days.
+        flux (array): Flux values, same length as time.
+        mask (array): Optional boolean array, True for valid rows. None means
+            all rows are valid.
+        meta (LightCurveMeta): Metadata. Default is an empty record.
+        segments (tuple): Optional ((sector, start, stop), ...) row ranges of
+            the sectors/campaigns a concatenated lightcurve is made of.
+    """
+
+    __slots__ = ('time', 'flux', 'mask', 'meta', 'segments')
+
+    def __init__(self, time, flux, mask=None, meta=None, segments=None):
+        time = np.ascontiguousarray(time, dtype=np.float64)
+        flux = np.ascontiguousarray(flux, dtype=np.float64)
+        if time.ndim != 1 or time.shape != flux.shape:
+            raise ValueError("time and flux must be 1-D arrays of the same length")
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            if mask.shape != time.shape:
+                raise ValueError("mask must have the shape of time")
+        self.time = time
+        self.flux = flux
+        self.mask = mask
+        self.meta = LightCurveMeta() if meta is None else meta
+        self.segments = None if segments is None else tuple(tuple(int(x) for x in s) for s in segments)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __repr__(self):
+        return (f"LightCurve({len(self)} rows, {self.n_valid} valid, irow={self.meta.irow!r}, "
+                f"exptime={self.meta.exptime!r}, mission={self.meta.mission!r}, sectors={self.meta.sectors})")
+
+    @property
+    def n_valid(self):
+        """Number of valid rows."""
+        return len(self.time) if self.mask is None else int(np.count_nonzero(self.mask))
+
+    def valid(self):
+        """(time, flux) of the valid rows; the arrays themselves (no copy) if nothing is masked."""
+        if self.mask is None:
+            return self.time, self.flux
+        return self.time[self.mask], self.flux[self.mask]
+
+    def with_mask(self, mask):
+        """Lightcurve sharing the arrays, with mask combined (and) with the current one."""
+        mask = np.asarray(mask, dtype=bool)
+        if self.mask is not None:
+            mask = mask & self.mask
+        if mask.all():
+            mask = None
+        return LightCurve(self.time, self.flux, mask, self.meta, self.segments)
+
+    def mask_nan(self):
+        """Lightcurve sharing the arrays, with rows having NaN time or flux masked."""
+        return self.with_mask(~(np.isnan(self.time) | np.isnan(self.flux)))
+
+    def compress(self):
+        """Lightcurve with only the valid rows (self if nothing is masked)."""
+        if self.mask is None:
+            return self
+        starts = np.cumsum(self.mask) - self.mask  # valid rows before each row
+        segments = None
+        if self.segments is not None:
+            kept = np.concatenate([starts, [self.n_valid]])
+            segments = [(sector, kept[start], kept[stop]) for sector, start, stop in self.segments]
+        time, flux = self.valid()
+        return LightCurve(time, flux, None, self.meta, segments)
+
+    def __getitem__(self, index):
+        """View of a slice of rows, e.g. lc[100:200]."""
+        if not isinstance(index, slice):
+            raise TypeError("LightCurve only supports slicing; use with_mask() to select rows")
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            raise ValueError("LightCurve slices must be contiguous")
+        stop = max(start, stop)
+        segments = None
+        if self.segments is not None:
+            segments = [(sector, max(s0, start) - start, min(s1, stop) - start)
+                        for sector, s0, s1 in self.segments if s0 < stop and s1 > start]
+        mask = None if self.mask is None else self.mask[start:stop]
+        return LightCurve(self.time[start:stop], self.flux[start:stop], mask, self.meta, segments)
+
+    def between(self, t_start, t_stop):
+        """View of the rows with t_start <= time < t_stop (time must be sorted)."""
+        start, stop = np.searchsorted(self.time, [t_start, t_stop], side='left')
+        return self[start:stop]
+
+    def sector(self, number):
+        """View of the rows of one sector/campaign of a concatenated lightcurve."""
+        for sector, start, stop in self.segments or ():
+            if sector == number:
+                view = self[start:stop]
+                view.meta = self.meta.copy(sectors=[number])
+                return view
+        raise KeyError(f"No segment for sector/campaign {number}")
+
+    def to_arrays(self):
+        """(time, flux, mask, header) tuple of arrays/strings, e.g. for a ResultCache entry."""
+        mask = np.empty(0, dtype=bool) if self.mask is None else self.mask
+        header = json.dumps({'meta': self.meta.to_dict(), 'segments': self.segments})
+        return self.time, self.flux, mask, header
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Inverse of to_arrays()."""
+        time, flux, mask, header = arrays
+        header = json.loads(str(header))
+        return cls(time, flux, mask if len(mask) else None, LightCurveMeta(**header['meta']), header['segments'])
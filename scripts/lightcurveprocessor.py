@@ -0,0 +1,56 @@
+import argparse
+import importlib
+import sys
+
+# Single entry point of the pipeline:
+#
+#   python scripts/lightcurveprocessor.py <command> [options]
+#
+# Every command is the command-line interface of one step script
+# (add_arguments / main_from_args), so the options are the same as when the
+# script is run directly. Only the module of the chosen command is imported,
+# and the steps import pandas and astropy only in the functions that use
+# them, so cheap commands (describe, run-all --dry_run, --help) start
+# without paying for them. benchmarks/bench_startup.py keeps track of this.
+COMMANDS = {
+    'process': ('STEP1_process_lightcurves', "Gap-fill, sigma-clip and normalize raw lightcurves (STEP1)."),
+    'concatenate': ('STEP2_group_and_concatenate_and_fix_gaps',
+                    "Group processed lightcurves, concatenate them and close large gaps (STEP2)."),
+    'psd': ('STEP3_save_psd', "Compute the PSDs of the concatenated lightcurves (STEP3)."),
+    'describe': ('STEP4_describe_files', "Summarize the lightcurve files per irow and exptime (STEP4)."),
+    'run-all': ('run_pipeline', "Run STEP1 -> STEP2 -> STEP3 in memory, one group of raw lightcurves at a time."),
+}
+
+
+def build_parser(command=None):
+    """
+    Argument parser with one subcommand per entry of COMMANDS. Only the
+    options of command are added (importing its module); the others just
+    appear in the command list.
+    """
+    parser = argparse.ArgumentParser(
+        prog='lightcurveprocessor',
+        description="Lightcurve processing pipeline. Run '<command> --help' for the options of a command.",
+    )
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    for name, (module_name, help_text) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text, description=help_text)
+        if name == command:
+            importlib.import_module(module_name).add_arguments(subparser)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    command = argv[0] if argv and argv[0] in COMMANDS else None
+    parser = build_parser(command)
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    importlib.import_module(COMMANDS[args.command][0]).main_from_args(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import queue
+import threading
+
+# Read -> compute -> write pipeline for one worker.
+#
+# Reader threads load upcoming items into a bounded prefetch queue while the
+# calling thread computes, and writer threads drain a bounded write-behind
+# queue, so file I/O (and the GIL-releasing parts of parsing and writing)
+# overlaps the NumPy work. The queue bounds give backpressure: at most
+# prefetch loaded items and write_behind results wait in memory, plus one in
+# each thread. With prefetch=0 and write_behind=0 everything runs inline.
+
+_DONE = object()
+
+
+def _error(e):
+    return f"{type(e).__name__}: {e}"
+
+
+def _put(q, value, stop):
+    """q.put(value), giving up when stop is set (so threads never hang on a full queue)."""
+    while not stop.is_set():
+        try:
+            q.put(value, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def run_pipelined(items, load, compute, write, prefetch=4, write_behind=4, n_readers=2, n_writers=1):
+    """
+    Run write(item, compute(item, load(item))) for every item, with loading
+    and writing in background threads.
+
+    Parameters:
+        items (list): Work items.
+        load (callable): load(item) -> data, run in the reader threads.
+        compute (callable): compute(item, data) -> result, run in the calling thread.
+        write (callable): write(item, result) -> output, run in the writer threads.
+        prefetch (int): Loaded items that may wait for compute.
+        write_behind (int): Results that may wait for writing.
+        n_readers (int): Reader threads.
+        n_writers (int): Writer threads.
+
+    Yields:
+        tuple: (item, output, error) in completion order; error is a string
+        if any of the three steps raised, output is None then.
+    """
+    items = list(items)
+    if prefetch <= 0 and write_behind <= 0:
+        for item in items:
+            try:
+                yield item, write(item, compute(item, load(item))), None
+            except Exception as e:
+                yield item, None, _error(e)
+        return
+
+    stop = threading.Event()
+    loaded = queue.Queue(maxsize=max(prefetch, 1))
+    to_write = queue.Queue(maxsize=max(write_behind, 1))
+    done = queue.Queue()  # (item, output, error), small tuples
+    next_index = iter(range(len(items)))
+    index_lock = threading.Lock()
+
+    def reader():
+        while not stop.is_set():
+            with index_lock:
+                i = next(next_index, None)
+            if i is None:
+                break
+            try:
+                data = load(items[i])
+            except Exception as e:
+                done.put((items[i], None, _error(e)))
+                continue
+            if not _put(loaded, (items[i], data), stop):
+                return
+        _put(loaded, _DONE, stop)
+
+    def writer():
+        while True:
+            try:
+                entry = to_write.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if entry is _DONE:
+                return
+            item, result = entry
+            try:
+                done.put((item, write(item, result), None))
+            except Exception as e:
+                done.put((item, None, _error(e)))
+
+    readers = [threading.Thread(target=reader, daemon=True) for _ in range(max(n_readers, 1))]
+    writers = [threading.Thread(target=writer, daemon=True) for _ in range(max(n_writers, 1))]
+    for t in readers + writers:
+        t.start()
+
+    def drain():
+        while True:
+            try:
+                yield done.get_nowait()
+            except queue.Empty:
+                return
+
+    try:
+        n_finished_readers = 0
+        while n_finished_readers < len(readers):
+            entry = loaded.get()
+            if entry is _DONE:
+                n_finished_readers += 1
+                continue
+            item, data = entry
+            try:
+                result = compute(item, data)
+            except Exception as e:
+                done.put((item, None, _error(e)))
+            else:
+                del data
+                _put(to_write, (item, result), stop)
+            yield from drain()
+
+        for _ in writers:
+            _put(to_write, _DONE, stop)
+        for t in writers:
+            t.join()
+        yield from drain()
+    finally:
+        stop.set()
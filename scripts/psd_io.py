@@ -0,0 +1,260 @@
+import json
+import struct
+import numpy as np
+
+from lc_io import atomic_write, load_text
+
+# Multi-resolution PSD container (.psdb):
+#   8 bytes   magic b'PSDMR01\n'
+#   8 bytes   little-endian uint64 length of the JSON header
+#   JSON header {"levels": {name: {...}}, "metadata": {...}}, space-padded so
+#   the data starts on a 64-byte boundary
+#   data      the columns of every level, each starting on a 64-byte boundary
+#
+# Levels:
+#   'full'               - the PSD as computed, power in float32
+#   'log<n>'             - mean power in n logarithmic bins per decade (bin
+#                          edges at 10**(k / n) uHz, the same for every star),
+#                          with the number of frequencies averaged per bin
+#   'smooth<width>uHz'   - boxcar (moving mean) of the given width in uHz,
+#                          sampled every half width
+#
+# Each level header has "n_rows" and "columns" ({name: {"dtype", "offset"}},
+# offsets relative to the data start). A regular frequency axis (the
+# Lomb-Scargle grids and the smoothed levels) is stored as "grid": [f0, df]
+# instead of a column and rebuilt as f0 + df * arange(n_rows), which
+# reproduces the float64 grid exactly. Everything else is float32 (power),
+# float64 (irregular frequencies) or int32 (counts). Fitters read only the
+# level they need: load_psd memory-maps its columns.
+PSD_EXTENSION = '.psdb'
+DEFAULT_LOG_BINS = (100,)
+DEFAULT_SMOOTH_WIDTHS = (0.1, 1.0)
+_MAGIC = b'PSDMR01\n'
+_ALIGN = 64
+
+
+def is_psd_binary(path):
+    """True if path points to a multi-resolution PSD container."""
+    return path.endswith(PSD_EXTENSION)
+
+
+def log_level_name(bins_per_decade):
+    return f"log{bins_per_decade:g}"
+
+
+def smooth_level_name(width):
+    return f"smooth{width:g}uHz"
+
+
+def log_bin(freq, power, bins_per_decade):
+    """
+    Average power in logarithmic frequency bins.
+
+    Bin k covers 10**(k / bins_per_decade) <= freq < 10**((k + 1) / bins_per_decade)
+    (uHz); empty bins are dropped.
+
+    Returns:
+        tuple: (mean frequency, mean power, count) per bin.
+    """
+    freq = np.asarray(freq, dtype=np.float64)
+    power = np.asarray(power, dtype=np.float64)
+    positive = freq > 0
+    freq, power = freq[positive], power[positive]
+    if len(freq) == 0:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+
+    index = np.floor(np.log10(freq) * bins_per_decade).astype(np.int64)
+    index -= index.min()
+    count = np.bincount(index)
+    used = count > 0
+    count = count[used]
+    return (np.bincount(index, weights=freq)[used] / count,
+            np.bincount(index, weights=power)[used] / count,
+            count)
+
+
+def _boxcar(freq, power, width):
+    """(first centre, centre spacing, smoothed power) of boxcar_smooth."""
+    freq = np.asarray(freq, dtype=np.float64)
+    power = np.asarray(power, dtype=np.float64)
+    df = freq[1] - freq[0]
+    window = int(min(max(1, round(width / df)), len(freq)))
+    step = max(1, window // 2)
+    cumulative = np.concatenate([[0.0], np.cumsum(power)])
+    starts = np.arange(0, len(freq) - window + 1, step)
+    smoothed = (cumulative[starts + window] - cumulative[starts]) / window
+    return float(freq[0] + df * (window - 1) / 2), float(df * step), smoothed
+
+
+def boxcar_smooth(freq, power, width):
+    """
+    Moving mean of power over width (uHz) of a regular frequency grid,
+    sampled every half width.
+
+    Returns:
+        tuple: (frequency of the window centres, smoothed power).
+    """
+    if len(freq) < 2:
+        return np.array(freq, dtype=np.float64), np.array(power, dtype=np.float64)
+    c0, dc, smoothed = _boxcar(freq, power, width)
+    return c0 + dc * np.arange(len(smoothed)), smoothed
+
+
+def _regular_grid(freq):
+    """[f0, df] if freq is exactly f0 + df * arange(n), else None."""
+    if len(freq) < 2:
+        return None
+    # freq[1] - freq[0] may be off from the df the grid was built with in
+    # the last bit, so a few neighbouring candidates are tried
+    f0 = float(freq[0])
+    steps = np.arange(len(freq))
+    for df in (freq[1] - freq[0], (freq[-1] - freq[0]) / (len(freq) - 1), 2 * f0):
+        for candidate in (df, np.nextafter(df, -np.inf), np.nextafter(df, np.inf)):
+            if np.array_equal(f0 + candidate * steps, freq):
+                return [f0, float(candidate)]
+    return None
+
+
+def multires_levels(freq, power, log_bins=DEFAULT_LOG_BINS, smooth_widths=DEFAULT_SMOOTH_WIDTHS):
+    """
+    The levels of a multi-resolution PSD.
+
+    Returns:
+        dict: level name -> (frequency, power, count or None, grid or None,
+        attributes); grid is [f0, df] for a regular frequency axis.
+    """
+    levels = {'full': (freq, power, None, _regular_grid(freq), {'kind': 'full'})}
+    for bins_per_decade in log_bins:
+        f, p, n = log_bin(freq, power, bins_per_decade)
+        levels[log_level_name(bins_per_decade)] = (f, p, n, None, {'kind': 'log', 'bins_per_decade': bins_per_decade})
+    for width in smooth_widths:
+        attributes = {'kind': 'smooth', 'width': width}
+        if len(freq) < 2:
+            levels[smooth_level_name(width)] = (freq, power, None, None, attributes)
+            continue
+        c0, dc, p = _boxcar(freq, power, width)
+        levels[smooth_level_name(width)] = (c0 + dc * np.arange(len(p)), p, None, [c0, dc], attributes)
+    return levels
+
+
+def save_multires_psd(path, freq, power, log_bins=DEFAULT_LOG_BINS, smooth_widths=DEFAULT_SMOOTH_WIDTHS,
+                      metadata=None):
+    """
+    Write a PSD and its log-binned and smoothed versions to one container.
+
+    The file appears at path only once complete (see lc_io.atomic_write).
+
+    Parameters:
+        path (str): Output path (conventionally ending in .psdb).
+        freq (array): Frequencies in uHz, increasing.
+        power (array): Power density, same length as freq.
+        log_bins (tuple): Bins per decade of the log-binned levels.
+        smooth_widths (tuple): Boxcar widths in uHz of the smoothed levels.
+        metadata (dict): JSON-serializable metadata stored in the header.
+
+    Returns:
+        str: The output path.
+    """
+    freq = np.asarray(freq, dtype=np.float64)
+    if freq.ndim != 1 or freq.shape != np.shape(power):
+        raise ValueError("freq and power must be 1-D arrays of the same length")
+
+    headers = {}
+    blocks = []
+    offset = 0
+    for name, (f, p, n, grid, attributes) in multires_levels(freq, power, log_bins, smooth_widths).items():
+        level = dict(attributes, n_rows=len(f), columns={})
+        columns = [('power', np.asarray(p, dtype='<f4'))]
+        if grid is None:
+            columns.insert(0, ('frequency', np.asarray(f, dtype='<f8')))
+        else:
+            level['grid'] = grid
+        if n is not None:
+            columns.append(('count', np.asarray(n, dtype='<i4')))
+        for column_name, data in columns:
+            level['columns'][column_name] = {'dtype': data.dtype.str, 'offset': offset}
+            blocks.append((offset, data))
+            offset += data.nbytes + (-data.nbytes % _ALIGN)
+        headers[name] = level
+
+    header = json.dumps({'levels': headers, 'metadata': metadata or {}}).encode()
+    prefix_len = len(_MAGIC) + 8
+    header += b' ' * (-(prefix_len + len(header)) % _ALIGN)
+
+    with atomic_write(path) as tmp_path, open(tmp_path, 'wb') as fh:
+        fh.write(_MAGIC)
+        fh.write(struct.pack('<Q', len(header)))
+        fh.write(header)
+        data_start = fh.tell()
+        for block_offset, data in blocks:
+            fh.seek(data_start + block_offset)
+            fh.write(data.tobytes())
+        fh.truncate(data_start + offset)
+
+    return path
+
+
+def read_psd_header(path):
+    """Return (header dict, byte offset of the data block) of a multi-resolution PSD."""
+    with open(path, 'rb') as fh:
+        if fh.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"{path} is not a multi-resolution PSD file")
+        (header_len,) = struct.unpack('<Q', fh.read(8))
+        header = json.loads(fh.read(header_len))
+    return header, len(_MAGIC) + 8 + header_len
+
+
+def psd_levels(path):
+    """Names of the levels stored in a PSD file ('full' only for a CSV PSD)."""
+    if not is_psd_binary(path):
+        return ['full']
+    return list(read_psd_header(path)[0]['levels'])
+
+
+def load_psd(path, level='full', mmap=True):
+    """
+    Read one level of a PSD written by STEP3, as multi-resolution container
+    or CSV (which only has the 'full' level).
+
+    With mmap=True the stored columns are read-only np.memmap views, so only
+    the pages of the requested level are read.
+
+    Returns:
+        tuple: (frequency, power, info); info is the level's header entry
+        (kind, n_rows, bins_per_decade or width, ...) plus 'count' (bins
+        averaged) for log levels and 'metadata' (the file's metadata).
+    """
+    if not is_psd_binary(path):
+        if level != 'full':
+            raise KeyError(f"{path} is a CSV PSD and only has the 'full' level")
+        freq, power = load_text(path, delimiter=',', header=True)
+        return freq, power, {'kind': 'full', 'n_rows': len(freq), 'metadata': {}}
+
+    header, data_start = read_psd_header(path)
+    try:
+        info = dict(header['levels'][level])
+    except KeyError:
+        raise KeyError(f"{path} has no level '{level}', available: {list(header['levels'])}") from None
+    n_rows = info['n_rows']
+
+    columns = {}
+    for name, column in info.pop('columns').items():
+        if n_rows == 0:
+            columns[name] = np.empty(0, dtype=column['dtype'])
+        elif mmap:
+            columns[name] = np.memmap(path, dtype=column['dtype'], mode='r', offset=data_start + column['offset'],
+                                      shape=(n_rows,))
+        else:
+            with open(path, 'rb') as fh:
+                fh.seek(data_start + column['offset'])
+                columns[name] = np.fromfile(fh, dtype=column['dtype'], count=n_rows)
+
+    if 'grid' in info:
+        f0, df = info['grid']
+        freq = f0 + df * np.arange(n_rows)
+    else:
+        freq = columns['frequency']
+    if 'count' in columns:
+        info['count'] = columns['count']
+    info['metadata'] = header['metadata']
+    return freq, columns['power'], info
@@ -0,0 +1,186 @@
+import numpy as np
+
+# Ragged batches: many lightcurves packed into concatenated arrays plus
+# offsets, the i-th one being values[offsets[i]:offsets[i + 1]] (the layout
+# lc_io.load_many returns). The functions below work on all segments at once
+# with a fixed number of numpy calls, instead of one call per lightcurve.
+
+
+def segment_lengths(offsets):
+    """Number of values of every segment."""
+    return np.diff(np.asarray(offsets, dtype=np.int64))
+
+
+def segment_ids(offsets):
+    """Segment index of every value."""
+    lengths = segment_lengths(offsets)
+    return np.repeat(np.arange(len(lengths)), lengths)
+
+
+def compress_offsets(keep, offsets):
+    """Offsets of the segments after keeping only the values where keep is True."""
+    kept_before = np.zeros(len(keep) + 1, dtype=np.int64)
+    np.cumsum(keep, out=kept_before[1:])
+    return kept_before[np.asarray(offsets, dtype=np.int64)]
+
+
+def pack(arrays):
+    """Concatenate a list of 1-D arrays into (values, offsets)."""
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(a) for a in arrays])
+    values = np.concatenate(arrays) if arrays else np.empty(0)
+    return values, offsets
+
+
+def unpack(values, offsets):
+    """Split values back into one array (view) per segment."""
+    return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def sort_within_segments(values, offsets, stable=True):
+    """
+    Order that sorts the values of every segment (NaNs last) while keeping the
+    segments in place. With stable=False, equal values may come in any order.
+    """
+    order = np.argsort(values, kind='stable' if stable else 'quicksort')
+    seg = segment_ids(offsets)
+    # Small integer keys are sorted by radix sort
+    seg = seg.astype(np.int16 if len(offsets) <= 2 ** 15 else np.int32)
+    return order[np.argsort(seg[order], kind='stable')]
+
+
+def segment_median(values, offsets):
+    """
+    Median of every segment, as np.median of each slice (NaN for empty
+    segments, or segments containing NaNs).
+    """
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = segment_lengths(offsets)
+    out = np.full(len(lengths), np.nan)
+    ok = lengths > 0
+    if not ok.any():
+        return out
+    sorted_values = values[sort_within_segments(values, offsets, stable=False)]
+    starts = offsets[:-1][ok]
+    low = sorted_values[starts + (lengths[ok] - 1) // 2]
+    high = sorted_values[starts + lengths[ok] // 2]
+    # NaNs sort last, so a segment with a NaN has one as its last value
+    has_nan = np.isnan(sorted_values[starts + lengths[ok] - 1])
+    out[ok] = np.where(has_nan, np.nan, np.where(lengths[ok] % 2 == 1, low, (low + high) / 2))
+    return out
+
+
+def segment_std(values, offsets, ddof=0):
+    """
+    Standard deviation of every segment, as np.std of each slice (NaN where
+    there are not more than ddof values). The sums are accumulated in order
+    rather than pairwise, so results can differ from np.std in the last bit.
+    """
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = segment_lengths(offsets)
+    out = np.full(len(lengths), np.nan)
+    ok = lengths > ddof
+    if not ok.any():
+        return out
+    starts = offsets[:-1]
+    nonempty = lengths > 0
+    sums = np.zeros(len(lengths))
+    sums[nonempty] = np.add.reduceat(values, starts[nonempty])
+    means = np.zeros(len(lengths))
+    means[nonempty] = sums[nonempty] / lengths[nonempty]
+    deviations = values - np.repeat(means, lengths)
+    squares = np.zeros(len(lengths))
+    squares[nonempty] = np.add.reduceat(deviations * deviations, starts[nonempty])
+    out[ok] = np.sqrt(squares[ok] / (lengths[ok] - ddof))
+    return out
+
+
+def window_bounds(t, offsets, width):
+    """
+    Rows of the time window of every sample: for sample j of a segment with
+    sorted times, [lo[j], hi[j]) are the samples k of the same segment with
+    |t[k] - t[j]| <= width, evaluated exactly as running_median does.
+
+    Returns:
+        tuple: (lo, hi) arrays of global row indices.
+    """
+    t = np.asarray(t, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = segment_lengths(offsets)
+    rows = np.arange(len(t))
+    if len(t) == 0:
+        return rows, rows.copy()
+    seg = np.repeat(np.arange(len(lengths)), lengths)
+    starts = offsets[:-1][seg]
+    ends = offsets[1:][seg]
+
+    # First guess: search all segments at once on one increasing key, with the
+    # segments laid out far enough apart that windows cannot reach the next one
+    first = t[starts]
+    span = float(np.max(t - first))
+    reach = min(width, span + 1)
+    key = (t - first) + seg * (2 * span + 3)
+    lo = np.clip(np.searchsorted(key, key - reach, side='left'), starts, rows)
+    hi = np.clip(np.searchsorted(key, key + reach, side='right'), rows + 1, ends)
+
+    # Then move every bound by single rows until the exact comparisons of
+    # running_median hold (rounding of the key is off by a row or so)
+    last = len(t) - 1
+    while True:
+        lo_out = (lo > starts) & (t - t[np.maximum(lo - 1, 0)] <= width)
+        lo_in = (lo < rows) & (t - t[lo] > width)
+        hi_out = (hi < ends) & (t[np.minimum(hi, last)] - t <= width)
+        hi_in = (hi > rows + 1) & (t[hi - 1] - t > width)
+        if not (lo_out.any() or lo_in.any() or hi_out.any() or hi_in.any()):
+            return lo, hi
+        lo = lo - lo_out + lo_in
+        hi = hi + hi_out - hi_in
+
+
+class WaveletMatrix:
+    """
+    Wavelet matrix of a sequence of non-negative integers: the k-th smallest
+    value of any slice values[lo:hi], answered for whole arrays of queries in
+    one vectorized step per bit of the largest value.
+
+    Parameters:
+        values (array): Non-negative integers below 2**31 (e.g. ranks).
+    """
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.int32)
+        n = len(values)
+        if n >= 2 ** 31:
+            raise ValueError("WaveletMatrix supports up to 2**31 - 1 values")
+        self.n_bits = max(1, int(values.max()).bit_length()) if n else 1
+        self.levels = []  # (bit, zeros before every position, total zeros), highest bit first
+        for bit in range(self.n_bits - 1, -1, -1):
+            is_zero = (values & (1 << bit)) == 0
+            zeros = np.empty(n + 1, dtype=np.int32)
+            zeros[0] = 0
+            np.cumsum(is_zero, out=zeros[1:])
+            self.levels.append((bit, zeros, int(zeros[-1])))
+            values = np.concatenate((values[is_zero], values[~is_zero]))
+
+    def kth_smallest(self, lo, hi, k):
+        """
+        k-th smallest (k = 0 for the minimum) of values[lo:hi], for arrays of
+        queries with 0 <= k < hi - lo. Results for other queries are undefined.
+        """
+        lo = np.asarray(lo).astype(np.int32)
+        hi = np.asarray(hi).astype(np.int32)
+        k = np.asarray(k).astype(np.int32)
+        result = np.zeros(len(k), dtype=np.int32)
+        for bit, zeros, n_zeros in self.levels:
+            zeros_lo = zeros.take(lo)
+            zeros_hi = zeros.take(hi)
+            n_zero = zeros_hi - zeros_lo
+            one = k >= n_zero
+            # Zeros go to the front of the next level, ones after them
+            lo = np.where(one, lo - zeros_lo + n_zeros, zeros_lo)
+            hi = np.where(one, hi - zeros_hi + n_zeros, zeros_hi)
+            k -= n_zero * one
+            result |= one.astype(np.int32) << bit
+        return result
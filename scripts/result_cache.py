@@ -0,0 +1,218 @@
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import numpy as np
+
+import lc_io
+
+# Content-addressed cache of stage results.
+#
+# A key is the hash of the stage name, the bytes of its inputs (files are
+# hashed by content, arrays by their raw bytes), its parameters and the source
+# code of the modules implementing it. Results are tuples of arrays/scalars
+# stored as .npz files under <cache_dir>/<key[:2]>/<key>.npz. Every hit or
+# miss is appended to <cache_dir>/stats.log so that stats can be aggregated
+# across worker processes. Every key also covers lc_io, through which the
+# stages read their inputs.
+
+_source_hashes = {}
+
+# put() keeps a running total of the cache size and only scans the entries
+# when it exceeds the budget, or after this many puts to pick up the entries
+# written by other processes.
+RESCAN_EVERY = 1000
+
+
+def code_version(*objects):
+    """Hash of the source files defining the given modules/functions."""
+    h = hashlib.sha256()
+    for obj in objects:
+        path = inspect.getsourcefile(obj)
+        if path not in _source_hashes:
+            with open(path, 'rb') as fh:
+                _source_hashes[path] = hashlib.sha256(fh.read()).hexdigest()
+        h.update(_source_hashes[path].encode())
+    return h.hexdigest()
+
+
+def _hash_file(h, path, block_size=1 << 20):
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            h.update(block)
+
+
+class ResultCache:
+    """
+    Disk cache for stage results with a size budget and LRU eviction.
+
+    Parameters:
+        cache_dir (str): Directory holding the cache entries.
+        max_bytes (int): Disk budget; the least recently used entries are
+            evicted once it is exceeded. None means unbounded.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._total_bytes = None  # size of the entries as of the last scan, plus our puts since
+        self._puts_since_scan = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        if max_bytes is not None:
+            self.evict(max_bytes)
+
+    def make_key(self, stage, inputs, params, code=()):
+        """Key of a stage call: hash of stage, inputs (paths or arrays), params and code version."""
+        h = hashlib.sha256()
+        h.update(stage.encode())
+        h.update(json.dumps(params, sort_keys=True, default=str).encode())
+        h.update(code_version(lc_io, *code).encode())
+        for item in inputs:
+            if isinstance(item, str):
+                _hash_file(h, item)
+            else:
+                item = np.ascontiguousarray(item)
+                h.update(str(item.dtype).encode())
+                h.update(item.tobytes())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.npz')
+
+    def _log(self, event, nbytes=0):
+        with open(os.path.join(self.cache_dir, 'stats.log'), 'a') as fh:
+            fh.write(f"{event} {nbytes}\n")
+
+    def get(self, key):
+        """Return the cached tuple for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                result = tuple(data[f'arr_{i}'] for i in range(len(data.files)))
+            nbytes = os.path.getsize(path)
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError, KeyError):
+            self._log('miss')
+            return None
+
+        self._log('hit', nbytes)
+        return tuple(r.item() if r.ndim == 0 else r for r in result)
+
+    def put(self, key, result):
+        """Store a tuple of arrays/scalars under key, then enforce the disk budget."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced_bytes = os.path.getsize(path)
+        except OSError:
+            replaced_bytes = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            np.savez(fh, *[np.asarray(r) for r in result])
+        os.replace(tmp_path, path)
+        if self.max_bytes is None:
+            return
+        self._puts_since_scan += 1
+        if self._total_bytes is None or self._puts_since_scan >= RESCAN_EVERY:
+            self.evict(self.max_bytes)
+            return
+        self._total_bytes += os.path.getsize(path) - replaced_bytes
+        if self._total_bytes > self.max_bytes:
+            self.evict(self.max_bytes)
+
+    def entries(self):
+        """List of (mtime, size, path) for every cache entry."""
+        entries = []
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith('.npz'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def evict(self, max_bytes):
+        """
+        Delete least recently used entries until the cache fits in max_bytes.
+        Rescans every entry, which also resets the running size total of put().
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        n_evicted = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            n_evicted += 1
+        self._total_bytes = total
+        self._puts_since_scan = 0
+        if n_evicted:
+            self._log('evict', n_evicted)
+        return n_evicted
+
+    def cached(self, stage, inputs, params, compute, code=()):
+        """Return compute() for this stage call, reusing a cached result when available."""
+        key = self.make_key(stage, inputs, params, code)
+        result = self.get(key)
+        if result is None:
+            result = tuple(compute())
+            self.put(key, result)
+        return result
+
+    def stats(self):
+        """Aggregate hits, misses, evictions and bytes served from the cache."""
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes_saved': 0}
+        try:
+            with open(os.path.join(self.cache_dir, 'stats.log')) as fh:
+                for line in fh:
+                    event, value = line.split()
+                    if event == 'hit':
+                        stats['hits'] += 1
+                        stats['bytes_saved'] += int(value)
+                    elif event == 'miss':
+                        stats['misses'] += 1
+                    elif event == 'evict':
+                        stats['evictions'] += int(value)
+        except FileNotFoundError:
+            pass
+        entries = self.entries()
+        stats['entries'] = len(entries)
+        stats['size_bytes'] = sum(size for _, size, _ in entries)
+        return stats
+
+    def report(self):
+        """Print the cache statistics."""
+        s = self.stats()
+        lookups = s['hits'] + s['misses']
+        hit_rate = 100.0 * s['hits'] / lookups if lookups else 0.0
+        print(f"Cache {self.cache_dir}: {s['hits']} hits, {s['misses']} misses ({hit_rate:.1f}% hit rate), "
+              f"{s['bytes_saved'] / 1e6:.1f} MB served from cache, {s['evictions']} evictions, "
+              f"{s['entries']} entries using {s['size_bytes'] / 1e6:.1f} MB")
+
+
+def cached_call(cache, stage, inputs, params, compute, code=()):
+    """cache.cached(...) if a cache is given, otherwise just compute()."""
+    if cache is None:
+        return tuple(compute())
+    return cache.cached(stage, inputs, params, compute, code)
+
+
+def add_cache_arguments(parser):
+    """Add the result cache options (shared by the pipeline CLIs) to an argparse parser."""
+    parser.add_argument("--cache_dir", type=str, default=None, help="Directory of the result cache. Default is no cache.")
+    parser.add_argument("--cache_size_mb", type=float, default=None, help="Disk budget of the cache in MB (LRU eviction). Default is unbounded.")
+    parser.add_argument("--cache_stats", "--cache-stats", action="store_true", help="Print cache hits, misses and bytes saved at the end.")
+
+
+def cache_from_args(args):
+    """ResultCache (or None) from the options of add_cache_arguments."""
+    if not args.cache_dir:
+        return None
+    max_bytes = None if args.cache_size_mb is None else int(args.cache_size_mb * 1e6)
+    return ResultCache(args.cache_dir, max_bytes=max_bytes)
@@ -0,0 +1,359 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from config import load_config
+from instrumentation import add_metrics_arguments, metrics_from_args, track_item, track_phase
+from lightcurve import LightCurve
+from result_cache import add_cache_arguments, cache_from_args, cached_call
+from sharding import add_shard_arguments, claim_and_run, in_shard, parse_shard, queue_from_args
+from STEP1_process_lightcurves import (
+    _cached_process, _processed_metadata, clean_lightcurve, load_raw_lightcurve, processed_name, save_processed,
+)
+from STEP2_group_and_concatenate_and_fix_gaps import (
+    _concatenated_metadata, concatenated_name, find_groups, merge_and_fix_gaps, parse_sector_campaign_nums, save_concatenated,
+)
+from psd_io import DEFAULT_LOG_BINS, DEFAULT_SMOOTH_WIDTHS
+from STEP3_save_psd import (
+    PSD_ENGINES, PSD_FORMATS, add_segmented_arguments, psd_file_name, psd_from_lightcurve, psd_metadata, save_psd,
+    segmented_from_args, segmented_psd_from_lightcurve, split_segments,
+)
+
+
+def psd_name(concatenated_file_name, psd_format='csv', segmented=False):
+    """Name STEP3 gives the PSD of a concatenated lightcurve."""
+    return psd_file_name(concatenated_file_name, psd_format, segmented)
+
+
+def process_group(key, file_list, psd_dir, rgb='', processed_dir=None, concatenated_dir=None,
+                  output_format='csv', gap_threshold=1.5 / 24, sigma_clip=4, filter_window=10,
+                  concat_gap_threshold=80.0, psd_engine='auto', psd_format='csv', resolutions=None,
+                  psd_segmented=None, cache=None, metrics=None):
+    """
+    Run STEP1 -> STEP2 -> STEP3 in memory for one group of raw files.
+
+    Parameters:
+        key (tuple): (prefix5, exptime, mission) group key from find_groups.
+        file_list (list): Raw lightcurve files of the group.
+        psd_dir (str): Directory for the PSD output.
+        rgb (str): RGB classification passed to the PSD ('RGB_CMD' or other).
+        processed_dir (str): If given, also save the STEP1 intermediates here.
+        concatenated_dir (str): If given, also save the STEP2 intermediate here.
+        output_format (str): 'csv' or 'binary' for the intermediates.
+        gap_threshold, sigma_clip, filter_window: STEP1 parameters.
+        concat_gap_threshold (float): STEP2 gap threshold in days.
+        psd_engine (str): Lomb-Scargle engine used by the PSD (see STEP3 PSD_ENGINES).
+        psd_format (str): PSD output format (see STEP3 PSD_FORMATS).
+        resolutions (dict): log_bins and smooth_widths of the 'multires' format.
+        psd_segmented (dict): Options of STEP3's segmented_psd_from_lightcurve
+            for a segmented PSD, split at the sectors/campaigns of the group
+            by default. Default is None (full-length PSD).
+        cache (ResultCache): Optional result cache shared by the three stages.
+        metrics (Metrics): Optional instrumentation, one item per group with
+            the phases of all three stages.
+
+    Returns:
+        str: Path of the PSD file, or None if the group had no valid data.
+    """
+    prefix5, exptime_val, mission = key
+    params = {'gap_threshold': gap_threshold, 'sigma_clip': sigma_clip, 'filter_window': filter_window}
+
+    def clean(fp):
+        with track_phase(metrics, 'load'):
+            lc = load_raw_lightcurve(fp)
+        return clean_lightcurve(lc, metrics=metrics, **params)
+
+    with track_item(metrics, 'pipeline_group', "_".join(key)):
+        # STEP1: clean every sector/campaign of the group
+        lightcurves = []
+        for fp in file_list:
+            # Same cache entries as STEP1's process_lightcurve
+            lc = _cached_process(cache, fp, params, lambda: clean(fp))
+            if processed_dir:
+                with track_phase(metrics, 'write'):
+                    save_processed(os.path.join(processed_dir, processed_name(os.path.basename(fp))), lc,
+                                   output_format, _processed_metadata(fp, params, lc.meta.n_filled))
+            if len(lc) == 0:
+                print(f"WARNING file {fp} empty")
+                continue
+            lightcurves.append(lc)
+
+        # STEP2: concatenate and fix gaps
+        sc_nums = parse_sector_campaign_nums(file_list, mission)
+        with track_phase(metrics, 'merge_and_fix_gaps'):
+            final = LightCurve.from_arrays(cached_call(
+                cache, 'merge_and_fix_gaps', [lc.time for lc in lightcurves] + [lc.flux for lc in lightcurves],
+                {'gap_threshold': concat_gap_threshold},
+                lambda: merge_and_fix_gaps(lightcurves, gap_threshold=concat_gap_threshold).to_arrays(),
+                code=(merge_and_fix_gaps, LightCurve),
+            ))
+        if len(final) == 0:
+            return None
+
+        out_name = concatenated_name(prefix5, exptime_val, mission, sc_nums, final.meta.is_shifted)
+        if concatenated_dir:
+            metadata = _concatenated_metadata(key, sc_nums, final.meta.is_shifted, concat_gap_threshold)
+            with track_phase(metrics, 'write'):
+                save_concatenated(os.path.join(concatenated_dir, out_name), final, output_format, metadata)
+
+        # STEP3: PSD
+        cadence = float(exptime_val)
+        if psd_segmented is None:
+            freq, power = cached_call(
+                cache, 'psd_from_lightcurve', [final.time, final.flux], {'cadence': cadence, 'rgb': rgb, 'engine': psd_engine},
+                lambda: psd_from_lightcurve(final, cadence, rgb, psd_engine, metrics=metrics),
+                code=(psd_from_lightcurve,),
+            )
+        else:
+            freq, power = cached_call(
+                cache, 'segmented_psd_from_lightcurve', [final.time, final.flux],
+                {'cadence': cadence, 'rgb': rgb, 'engine': psd_engine, 'segmented': psd_segmented,
+                 'segments': final.segments},
+                lambda: segmented_psd_from_lightcurve(final, cadence, rgb, psd_engine, metrics=metrics, **psd_segmented),
+                code=(psd_from_lightcurve, split_segments, segmented_psd_from_lightcurve),
+            )
+        output_file = os.path.join(psd_dir, psd_name(out_name, psd_format, psd_segmented is not None))
+        with track_phase(metrics, 'write'):
+            save_psd(output_file, freq, power, metadata=psd_metadata(out_name, cadence, rgb, psd_engine, psd_segmented),
+                     **(resolutions or {}))
+
+        return output_file
+
+
+def _run_group(key, file_list, kwargs, queue=None):
+    """
+    Worker entry point: run one group, reporting a failure instead of raising.
+    Returns (key, claimed, output_file, error); claimed is False if the group
+    is claimed by another worker of the queue.
+    """
+    try:
+        claimed, output_file = claim_and_run(queue, "_".join(key), lambda: process_group(key, file_list, **kwargs))
+        return key, claimed, output_file, None
+    except Exception as e:
+        return key, True, None, f"{type(e).__name__}: {e}"
+
+
+def load_rgb_lookup(describe_csv):
+    """Map prefix5 -> RGB classification from a df_lightcurves_describe.csv style table."""
+    import pandas as pd
+
+    df = pd.read_csv(describe_csv)
+    return {str(name)[:5]: rgb for name, rgb in zip(df['file_name'], df['RGB'])}
+
+
+def run_pipeline(raw_dir, psd_dir, n_jobs=4, executor='process', describe_csv=None,
+                 processed_dir=None, concatenated_dir=None, overwrite=False, cache=None, catalog=None,
+                 metrics=None, shard=None, queue=None, dry_run=False, **kwargs):
+    """
+    Fused pipeline: group the raw files, then run STEP1 -> STEP2 -> STEP3 per
+    group in memory, in parallel across groups. Only the PSDs are written,
+    plus the intermediates if processed_dir / concatenated_dir are given.
+
+    Parameters:
+        raw_dir (str): Directory containing raw lightcurve files.
+        psd_dir (str): Directory to save the PSD files.
+        n_jobs (int): Number of parallel workers.
+        executor (str): 'process', 'thread' or 'serial'.
+        describe_csv (str): Optional table with 'file_name' and 'RGB' columns
+            giving the RGB classification per target.
+        processed_dir (str): Keep STEP1 intermediates in this directory.
+        concatenated_dir (str): Keep STEP2 intermediates in this directory.
+        overwrite (bool): Recompute groups whose PSD already exists. Without
+            it, a rerun resumes an interrupted run (PSDs are written
+            atomically, see lc_io.atomic_write).
+        cache (ResultCache): Optional result cache shared by the three stages.
+        catalog (Catalog): Optional file catalog (see catalog.py) used for
+            grouping, and for the RGB classes when describe_csv is not given.
+        metrics (Metrics): Optional instrumentation; a summary table is
+            printed at the end.
+        shard (str): "i/N" to process only the targets of shard i of N
+            (see sharding.py).
+        queue (WorkQueue): Claim each group in this shared queue before
+            running it, so several runs (nodes) can share the work.
+        dry_run (bool): Only list the groups that would be run.
+        **kwargs: Passed to process_group (STEP1/STEP2 parameters, output_format,
+            psd_engine, psd_format, resolutions, psd_segmented).
+
+    Returns:
+        list: List of PSD file paths (empty for a dry run).
+    """
+    if executor not in ('process', 'thread', 'serial'):
+        raise ValueError(f"Unknown executor '{executor}', expected 'process', 'thread' or 'serial'")
+
+    for d in (psd_dir, processed_dir, concatenated_dir):
+        if d and not dry_run:
+            os.makedirs(d, exist_ok=True)
+
+    if describe_csv:
+        rgb_lookup = load_rgb_lookup(describe_csv)
+    elif catalog is not None:
+        rgb_lookup = catalog.rgb_lookup()
+    else:
+        rgb_lookup = {}
+    groups = find_groups(raw_dir, catalog=catalog)
+
+    if shard is not None:
+        shard = parse_shard(shard)
+        groups = {key: file_list for key, file_list in groups.items() if in_shard(key[0], shard)}
+
+    tasks = []
+    for key, file_list in groups.items():
+        prefix5, exptime_val, mission = key
+        if not overwrite:
+            sc_nums = parse_sector_campaign_nums(file_list, mission)
+            names = [psd_name(concatenated_name(prefix5, exptime_val, mission, sc_nums, s), kwargs.get('psd_format', 'csv'),
+                              kwargs.get('psd_segmented') is not None)
+                     for s in (True, False)]
+            if any(os.path.exists(os.path.join(psd_dir, n)) for n in names):
+                print(f"Output already exists for {key}, skipping.")
+                continue
+        tasks.append((key, file_list))
+
+    # Largest groups first
+    tasks.sort(key=lambda task: sum(os.path.getsize(fp) for fp in task[1]), reverse=True)
+
+    if dry_run:
+        for key, file_list in tasks:
+            size = sum(os.path.getsize(fp) for fp in file_list)
+            print(f"{'_'.join(key)}: {len(file_list)} files, {size / 1e6:.1f} MB, RGB '{rgb_lookup.get(key[0], '')}'")
+        print(f"{len(tasks)} groups to run.")
+        return []
+
+    group_kwargs = dict(kwargs, processed_dir=processed_dir, concatenated_dir=concatenated_dir, cache=cache,
+                        metrics=metrics)
+    outputs = []
+    failures = []
+
+    skipped = []
+
+    def report(key, claimed, output_file, error):
+        n_done = len(outputs) + len(failures) + len(skipped) + 1
+        if not claimed:
+            skipped.append(key)
+            print(f"({n_done}/{len(tasks)}) {key} claimed by another worker, skipping.")
+        elif error is not None:
+            failures.append((key, error))
+            print(f"({n_done}/{len(tasks)}) FAILED {key}: {error}")
+        elif output_file is None:
+            failures.append((key, "no valid data"))
+            print(f"({n_done}/{len(tasks)}) No valid data for group {key}, skipping.")
+        else:
+            outputs.append(output_file)
+            print(f"({n_done}/{len(tasks)}) Saved: {output_file}")
+
+    def task_kwargs(key):
+        return dict(group_kwargs, rgb=rgb_lookup.get(key[0], ''), psd_dir=psd_dir)
+
+    if executor == 'serial':
+        for key, file_list in tasks:
+            report(*_run_group(key, file_list, task_kwargs(key), queue))
+    else:
+        pool_cls = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        with pool_cls(max_workers=n_jobs) as pool:
+            futures = [pool.submit(_run_group, key, file_list, task_kwargs(key), queue) for key, file_list in tasks]
+            for future in as_completed(futures):
+                report(*future.result())
+
+    # Claims are tried once more, in case a lock went stale meanwhile (its
+    # owner was killed); groups still held belong to a live worker
+    if skipped:
+        retry = set(skipped)
+        skipped.clear()
+        print(f"Retrying {len(retry)} groups claimed by other workers")
+        for key, file_list in tasks:
+            if key in retry:
+                report(*_run_group(key, file_list, task_kwargs(key), queue))
+
+    if failures:
+        print(f"{len(failures)} of {len(tasks)} groups not processed:")
+        for key, error in failures:
+            print(f"  {key}: {error}")
+    if metrics is not None:
+        metrics.report()
+
+    return outputs
+
+
+def add_arguments(parser):
+    """Add the command-line options of the fused pipeline to an argparse parser."""
+    parser.add_argument("raw_dir", type=str, nargs="?", default=None, help="Directory containing raw lightcurve files. Default is raw_dir of the config.")
+    parser.add_argument("psd_dir", type=str, nargs="?", default=None, help="Directory to save the PSD files. Default is psd_dir of the config.")
+    parser.add_argument("--config", type=str, default=None, help="JSON file with the data directories (see config.py). Default is $LIGHTCURVEPROCESSOR_CONFIG or ./lightcurveprocessor.json.")
+    parser.add_argument("--dry_run", action="store_true", help="Only list the groups that would be run.")
+    parser.add_argument("--n_jobs", type=int, default=4, help="Number of parallel processes to use. Default is 4.")
+    parser.add_argument("--executor", choices=["thread", "process", "serial"], default="process", help="Execution mode. Default is 'process'.")
+    parser.add_argument("--describe_csv", type=str, default=None, help="CSV with 'file_name' and 'RGB' columns giving the RGB class per target.")
+    parser.add_argument("--processed_dir", type=str, default=None, help="Also keep the processed (STEP1) lightcurves in this directory.")
+    parser.add_argument("--concatenated_dir", type=str, default=None, help="Also keep the concatenated (STEP2) lightcurves in this directory.")
+    parser.add_argument("--output_format", choices=["csv", "binary"], default="csv", help="Format of the kept intermediates. Default is csv.")
+    parser.add_argument("--catalog", type=str, default=None, help="SQLite file catalog used for grouping and RGB classes (see catalog.py). Default is a directory scan.")
+    parser.add_argument("--overwrite", action="store_true", help="Recompute groups whose PSD already exists.")
+    add_shard_arguments(parser, item='group')
+    parser.add_argument("--psd_engine", choices=PSD_ENGINES, default="auto", help="Lomb-Scargle engine for the PSD. Default is auto.")
+    add_segmented_arguments(parser)
+    parser.add_argument("--psd_format", choices=PSD_FORMATS, default="csv", help="PSD output format: csv, or multires for one compact binary file per group with the float32 PSD plus log-binned and smoothed versions. Default is csv.")
+    parser.add_argument("--log_bins", type=str, default=",".join(f"{n:g}" for n in DEFAULT_LOG_BINS), help=f"With --psd_format multires, comma-separated bins per decade of the log-binned levels (empty for none). Default is {','.join(f'{n:g}' for n in DEFAULT_LOG_BINS)}.")
+    parser.add_argument("--smooth_widths", type=str, default=",".join(f"{w:g}" for w in DEFAULT_SMOOTH_WIDTHS), help=f"With --psd_format multires, comma-separated boxcar widths in uHz of the smoothed levels (empty for none). Default is {','.join(f'{w:g}' for w in DEFAULT_SMOOTH_WIDTHS)}.")
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser, item='group')
+    parser.add_argument("--gap_threshold", type=float, default=1.5 / 24, help="STEP1 gap threshold in days. Default is 1.5 hours.")
+    parser.add_argument("--sigma_clip", type=float, default=4, help="Sigma threshold for clipping outliers. Default is 4.")
+    parser.add_argument("--filter_window", type=float, default=10, help="Half-width of the running-median normalization window in days. Default is 10.")
+    parser.add_argument("--concat_gap_threshold", type=float, default=80.0, help="STEP2 gap threshold in days. Default is 80.")
+
+
+def main_from_args(args):
+    """Run the fused pipeline with options parsed by add_arguments."""
+    if args.raw_dir is None or args.psd_dir is None:
+        config = load_config(args.config)
+        args.raw_dir = args.raw_dir or config['raw_dir']
+        args.psd_dir = args.psd_dir or config['psd_dir']
+
+    cache = cache_from_args(args)
+
+    catalog = None
+    if args.catalog:
+        from catalog import Catalog
+        catalog = Catalog(args.catalog)
+
+    metrics = metrics_from_args(args, 'pipeline')
+
+    psd_files = run_pipeline(
+        raw_dir=args.raw_dir,
+        psd_dir=args.psd_dir,
+        n_jobs=args.n_jobs,
+        executor=args.executor,
+        describe_csv=args.describe_csv,
+        processed_dir=args.processed_dir,
+        concatenated_dir=args.concatenated_dir,
+        overwrite=args.overwrite,
+        cache=cache,
+        catalog=catalog,
+        metrics=metrics,
+        shard=args.shard,
+        queue=queue_from_args(args),
+        dry_run=args.dry_run,
+        output_format=args.output_format,
+        gap_threshold=args.gap_threshold,
+        sigma_clip=args.sigma_clip,
+        filter_window=args.filter_window,
+        concat_gap_threshold=args.concat_gap_threshold,
+        psd_engine=args.psd_engine,
+        psd_format=args.psd_format,
+        resolutions={'log_bins': [float(n) for n in args.log_bins.split(',') if n],
+                     'smooth_widths': [float(w) for w in args.smooth_widths.split(',') if w]},
+        psd_segmented=segmented_from_args(args),
+    )
+
+    if not args.dry_run:
+        print(f"Computed {len(psd_files)} PSDs. Results saved in {args.psd_dir}.")
+
+    if cache is not None and args.cache_stats:
+        cache.report()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run STEP1 -> STEP2 -> STEP3 in memory, one group of raw lightcurves at a time.")
+    add_arguments(parser)
+    main_from_args(parser.parse_args())
@@ -0,0 +1,226 @@
+import heapq
+import numpy as np
+
+from ragged import WaveletMatrix, segment_ids, sort_within_segments, window_bounds
+
+
+class _SlidingMedian:
+    """
+    Median of a sliding multiset using two heaps with lazy deletion.
+
+    `low` is a max-heap (values stored negated) holding the smaller half,
+    `high` is a min-heap holding the larger half. Entries carry the sample
+    index so that removals can be deferred until they reach the top.
+    Insertions and removals are O(log w) for a window of w samples.
+    """
+
+    def __init__(self, n):
+        self.low = []
+        self.high = []
+        self.n_low = 0
+        self.n_high = 0
+        self.side = np.zeros(n, dtype=bool).tolist()     # True -> sample lives in `high`
+        self.removed = np.zeros(n, dtype=bool).tolist()
+
+    def _prune(self):
+        low, high, removed = self.low, self.high, self.removed
+        while low and removed[low[0][1]]:
+            heapq.heappop(low)
+        while high and removed[high[0][1]]:
+            heapq.heappop(high)
+
+    def _rebalance(self):
+        # Keep n_low == n_high or n_low == n_high + 1
+        if self.n_low > self.n_high + 1:
+            self._prune()
+            v, i = heapq.heappop(self.low)
+            heapq.heappush(self.high, (-v, i))
+            self.side[i] = True
+            self.n_low -= 1
+            self.n_high += 1
+        elif self.n_high > self.n_low:
+            self._prune()
+            v, i = heapq.heappop(self.high)
+            heapq.heappush(self.low, (-v, i))
+            self.side[i] = False
+            self.n_high -= 1
+            self.n_low += 1
+
+    def add(self, value, i):
+        self._prune()
+        if self.low and value > -self.low[0][0]:
+            heapq.heappush(self.high, (value, i))
+            self.side[i] = True
+            self.n_high += 1
+        else:
+            heapq.heappush(self.low, (-value, i))
+            self.side[i] = False
+            self.n_low += 1
+        self._rebalance()
+
+    def remove(self, i):
+        self.removed[i] = True
+        if self.side[i]:
+            self.n_high -= 1
+        else:
+            self.n_low -= 1
+        self._rebalance()
+
+    def median(self):
+        if self.n_low == 0:
+            return np.nan
+        self._prune()
+        if self.n_low > self.n_high:
+            return -self.low[0][0]
+        return (-self.low[0][0] + self.high[0][0]) / 2
+
+
+def running_median(t, f, width):
+    """
+    Time-windowed running median.
+
+    For every sample j, returns the median of all non-NaN f[k] with
+    |t[k] - t[j]| <= width, i.e. the same value as
+    np.nanmedian(f[np.abs(t - t[j]) <= width]). The window is tracked with
+    two pointers over the sorted time array and a two-heap median, so the
+    cost is O(n log w) instead of O(n^2).
+
+    Parameters:
+        t (array): Time stamps (need not be sorted).
+        f (array): Values; NaNs are skipped.
+        width (float): Half-width of the window, in the units of `t`.
+
+    Returns:
+        array: Running median (NaN where the window holds no valid samples).
+    """
+    t = np.asarray(t, dtype=float)
+    f = np.asarray(f, dtype=float)
+    n = len(t)
+    out = np.full(n, np.nan)
+    if n == 0:
+        return out
+
+    order = None
+    if np.any(np.diff(t) < 0):
+        order = np.argsort(t, kind='stable')
+        t = t[order]
+        f = f[order]
+
+    tl = t.tolist()
+    fl = f.tolist()
+    valid = (~np.isnan(f)).tolist()
+    window = _SlidingMedian(n)
+    medians = [np.nan] * n
+
+    lo = hi = 0
+    for j in range(n):
+        tj = tl[j]
+        # Same comparison as |t[k] - t[j]| <= width, evaluated per side
+        while hi < n and tl[hi] - tj <= width:
+            if valid[hi]:
+                window.add(fl[hi], hi)
+            hi += 1
+        while tj - tl[lo] > width:
+            if valid[lo]:
+                window.remove(lo)
+            lo += 1
+        medians[j] = window.median()
+
+    if order is None:
+        out[:] = medians
+    else:
+        out[order] = medians
+    return out
+
+
+def running_median_ragged(t, f, offsets, width):
+    """
+    running_median of every lightcurve of a ragged batch (see ragged.py) at once.
+
+    Samples are ranked by value within their lightcurve, the window of every
+    sample is found by vectorized bisection, and the middle ranks of all
+    windows are selected together with a wavelet matrix of the ranks, so the
+    cost is O(N log N) numpy work for N samples in total, with no Python loop
+    over samples or lightcurves. The medians are the same values as those of
+    running_median on each lightcurve.
+
+    Parameters:
+        t (array): Concatenated time stamps (need not be sorted).
+        f (array): Concatenated values; NaNs are skipped.
+        offsets (array): Lightcurve i is t[offsets[i]:offsets[i + 1]].
+        width (float): Half-width of the window, in the units of `t`.
+
+    Returns:
+        array: Concatenated running medians (NaN where the window holds no
+        valid samples).
+    """
+    t = np.asarray(t, dtype=float)
+    f = np.asarray(f, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    out = np.full(len(t), np.nan)
+    if len(t) == 0:
+        return out
+
+    # Same stable time order as running_median, within each lightcurve
+    order = None
+    boundaries = offsets[1:-1]
+    descending = np.diff(t) < 0
+    descending[boundaries[(boundaries > 0) & (boundaries < len(t))] - 1] = False
+    if descending.any():
+        order = sort_within_segments(t, offsets)
+        t = t[order]
+        f = f[order]
+
+    # Ranks by value within each lightcurve, NaNs last (they never count)
+    seg = segment_ids(offsets)
+    by_value = sort_within_segments(f, offsets, stable=False)
+    ranks = np.empty(len(f), dtype=np.int64)
+    ranks[by_value] = np.arange(len(f))
+    ranks -= offsets[:-1][seg]
+    sorted_values = f[by_value]
+    n_valid_before = np.zeros(len(f) + 1, dtype=np.int64)
+    np.cumsum(~np.isnan(f), out=n_valid_before[1:])
+
+    lo, hi = window_bounds(t, offsets, width)
+    count = n_valid_before[hi] - n_valid_before[lo]
+    rows = np.nonzero(count > 0)[0]
+    lo, hi, count = lo[rows], hi[rows], count[rows]
+
+    # Lower and upper middle values of every window, as the two-heap median
+    middle = WaveletMatrix(ranks).kth_smallest(np.concatenate((lo, lo)), np.concatenate((hi, hi)),
+                                               np.concatenate(((count - 1) // 2, count // 2)))
+    first = offsets[:-1][seg[rows]]
+    low = sorted_values[first + middle[:len(rows)]]
+    high = sorted_values[first + middle[len(rows):]]
+    medians = np.full(len(t), np.nan)
+    medians[rows] = np.where(count % 2 == 1, low, (low + high) / 2)
+
+    if order is None:
+        out[:] = medians
+    else:
+        out[order] = medians
+    return out
+
+
+def running_median_bruteforce(t, f, width):
+    """Reference O(n^2) implementation of running_median, used for validation."""
+    t = np.asarray(t, dtype=float)
+    f = np.asarray(f, dtype=float)
+    out = np.full(len(t), np.nan)
+    for j in range(len(t)):
+        mask = np.abs(t - t[j]) <= width
+        if np.any(mask & ~np.isnan(f)):
+            out[j] = np.nanmedian(f[mask])
+    return out
+
+
+def local_normalize(t, f, width):
+    """Divide f by its running median over +/- width (NaN samples stay NaN)."""
+    f = np.asarray(f, dtype=float)
+    return f / running_median(t, f, width)
+
+
+def local_normalize_ragged(t, f, offsets, width):
+    """local_normalize of every lightcurve of a ragged batch at once."""
+    f = np.asarray(f, dtype=float)
+    return f / running_median_ragged(t, f, offsets, width)
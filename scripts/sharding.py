@@ -0,0 +1,225 @@
+import json
+import os
+import re
+import socket
+import time
+import uuid
+import zlib
+
+# Splitting a run over several nodes that share a filesystem.
+#
+# Static sharding: --shard i/N keeps the tasks whose target prefix hashes
+# (crc32, stable across machines and Python versions, unlike hash()) to i
+# modulo N, so every step of a target lands on the same node.
+#
+# Dynamic claiming: a WorkQueue directory holds one lock file per task,
+# created with O_CREAT | O_EXCL so exactly one worker wins it. A finished
+# task's lock is renamed to .done; a failed task's lock is removed so that
+# it can be retried.
+#
+# Outputs are written to a temporary file and renamed into place
+# (lc_io.atomic_write), so a killed run leaves complete outputs or none, and
+# a rerun (--resume, or the queue's .done markers) continues where it
+# stopped. Locks of killed workers are taken over when their process is
+# gone or a zombie (same host) or older than stale_after seconds (any host).
+# Drivers retry the tasks they found claimed once at the end of their run,
+# so a lock that only went stale meanwhile does not drop its task.
+
+
+def parse_shard(spec):
+    """Parse a shard spec "i/N" (0 <= i < N) into (i, N)."""
+    try:
+        index, n_shards = (int(x) for x in str(spec).split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}', expected i/N") from None
+    if not 0 <= index < n_shards:
+        raise ValueError(f"Invalid shard '{spec}', expected 0 <= i < N")
+    return index, n_shards
+
+
+def shard_of(prefix, n_shards):
+    """Shard (0 .. n_shards - 1) of a target prefix."""
+    return zlib.crc32(str(prefix).encode()) % n_shards
+
+
+def in_shard(prefix, shard):
+    """True if prefix belongs to shard (an (i, N) tuple or "i/N"); always True for shard=None."""
+    if shard is None:
+        return True
+    index, n_shards = parse_shard(shard) if isinstance(shard, str) else shard
+    return shard_of(prefix, n_shards) == index
+
+
+def _process_start(pid):
+    """
+    (state, start time in clock ticks since boot) of a local process from
+    /proc, or None where /proc is not available. Raises ProcessLookupError
+    if there is no such process.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as fh:
+            stat = fh.read()
+    except FileNotFoundError:
+        if os.path.isdir('/proc/self'):
+            raise ProcessLookupError(pid) from None
+        return None
+    except OSError:
+        return None
+    # The command name in parentheses may contain spaces; the fields after it are
+    # state (3rd field of the line) ... starttime (22nd)
+    fields = stat[stat.rindex(')') + 2:].split()
+    return fields[0], int(fields[19])
+
+
+def _pid_alive(pid, start=None):
+    """
+    True if local process pid is running. Zombies (killed workers not reaped
+    yet) count as dead, and so does a process that reuses the pid if start
+    (its start time when the lock was taken) is given and differs.
+    """
+    try:
+        info = _process_start(pid)
+    except ProcessLookupError:
+        return False
+    if info is not None:
+        state, started = info
+        return state not in ('Z', 'X') and (start is None or started == start)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WorkQueue:
+    """
+    Lock-file work queue in a directory shared by all workers.
+
+    Parameters:
+        queue_dir (str): Shared directory of the lock and .done files.
+        stale_after (float): Take over locks older than this many seconds,
+            whichever host holds them. Must be longer than the slowest task.
+            Default is None: only locks of dead processes on this host are
+            taken over.
+    """
+
+    def __init__(self, queue_dir, stale_after=None):
+        self.queue_dir = queue_dir
+        self.stale_after = stale_after
+        os.makedirs(queue_dir, exist_ok=True)
+
+    def _path(self, task_id, suffix):
+        return os.path.join(self.queue_dir, re.sub(r'[^\w.-]+', '_', str(task_id)) + suffix)
+
+    def is_done(self, task_id):
+        return os.path.exists(self._path(task_id, '.done'))
+
+    def claim(self, task_id):
+        """Try to claim a task. Returns False if it is done or held by a live worker."""
+        lock = self._path(task_id, '.lock')
+        for _ in range(2):
+            if self.is_done(task_id):
+                return False
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._take_over(lock):
+                    return False
+                continue
+            info = _process_start(os.getpid())
+            with os.fdopen(fd, 'w') as fh:
+                json.dump({'host': socket.gethostname(), 'pid': os.getpid(), 'start': info and info[1],
+                           'time': time.time(), 'token': uuid.uuid4().hex}, fh)
+            return True
+        return False
+
+    def _take_over(self, lock):
+        """Remove lock if its owner is gone. Returns True if the claim can be retried."""
+        try:
+            with open(lock) as fh:
+                owner = json.load(fh)
+            age = time.time() - os.path.getmtime(lock)
+        except FileNotFoundError:
+            return True
+        except (OSError, ValueError):
+            return False  # being written by its owner
+
+        stale = owner['host'] == socket.gethostname() and not _pid_alive(owner['pid'], owner.get('start'))
+        stale = stale or (self.stale_after is not None and age > self.stale_after)
+        if not stale:
+            return False
+
+        # Move the lock aside atomically; if another worker replaced it with a
+        # fresh lock in the meantime, put that one back
+        tomb = f"{lock}.{os.getpid()}.{uuid.uuid4().hex}.stale"
+        try:
+            os.rename(lock, tomb)
+        except FileNotFoundError:
+            return True
+        try:
+            with open(tomb) as fh:
+                moved = json.load(fh)
+        except (OSError, ValueError):
+            moved = None
+        if moved != owner:
+            try:
+                os.link(tomb, lock)
+            except FileExistsError:
+                pass
+            os.remove(tomb)
+            return False
+        os.remove(tomb)
+        print(f"Took over the stale lock of {owner['host']}:{owner['pid']} on {os.path.basename(lock)}")
+        return True
+
+    def complete(self, task_id):
+        """Mark a claimed task as done."""
+        os.replace(self._path(task_id, '.lock'), self._path(task_id, '.done'))
+
+    def release(self, task_id):
+        """Give up a claimed task (e.g. after a failure) so that it can be retried."""
+        try:
+            os.remove(self._path(task_id, '.lock'))
+        except FileNotFoundError:
+            pass
+
+    def status(self):
+        """Dict with the number of done and locked tasks."""
+        names = os.listdir(self.queue_dir)
+        return {'done': sum(n.endswith('.done') for n in names), 'locked': sum(n.endswith('.lock') for n in names)}
+
+
+def claim_and_run(queue, task_id, fn):
+    """
+    Run fn() as task task_id of queue (directly if queue is None).
+
+    The task is marked done if fn returns and released if it raises.
+
+    Returns:
+        tuple: (claimed, result); (False, None) if another worker has it.
+    """
+    if queue is None:
+        return True, fn()
+    if not queue.claim(task_id):
+        return False, None
+    try:
+        result = fn()
+    except BaseException:
+        queue.release(task_id)
+        raise
+    queue.complete(task_id)
+    return True, result
+
+
+def add_shard_arguments(parser, item='file'):
+    """Add the sharding and work queue options (shared by the pipeline CLIs) to an argparse parser."""
+    parser.add_argument("--shard", type=str, default=None, help="Process only shard i/N of the targets (stable hash of the 5-character prefix).")
+    parser.add_argument("--queue_dir", type=str, default=None, help=f"Shared directory of lock files through which several runs claim the {item}s.")
+    parser.add_argument("--stale_after", type=float, default=None, help="With --queue_dir, take over locks older than this many seconds. Default is only locks of dead local processes.")
+
+
+def queue_from_args(args):
+    """WorkQueue (or None) from the options of add_shard_arguments."""
+    return WorkQueue(args.queue_dir, stale_after=args.stale_after) if args.queue_dir else None
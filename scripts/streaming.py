@@ -0,0 +1,292 @@
+import os
+import tempfile
+import numpy as np
+
+from lc_io import atomic_write, binary_path, is_binary, iter_text, load_binary, save_binary
+from running_median import running_median
+from STEP1_process_lightcurves import _processed_metadata, fill_gaps, processed_name
+
+# Memory-bounded version of STEP1's clean_lightcurve for very long lightcurves.
+#
+# The series lives in memory-mapped scratch files next to the output and is
+# processed in passes over blocks of rows:
+#   1) parse the input block by block, dropping NaN rows
+#   2) median time step (exact, see chunked_median)
+#   3) fill gaps block by block with that global step
+#   4) median/std of the filled flux, then sigma clip, compacting in place
+#   5) two running-median normalizations over overlapping time chunks,
+#      written back in place
+#   6) write the output block by block
+# Anonymous memory is bounded by the block size and by the rows within one
+# normalization chunk plus its +/- filter_window halo, not by the series
+# length. The result matches clean_lightcurve up to the rounding of the
+# chunked std (float32 storage additionally rounds the stored flux).
+
+CHUNK_ROWS = 1 << 20
+_HIST_BINS = 1 << 16
+
+
+def _select(chunks, k, lo, hi):
+    """k-th smallest (0-based) of the values in the blocks; all values lie in [lo, hi]."""
+    below = 0          # values < lo
+    inclusive = True   # whether hi itself belongs to the current interval
+    while True:
+        if lo == hi:
+            return lo
+
+        edges = np.linspace(lo, hi, _HIST_BINS + 1)
+        edges[-1] = hi
+        counts = np.zeros(_HIST_BINS, dtype=np.int64)
+        n_below = below
+        for c in chunks():
+            below_lo = c < lo
+            in_range = ~below_lo & ((c <= hi) if inclusive else (c < hi))
+            idx = np.searchsorted(edges, c[in_range], side='right') - 1
+            counts += np.bincount(np.minimum(idx, _HIST_BINS - 1), minlength=_HIST_BINS)
+        cum = np.cumsum(counts)
+        b = int(np.searchsorted(cum, k - n_below, side='right'))
+        below = n_below + (int(cum[b - 1]) if b else 0)
+        new_lo, new_hi = edges[b], edges[b + 1]
+        new_inclusive = inclusive and b == _HIST_BINS - 1
+
+        if new_lo == lo and new_hi == hi:
+            # No float between lo and hi: the interval only holds lo (and hi)
+            n_lo = sum(int(np.count_nonzero(c == lo)) for c in chunks())
+            return lo if k - below < n_lo else hi
+
+        if counts[b] <= CHUNK_ROWS:
+            candidates = []
+            for c in chunks():
+                keep = (c >= new_lo) & ((c <= new_hi) if new_inclusive else (c < new_hi))
+                candidates.append(c[keep])
+            candidates = np.concatenate(candidates)
+            return np.partition(candidates, k - below)[k - below]
+
+        lo, hi, inclusive = new_lo, new_hi, new_inclusive
+
+
+def chunked_median(chunks, n):
+    """
+    Exact median (np.median semantics) of n values given block by block.
+
+    chunks is a zero-argument callable returning an iterator over the
+    blocks. Each middle rank is located by histogramming the values in a
+    shrinking interval, one pass per refinement, until at most CHUNK_ROWS
+    candidates are left to select from directly.
+    """
+    if n == 0:
+        return np.nan
+    lo = min(np.min(c) for c in chunks() if len(c))
+    hi = max(np.max(c) for c in chunks() if len(c))
+    k = (n - 1) // 2
+    low = _select(chunks, k, lo, hi)
+    high = low if n % 2 else _select(chunks, n // 2, lo, hi)
+    return (low + high) / 2 if n % 2 == 0 else low
+
+
+def _blocks(n, size=None):
+    """(start, stop) ranges covering n rows in blocks of size rows."""
+    size = size or CHUNK_ROWS
+    return [(i, min(i + size, n)) for i in range(0, n, size)]
+
+
+def _append(path, values, dtype):
+    with open(path, 'ab') as fh:
+        np.asarray(values, dtype=dtype).tofile(fh)
+
+
+def _map(path, dtype, n):
+    """Read-write memory map of the first n values of a scratch column."""
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r+', shape=(n,))
+
+
+def _read_raw_blocks(file_path, chunk_rows):
+    """Yield (time, flux) blocks of a raw lightcurve (text: flux in the third column, or .lcb)."""
+    if is_binary(file_path):
+        time, flux, _ = load_binary(file_path)
+        for i0, i1 in _blocks(len(time), chunk_rows):
+            yield np.asarray(time[i0:i1]), np.asarray(flux[i0:i1])
+    else:
+        yield from iter_text(file_path, time_col=0, flux_col=2, chunk_rows=chunk_rows)
+
+
+def _chunk_bounds(time, n, width, chunk_days):
+    """
+    Output chunks of chunk_days and their +/- width halos:
+    [(i0, i1, j0, j1)] where rows [i0, i1) are computed from rows [j0, j1).
+    The halo is padded slightly; extra rows don't change the running median.
+    """
+    pad = width * (1 + 1e-9) + 1e-9
+    time = time[:n]
+    bounds = []
+    i0 = 0
+    while i0 < n:
+        i1 = max(i0 + 1, int(np.searchsorted(time, time[i0] + chunk_days, side='left')))
+        j0 = int(np.searchsorted(time, time[i0] - pad, side='left'))
+        j1 = int(np.searchsorted(time, time[i1 - 1] + pad, side='right'))
+        bounds.append((i0, i1, j0, j1))
+        i0 = i1
+    return bounds
+
+
+def normalize_in_place(time, flux, n, width, chunk_days):
+    """
+    flux[:n] /= running_median(time[:n], flux[:n], width), computed chunk by
+    chunk and written back in place. The original values of the part of the
+    next chunk's halo that is already overwritten are carried over.
+    """
+    bounds = _chunk_bounds(time, n, width, chunk_days)
+    carry_start, carry = 0, np.empty(0)
+    for c, (i0, i1, j0, j1) in enumerate(bounds):
+        head = carry[j0 - carry_start:i0 - carry_start] if j0 < i0 else np.empty(0)
+        f_orig = np.concatenate([head, np.asarray(flux[i0:j1], dtype=np.float64)])
+        t = np.asarray(time[j0:j1], dtype=np.float64)
+        medians = running_median(t, f_orig, width)
+        result = f_orig[i0 - j0:i1 - j0] / medians[i0 - j0:i1 - j0]
+
+        if c + 1 < len(bounds):
+            next_j0 = bounds[c + 1][2]
+            carry_start = min(next_j0, i1)
+            carry = f_orig[carry_start - j0:i1 - j0].copy()
+        flux[i0:i1] = result
+
+
+def _std(flux, n, chunk_rows):
+    """Sample standard deviation (ddof=1) of flux[:n], two passes over blocks."""
+    if n < 2:
+        return np.nan
+    blocks = _blocks(n, chunk_rows)
+    mean = sum(np.sum(flux[i0:i1], dtype=np.float64) for i0, i1 in blocks) / n
+    ss = sum(np.sum((np.asarray(flux[i0:i1], dtype=np.float64) - mean) ** 2) for i0, i1 in blocks)
+    return np.sqrt(ss / (n - 1))
+
+
+def stream_clean_lightcurve(file_path, scratch_dir, gap_threshold=1.5 / 24, sigma_clip=4, filter_window=10,
+                            chunk_days=None, flux_dtype='float64', chunk_rows=None, metrics=None):
+    """
+    Memory-bounded equivalent of load_raw_lightcurve + clean_lightcurve.
+
+    Parameters:
+        file_path (str): Raw lightcurve (text or .lcb).
+        scratch_dir (str): Directory for the memory-mapped scratch columns.
+        gap_threshold, sigma_clip, filter_window: As in clean_lightcurve.
+        chunk_days (float): Time span of the normalization chunks. Default is
+            4 * filter_window, i.e. each chunk is read with a halo half as
+            long as itself on either side.
+        flux_dtype (str): 'float64' or 'float32' storage of the scratch flux.
+        chunk_rows (int): Rows per block in the parse/fill/clip passes.
+        metrics (Metrics): Optional instrumentation.
+
+    Returns:
+        tuple: (time, flux, n_filled) with time and flux memory-mapped from
+        scratch_dir (valid until the directory is removed).
+    """
+    from instrumentation import record, track_phase
+
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    chunk_days = chunk_days or 4 * filter_window
+    t_path, f_path = os.path.join(scratch_dir, 'valid_t'), os.path.join(scratch_dir, 'valid_f')
+    g_t_path, g_f_path = os.path.join(scratch_dir, 'clean_t'), os.path.join(scratch_dir, 'clean_f')
+
+    # 1) Parse, dropping rows with NaNs in time or flux
+    n_in = n_valid = 0
+    with track_phase(metrics, 'load'):
+        open(t_path, 'wb').close()
+        open(f_path, 'wb').close()
+        for time, flux in _read_raw_blocks(file_path, chunk_rows):
+            valid = ~(np.isnan(time) | np.isnan(flux))
+            _append(t_path, time[valid], np.float64)
+            _append(f_path, flux[valid], flux_dtype)
+            n_in += len(time)
+            n_valid += int(valid.sum())
+    time, flux = _map(t_path, np.float64, n_valid), _map(f_path, flux_dtype, n_valid)
+
+    # 2-3) Fill small gaps with the global median time step
+    n_filled = 0
+    with track_phase(metrics, 'fill_gaps'):
+        open(g_t_path, 'wb').close()
+        open(g_f_path, 'wb').close()
+        blocks = _blocks(n_valid, chunk_rows)
+        step = chunked_median(lambda: (np.diff(time[max(i0 - 1, 0):i1]) for i0, i1 in blocks), max(n_valid - 1, 0))
+        for i0, i1 in blocks:
+            start = max(i0 - 1, 0)
+            if n_valid < 2:
+                t, f, filled = np.asarray(time[start:i1]), np.asarray(flux[start:i1], dtype=np.float64), 0
+            else:
+                t, f, filled = fill_gaps(time[start:i1], flux[start:i1], gap_threshold, time_step=step)
+            if start < i0:
+                # The previous block's last sample is already written
+                t, f = t[1:], f[1:]
+            _append(g_t_path, t, np.float64)
+            _append(g_f_path, f, flux_dtype)
+            n_filled += filled
+    del time, flux
+    n = n_valid + n_filled
+    time, flux = _map(g_t_path, np.float64, n), _map(g_f_path, flux_dtype, n)
+
+    # 4) Sigma clipping, compacting the kept rows in place
+    with track_phase(metrics, 'sigma_clip'):
+        n_kept = 0
+        if n > 0:
+            blocks = _blocks(n, chunk_rows)
+            flux_median = chunked_median(lambda: (np.asarray(flux[i0:i1], dtype=np.float64) for i0, i1 in blocks), n)
+            flux_std = _std(flux, n, chunk_rows)
+            lower, upper = flux_median - sigma_clip * flux_std, flux_median + sigma_clip * flux_std
+            for i0, i1 in blocks:
+                t = np.array(time[i0:i1])
+                f = np.array(flux[i0:i1], dtype=np.float64)
+                keep = (f >= lower) & (f <= upper)
+                k = int(keep.sum())
+                time[n_kept:n_kept + k] = t[keep]
+                flux[n_kept:n_kept + k] = f[keep]
+                n_kept += k
+
+    # 5) Double running-median normalization, in place
+    with track_phase(metrics, 'normalize'):
+        if n_kept:
+            normalize_in_place(time, flux, n_kept, filter_window, chunk_days)
+            normalize_in_place(time, flux, n_kept, filter_window, chunk_days)
+
+    record(metrics, rows_in=n_in, rows_nan=n_in - n_valid, n_filled=n_filled, n_clipped=n - n_kept, rows_out=n_kept)
+    return time[:n_kept], flux[:n_kept], n_filled
+
+
+def stream_process_lightcurve(file_path, output_dir, gap_threshold=1.5 / 24, sigma_clip=4, filter_window=10,
+                              output_format='csv', chunk_days=None, flux_dtype='float64', chunk_rows=None,
+                              metrics=None):
+    """
+    Streaming counterpart of STEP1's process_lightcurve: clean the raw file
+    with stream_clean_lightcurve (scratch files in output_dir) and write the
+    processed lightcurve block by block. Returns the output path.
+    """
+    import pandas as pd
+    from instrumentation import track_phase
+
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    original_name = os.path.basename(file_path)
+    output_path = os.path.join(output_dir, processed_name(original_name))
+
+    with tempfile.TemporaryDirectory(dir=output_dir, prefix='.stream_') as scratch_dir:
+        time, flux, n_filled = stream_clean_lightcurve(
+            file_path, scratch_dir, gap_threshold, sigma_clip, filter_window,
+            chunk_days=chunk_days, flux_dtype=flux_dtype, chunk_rows=chunk_rows, metrics=metrics,
+        )
+
+        with track_phase(metrics, 'write'):
+            if output_format == 'binary':
+                params = {'gap_threshold': gap_threshold, 'sigma_clip': sigma_clip, 'filter_window': filter_window}
+                output_path = save_binary(binary_path(output_path), time, flux,
+                                          metadata=_processed_metadata(file_path, params, n_filled))
+            else:
+                # Same text as save_processed: header "0,1", pandas float formatting
+                with atomic_write(output_path) as tmp_path, open(tmp_path, 'w') as fh:
+                    if len(time) == 0:
+                        pd.DataFrame(np.empty((0, 2))).to_csv(fh, index=False)
+                    for i0, i1 in _blocks(len(time), chunk_rows):
+                        pd.DataFrame({0: np.asarray(time[i0:i1]), 1: np.asarray(flux[i0:i1])}).to_csv(
+                            fh, header=i0 == 0, index=False)
+        del time, flux
+
+    return output_path
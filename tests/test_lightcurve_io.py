@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from lc_io import BINARY_EXTENSION, is_binary
+from lightcurve import LightCurve, LightCurveMeta
+from STEP1_process_lightcurves import processed_name, save_processed
+from STEP2_group_and_concatenate_and_fix_gaps import read_processed_lightcurve, save_concatenated
+from STEP3_save_psd import read_lightcurve
+
+RAW_NAME = "00042_target_T00042_LK_targetname_LK_exptime_120_LK_mission_TESS_Sector_1_LK_author_SPOC.txt"
+CONCATENATED_NAME = "00042_LK_exptime_120_LK_mission_Sectors_1_2_NOT_SHIFTED_CONCATENATED.txt"
+
+# Concatenated CSV files hold 10 decimals; everything else round-trips exactly
+CSV_DECIMALS_ATOL = 5e-11
+
+
+def sample_lightcurve(n, n_nan=0, seed=0):
+    rng = np.random.default_rng(seed)
+    time = 1325.0 + np.cumsum(rng.uniform(0.001, 0.002, n))
+    flux = rng.normal(1.0, 1e-3, n)
+    flux[rng.choice(n, n_nan, replace=False)] = np.nan
+    segments = [(1, 0, n // 2), (2, n // 2, n)] if n else None
+    return LightCurve(time, flux, meta=LightCurveMeta(sectors=[1, 2]), segments=segments)
+
+
+def assert_same_rows(lc, time, flux, atol=0.0):
+    assert lc.time.dtype == np.float64
+    assert lc.flux.dtype == np.float64
+    assert len(lc) == len(time)
+    np.testing.assert_allclose(lc.time, time, rtol=0, atol=atol)
+    # assert_allclose treats NaNs in the same places as equal
+    np.testing.assert_allclose(lc.flux, flux, rtol=0, atol=atol)
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'binary'])
+@pytest.mark.parametrize('n, n_nan', [(500, 3), (1, 0), (0, 0)])
+def test_processed_round_trip(tmp_path, output_format, n, n_nan):
+    lc = sample_lightcurve(n, n_nan)
+    path = save_processed(str(tmp_path / processed_name(RAW_NAME)), lc, output_format,
+                          metadata={'source': RAW_NAME})
+    assert is_binary(path) == (output_format == 'binary')
+    assert path.endswith(BINARY_EXTENSION if output_format == 'binary' else '.txt')
+
+    read = read_processed_lightcurve(path)
+    assert_same_rows(read, lc.time, lc.flux)
+    assert read.meta.irow == '00042'
+    assert read.meta.sectors == [1]
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'binary'])
+@pytest.mark.parametrize('n, n_nan', [(500, 3), (1, 0), (0, 0)])
+def test_concatenated_round_trip(tmp_path, output_format, n, n_nan):
+    lc = sample_lightcurve(n, n_nan)
+    path = save_concatenated(str(tmp_path / CONCATENATED_NAME), lc, output_format,
+                             metadata={'gap_threshold': 80.0})
+
+    read = read_lightcurve(path)
+    assert_same_rows(read, lc.time, lc.flux, atol=0.0 if output_format == 'binary' else CSV_DECIMALS_ATOL)
+    if output_format == 'binary' and n:
+        assert read.segments == lc.segments
+    else:
+        assert read.segments is None
+    assert read.meta.sectors == [1, 2]
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'binary'])
+def test_only_valid_rows_are_saved(tmp_path, output_format):
+    lc = sample_lightcurve(100)
+    keep = np.ones(100, dtype=bool)
+    keep[10:20] = False
+    masked = lc.with_mask(keep)
+
+    processed = read_processed_lightcurve(
+        save_processed(str(tmp_path / processed_name(RAW_NAME)), masked, output_format))
+    assert_same_rows(processed, lc.time[keep], lc.flux[keep])
+
+    concatenated = read_lightcurve(save_concatenated(str(tmp_path / CONCATENATED_NAME), masked, output_format))
+    assert_same_rows(concatenated, lc.time[keep], lc.flux[keep],
+                     atol=0.0 if output_format == 'binary' else CSV_DECIMALS_ATOL)
+    if output_format == 'binary':
+        # Segment rows are renumbered past the dropped rows
+        assert concatenated.segments == ((1, 0, 40), (2, 40, 90))
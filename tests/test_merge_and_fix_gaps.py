@@ -0,0 +1,51 @@
+import numpy as np
+
+from lightcurve import LightCurve, LightCurveMeta
+from STEP2_group_and_concatenate_and_fix_gaps import merge_and_fix_gaps
+
+
+def sector(t0, n, sector_number, dt=0.1):
+    time = t0 + dt * np.arange(n)
+    return LightCurve(time, 1 + 0.01 * np.sin(time), meta=LightCurveMeta(irow='00001', sectors=[sector_number]))
+
+
+def test_large_gaps_collapse_to_median_step():
+    pieces = [sector(0.0, 30, 1), sector(200.0, 30, 2), sector(500.0, 30, 3)]
+    lc = merge_and_fix_gaps(pieces, gap_threshold=80.0)
+
+    median_dt = 0.1
+    gaps = [200.0 - 2.9, 500.0 - 202.9]
+    assert len(lc) == 90
+    assert np.all(np.diff(lc.time) > 0)
+    np.testing.assert_allclose(np.diff(lc.time), median_dt, rtol=0, atol=1e-9)
+
+    # Each piece moves forward by the excess of the gaps after it; the last one stays
+    np.testing.assert_allclose(lc.meta.shifts, [gaps[0] + gaps[1] - 2 * median_dt, gaps[1] - median_dt, 0.0],
+                               rtol=0, atol=1e-9)
+    np.testing.assert_array_equal(lc.time[60:], pieces[2].time)
+    for piece, shift, start in zip(pieces, lc.meta.shifts, (0, 30, 60)):
+        np.testing.assert_allclose(lc.time[start:start + 30], piece.time + shift, rtol=0, atol=1e-9)
+        np.testing.assert_array_equal(lc.flux[start:start + 30], piece.flux)
+    assert lc.segments == ((1, 0, 30), (2, 30, 60), (3, 60, 90))
+    assert lc.meta.sectors == [1, 2, 3]
+
+
+def test_small_gaps_are_kept():
+    pieces = [sector(0.0, 30, 1), sector(50.0, 30, 2)]
+    lc = merge_and_fix_gaps(pieces, gap_threshold=80.0)
+    np.testing.assert_array_equal(lc.time, np.concatenate([p.time for p in pieces]))
+    assert lc.meta.shifts == []
+
+
+def test_overlapping_segments_are_merged():
+    first = sector(0.0, 30, 1)
+    second = sector(1.05, 30, 2)  # overlaps the end of the first one
+    lc = merge_and_fix_gaps([second, first], gap_threshold=80.0)
+
+    expected = np.sort(np.concatenate([first.time, second.time]), kind='stable')
+    np.testing.assert_array_equal(lc.time, expected)
+    order = np.argsort(np.concatenate([first.time, second.time]), kind='stable')
+    np.testing.assert_array_equal(lc.flux, np.concatenate([first.flux, second.flux])[order])
+    assert lc.meta.shifts == []
+    assert lc.segments is None
+    assert lc.meta.sectors == [1, 2]
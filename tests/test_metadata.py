@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+
+from lc_io import load_binary
+from run_pipeline import process_group
+from STEP1_process_lightcurves import process_lightcurve, processed_path
+from STEP2_group_and_concatenate_and_fix_gaps import concatenate_group
+from streaming import stream_process_lightcurve
+
+NAMES = ["00042_target_T00042_LK_targetname_LK_exptime_1800_LK_mission_TESS_Sector_1_LK_author_SPOC.txt",
+         "00042_target_T00042_LK_targetname_LK_exptime_1800_LK_mission_TESS_Sector_5_LK_author_SPOC.txt"]
+KEY = ('00042', '1800', 'TESS')
+PARAMS = {'gap_threshold': 1.5 / 24, 'sigma_clip': 4, 'filter_window': 10}
+
+
+def write_raw(directory):
+    rng = np.random.default_rng(2)
+    paths = []
+    for i, name in enumerate(NAMES):
+        # Gaps short enough to be filled, so that n_filled is not 0
+        time = 1325 + 120 * i + np.arange(0, 25, 1800 / 86400)
+        time = np.delete(time, [100, 300])
+        flux = 1000 + rng.standard_normal(len(time))
+        np.savetxt(os.path.join(directory, name), np.column_stack([time, np.ones_like(time), flux]))
+        paths.append(os.path.join(directory, name))
+    return paths
+
+
+def metadata(path):
+    return load_binary(path)[2]
+
+
+def test_fused_and_streaming_metadata_match_the_steps(tmp_path):
+    dirs = {name: str(tmp_path / name) for name in ('raw', 'p', 'c', 'stream', 'fused_p', 'fused_c', 'psd')}
+    for d in dirs.values():
+        os.makedirs(d)
+    paths = write_raw(dirs['raw'])
+
+    processed = [process_lightcurve(fp, dirs['p'], output_format='binary', **PARAMS) for fp in paths]
+    streamed = [stream_process_lightcurve(fp, dirs['stream'], output_format='binary', **PARAMS) for fp in paths]
+    concatenated = concatenate_group(KEY, processed, dirs['c'], gap_threshold=80.0, output_format='binary')
+    process_group(KEY, paths, dirs['psd'], processed_dir=dirs['fused_p'], concatenated_dir=dirs['fused_c'],
+                  output_format='binary', concat_gap_threshold=80.0, **PARAMS)
+
+    for fp, step_path, stream_path in zip(paths, processed, streamed):
+        expected = metadata(step_path)
+        assert expected['n_filled'] > 0
+        assert metadata(stream_path) == expected
+        assert metadata(processed_path(fp, dirs['fused_p'], 'binary')) == expected
+
+    fused = os.path.join(dirs['fused_c'], os.path.basename(concatenated))
+    assert metadata(fused) == metadata(concatenated)
+    assert metadata(concatenated)['sectors'] == [1, 5]
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+
+from result_cache import ResultCache
+from run_pipeline import process_group
+from STEP1_process_lightcurves import (
+    parameter_grid, process_lightcurve, process_lightcurves_pipelined, process_lightcurves_ragged, sweep_lightcurve,
+)
+
+NAMES = ["00042_target_T00042_LK_targetname_LK_exptime_1800_LK_mission_TESS_Sector_1_LK_author_SPOC.txt",
+         "00042_target_T00042_LK_targetname_LK_exptime_1800_LK_mission_TESS_Sector_2_LK_author_SPOC.txt"]
+PARAMS = {'gap_threshold': 1.5 / 24, 'sigma_clip': 4, 'filter_window': 10}
+
+
+@pytest.fixture
+def raw_files(tmp_path):
+    rng = np.random.default_rng(1)
+    paths = []
+    for i, name in enumerate(NAMES):
+        time = 1325 + 30 * i + np.arange(0, 25, 1800 / 86400)
+        flux = 1000 + rng.standard_normal(len(time))
+        np.savetxt(tmp_path / name, np.column_stack([time, np.ones_like(time), flux]))
+        paths.append(str(tmp_path / name))
+    return paths
+
+
+def run_entry_point(name, paths, out_dir, cache):
+    os.makedirs(out_dir)
+    if name == 'process_lightcurve':
+        for fp in paths:
+            process_lightcurve(fp, out_dir, cache=cache, **PARAMS)
+    elif name == 'sweep':
+        grid = parameter_grid([PARAMS['gap_threshold']], [PARAMS['sigma_clip']], [PARAMS['filter_window']])
+        for fp in paths:
+            sweep_lightcurve(fp, out_dir, grid, cache=cache)
+    elif name == 'pipelined':
+        list(process_lightcurves_pipelined(paths, out_dir, cache=cache, **PARAMS))
+    elif name == 'ragged':
+        list(process_lightcurves_ragged(paths, out_dir, cache=cache, **PARAMS))
+    else:
+        process_group(('00042', '1800', 'TESS'), paths, out_dir, cache=cache, **PARAMS)
+
+
+ENTRY_POINTS = ['process_lightcurve', 'sweep', 'pipelined', 'ragged', 'run_pipeline']
+
+
+@pytest.mark.parametrize('second', ENTRY_POINTS)
+@pytest.mark.parametrize('first', ENTRY_POINTS)
+def test_entry_points_share_cache_entries(tmp_path, raw_files, first, second):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    run_entry_point(first, raw_files, str(tmp_path / 'first'), cache)
+    n_entries = cache.stats()['entries']
+
+    run_entry_point(second, raw_files, str(tmp_path / 'second'), cache)
+    stats = cache.stats()
+    # Every STEP1 lookup of the second run is a hit on the first run's entries
+    assert stats['hits'] >= len(raw_files)
+    if first != 'run_pipeline' and second != 'run_pipeline':
+        assert stats['entries'] == n_entries == len(raw_files)
+        assert stats['hits'] == len(raw_files)
@@ -0,0 +1,46 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import STEP3_save_psd
+from config import load_config
+from lightcurve import LightCurve
+from STEP2_group_and_concatenate_and_fix_gaps import save_concatenated
+
+NAMES = ["00043_LK_exptime_1800_LK_mission_Sectors_5_6_NOT_SHIFTED_CONCATENATED.txt",
+         "00044_LK_exptime_1800_LK_mission_Campaigns_3_NOT_SHIFTED_CONCATENATED.txt"]
+
+
+@pytest.fixture
+def config(tmp_path):
+    with open(tmp_path / 'lightcurveprocessor.json', 'w') as fh:
+        json.dump({'data_dir': 'data'}, fh)
+    config = load_config(str(tmp_path / 'lightcurveprocessor.json'))
+    os.makedirs(config['concatenated_dir'])
+    rng = np.random.default_rng(0)
+    time = np.arange(0, 20, 1800 / 86400)
+    for name in NAMES:
+        save_concatenated(os.path.join(config['concatenated_dir'], name),
+                          LightCurve(time, 1 + 1e-3 * rng.standard_normal(len(time))))
+    with open(config['describe_csv'], 'w') as fh:
+        fh.write("file_name,cadence,RGB\n" + "".join(f"{name},1800.0,\n" for name in NAMES))
+    return config
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_failing_star_does_not_stop_the_run(config, monkeypatch, capsys, batch):
+    read_lightcurve = STEP3_save_psd.read_lightcurve
+
+    def read_or_fail(path):
+        if os.path.basename(path) == NAMES[0]:
+            raise RuntimeError("corrupt file")
+        return read_lightcurve(path)
+
+    monkeypatch.setattr(STEP3_save_psd, 'read_lightcurve', read_or_fail)
+    STEP3_save_psd.main(batch=batch, executor='serial', config=config)
+
+    assert sorted(os.listdir(config['psd_dir'])) == [STEP3_save_psd.psd_file_name(NAMES[1])]
+    out = capsys.readouterr().out
+    assert f"1 of 2 files failed:\n  {NAMES[0]}: RuntimeError: corrupt file" in out
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from ragged import pack, unpack
+from running_median import running_median, running_median_bruteforce, running_median_ragged
+
+
+def random_series(rng, n, sorted_time=True, n_nan=0, ties=False):
+    t = np.sort(rng.uniform(0, 30, n)) if sorted_time else rng.uniform(0, 30, n)
+    f = rng.normal(1, 0.01, n)
+    if ties:
+        f = np.round(f, 2)
+        t = np.round(t, 1)
+    if n_nan:
+        f[rng.choice(n, n_nan, replace=False)] = np.nan
+    return t, f
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('sorted_time', [True, False])
+@pytest.mark.parametrize('n_nan', [0, 5])
+@pytest.mark.parametrize('ties', [False, True])
+@pytest.mark.parametrize('width', [0, 0.5, 3, 100])
+def test_running_median_matches_bruteforce(seed, sorted_time, n_nan, ties, width):
+    rng = np.random.default_rng(seed)
+    t, f = random_series(rng, 200, sorted_time, n_nan, ties)
+    np.testing.assert_array_equal(running_median(t, f, width), running_median_bruteforce(t, f, width))
+
+
+def test_running_median_all_nan_window():
+    t = np.array([0.0, 1.0, 10.0, 11.0])
+    f = np.array([np.nan, np.nan, 2.0, 4.0])
+    np.testing.assert_array_equal(running_median(t, f, 2), [np.nan, np.nan, 3.0, 3.0])
+
+
+def test_running_median_empty():
+    assert running_median(np.empty(0), np.empty(0), 1).shape == (0,)
+    assert running_median_ragged(np.empty(0), np.empty(0), [0], 1).shape == (0,)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('width', [0, 0.5, 3, 100])
+def test_running_median_ragged_matches_per_lightcurve(seed, width):
+    rng = np.random.default_rng(seed)
+    times, fluxes = [], []
+    for i in range(12):
+        # Includes empty and one-point lightcurves, also at the start of the batch
+        n = [0, 1, 0][i] if i < 3 else int(rng.integers(2, 150))
+        t, f = random_series(rng, n, sorted_time=i % 2 == 0, n_nan=min(n // 10, 3), ties=i % 3 == 0)
+        times.append(t)
+        fluxes.append(f)
+    t, offsets = pack(times)
+    f, _ = pack(fluxes)
+
+    medians = unpack(running_median_ragged(t, f, offsets, width), offsets)
+    for m, ti, fi in zip(medians, times, fluxes):
+        np.testing.assert_array_equal(m, running_median(ti, fi, width))
+
+
+def test_running_median_ragged_leading_empty_segment():
+    t = np.array([0, 1, 2, 3, 5, 4.0])
+    np.testing.assert_array_equal(running_median_ragged(t, t, [0, 0, 6], 1), running_median(t, t, 1))
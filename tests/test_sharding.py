@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from sharding import WorkQueue, _pid_alive, _process_start
+
+needs_proc = pytest.mark.skipif(not os.path.isdir('/proc/self'), reason="needs /proc")
+
+
+def zombie():
+    """A child process that has exited but not been reaped yet."""
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    for _ in range(500):
+        if _process_start(child.pid)[0] == 'Z':
+            return child
+        time.sleep(0.01)
+    raise RuntimeError("child did not exit")
+
+
+def test_live_process_is_alive():
+    assert _pid_alive(os.getpid())
+
+
+@needs_proc
+def test_zombie_and_reused_pid_are_dead():
+    child = zombie()
+    try:
+        assert not _pid_alive(child.pid)
+    finally:
+        child.wait()
+    assert not _pid_alive(child.pid)
+    # Same pid, different start time: the lock owner is gone and the pid reused
+    assert not _pid_alive(os.getpid(), _process_start(os.getpid())[1] + 1)
+
+
+@needs_proc
+def test_lock_of_zombie_owner_is_taken_over(tmp_path):
+    queue = WorkQueue(str(tmp_path))
+    assert queue.claim('task')
+    with open(tmp_path / 'task.lock') as fh:
+        owner = json.load(fh)
+    assert not queue.claim('task')  # held by this live process
+
+    child = zombie()
+    try:
+        owner.update(pid=child.pid, start=None)
+        with open(tmp_path / 'task.lock', 'w') as fh:
+            json.dump(owner, fh)
+        assert queue.claim('task')
+    finally:
+        child.wait()
+    queue.complete('task')
+    assert not queue.claim('task')